@@ -5,46 +5,114 @@ document.addEventListener('DOMContentLoaded', function () {
     const dateField = document.getElementById('id_date'); // Поле выбора даты
     const timeField = document.getElementById('id_time'); // Поле выбора времени
 
-    // Функция для обновления доступных слотов
+    // Скрипт подключён на всех страницах: без формы записи ничего не делаем
+    if (!timeField) {
+        return;
+    }
+
+    const visitId = timeField.dataset.visitId; // id переносимого визита (только в форме редактирования)
+
+    let availableWeek = {}; // Свободное время на всё окно записи: {дата: [минуты от начала суток]}
+
+    // Перевод минут от начала суток в строку формата HH:MM
+    function minutesToTime(minutes) {
+        const hours = String(Math.floor(minutes / 60)).padStart(2, '0');
+        return `${hours}:${String(minutes % 60).padStart(2, '0')}`;
+    }
+
+    // Функция для отображения слотов выбранной даты (без запроса к серверу)
     function updateTimeSlots() {
+        const slots = availableWeek[dateField.value] || []; // Слоты выбранной даты
+
+        timeField.innerHTML = '';  // Очистка старых значений
+
+        // Добавляем новые слоты в цикле for
+        slots.forEach(minutes => {
+            const slot = minutesToTime(minutes);
+            const option = document.createElement('option'); // Создаем тег опцию в html
+            option.value = slot; // Значение опции (время)
+            option.textContent = slot; // Текст опции (время)
+            timeField.appendChild(option); // Добавляем опцию в поле
+        });
+
+        // После получения слотов, снова поместим выбранное значение для отправки в базу данных
+        const selectedTime = timeField.getAttribute('data-selected-time');
+
+        // Если есть выбранное значение, то выберем его
+        if (selectedTime) {
+            const option = Array.from(timeField.options).find(opt => opt.value === selectedTime); // Создаем массив из элемента, выбранного значения пользователем времени
+
+            // Если опция нашлась
+            if (option) {
+                option.selected = true; // Выбираем опцию
+            }
+        }
+
+        // Время, выбранное автоматически (первый слот или время визита), тоже удерживается за клиентом
+        holdSelectedTime();
+    }
+
+    // Функция для загрузки свободного времени на всю неделю одним запросом
+    function updateAvailableWeek() {
         const employee = employeeField.value; // Значение выбраного сотрудника
-        const service = serviceField.value; // Значение выбранной услуги
-        const date = dateField.value; // Значение выбраной даты
+        const service = serviceField.value; // Значение выбранной услуги
 
         // Проверяем, все ли поля заполнены
-        if (employee && service && date) {
+        if (employee && service) {
+            const params = new URLSearchParams({employee: employee, service: service});
+
+            // При переносе визита его собственное время остаётся свободным
+            if (visitId) {
+                params.append('visit', visitId);
+            }
+
             // Отправляем запрос на получение доступных слотов
-            fetch(`/get_available_time/?employee=${employee}&service=${service}&date=${date}`)
+            fetch(`/get_available_week/?${params}`)
                 .then(response => response.json())
                 .then(data => {
-                    timeField.innerHTML = '';  // Очистка старых значений
-
-                    // Добавляем новые слоты в цикле for
-                    data.available_time.forEach(slot => {
-                        const option = document.createElement('option'); // Создаем тег опцию в html
-                        option.value = slot; // Значение опции (время)
-                        option.textContent = slot; // Текст опции (время)
-                        timeField.appendChild(option); // Добавляем опцию в поле
-                    });
-
-                    // После получения слотов, снова поместим выбранное значение для отправки в базу данных
-                    const selectedTime = timeField.getAttribute('data-selected-time');
-
-                    // Если есть выбранное значение, то выберем его
-                    if (selectedTime) {
-                        const option = Array.from(timeField.options).find(opt => opt.value === selectedTime); // Создаем массив из элемента, выбранного значения пользователем времени
-
-                        // Если опция нашлась
-                        if (option) {
-                            option.selected = true; // Выбираем опцию
-                        }
-                    }
+                    availableWeek = data.available_week;
+                    updateTimeSlots();
                 });
         }
     }
 
-    // Слушаем изменения полей
-    employeeField.addEventListener('change', updateTimeSlots);
-    serviceField.addEventListener('change', updateTimeSlots);
+    // Функция для удержания выбранного времени, пока клиент заполняет форму
+    function holdSelectedTime() {
+        // На выбранную дату нет свободного времени - удерживать нечего
+        if (!timeField.value) {
+            return;
+        }
+
+        const csrfToken = timeField.form.querySelector('[name=csrfmiddlewaretoken]').value; // Токен формы
+        const body = new URLSearchParams({
+            employee: employeeField.value,
+            service: serviceField.value,
+            date: dateField.value,
+            time: timeField.value,
+        });
+
+        if (visitId) {
+            body.append('visit', visitId);
+        }
+
+        fetch('/hold_slot/', {method: 'POST', headers: {'X-CSRFToken': csrfToken}, body: body})
+            .then(response => response.json())
+            .then(data => {
+                // Время уже занято другим клиентом: сообщаем и обновляем свободное время
+                if (!data.held && data.error) {
+                    alert(data.error);
+                    updateAvailableWeek();
+                }
+            });
+    }
+
+    // Слушаем изменения полей: смена сотрудника или услуги загружает неделю, смена даты - только переключает слоты
+    // (и удерживает выбранный слот), выбор времени удерживает его за клиентом
+    employeeField.addEventListener('change', updateAvailableWeek);
+    serviceField.addEventListener('change', updateAvailableWeek);
     dateField.addEventListener('change', updateTimeSlots);
+    timeField.addEventListener('change', holdSelectedTime);
+
+    // Форма уже заполнена (редактирование визита или повторный показ с ошибкой): сразу загружаем свободное время
+    updateAvailableWeek();
 });
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Client, Employee, Hall, Service, Visit, ServiceHall
+from .models import Client, Employee, Hall, Service, Visit, ServiceHall, DailyRollup
 
 
 # Register your models here.
@@ -9,6 +9,8 @@ class ClientAdmin(admin.ModelAdmin):
     # Указываем поля, которые будут отображаться в списке
     list_display = ('user', 'phone_number', 'date_of_birth', 'gender')
 
+    list_select_related = ('user',)
+
     # Поиск по имени пользователя и email через связь с моделью User
     search_fields = ('user__username', 'user__email')
 
@@ -21,6 +23,8 @@ class EmployeeAdmin(admin.ModelAdmin):
     # Указываем поля, которые будут отображаться в списке
     list_display = ('user', 'phone_number', 'position')
 
+    list_select_related = ('user',)
+
     # Поиск по имени пользователя и email через связь с моделью User
     search_fields = ('user__username', 'user__email')
 
@@ -31,7 +35,7 @@ class EmployeeAdmin(admin.ModelAdmin):
 # Регистрация модели Hall в админке
 class HallAdmin(admin.ModelAdmin):
     # Указываем поля, которые будут отображаться в списке
-    list_display = ('name', 'location', 'capacity', 'start_time', 'end_time')
+    list_display = ('name', 'location', 'capacity', 'start_time', 'end_time', 'slot_step')
 
     # Поиск по названию зала и местоположению
     search_fields = ('name', 'location')
@@ -63,11 +67,31 @@ class VisitAdmin(admin.ModelAdmin):
     # Фильтрация по статусу и времени визита
     list_filter = ('status', 'date')
 
+    # Клиент, сотрудник и услуга в списке загружаются одним запросом
+    list_select_related = ('client__user', 'employee__user', 'service')
+
 
 # Регистрация модели ServiceHall в админке
 class ServiceHallAdmin(admin.ModelAdmin):
     list_display = ['service', 'hall']
 
+    list_select_related = ('service', 'hall')
+
+
+# Регистрация модели DailyRollup в админке (только просмотр: итоги ведутся сигналами и командой rebuild_rollups)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'hall', 'employee', 'service', 'visit_count', 'done_count', 'booked_minutes', 'revenue')
+
+    list_filter = ('date', 'hall')
+
+    list_select_related = ('hall', 'employee__user', 'service')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 # Регистрация моделей с соответствующими настройками админки
 admin.site.register(Client, ClientAdmin)
@@ -76,3 +100,4 @@ admin.site.register(Hall, HallAdmin)
 admin.site.register(Service, ServiceAdmin)
 admin.site.register(Visit, VisitAdmin)
 admin.site.register(ServiceHall, ServiceHallAdmin)
+admin.site.register(DailyRollup, DailyRollupAdmin)
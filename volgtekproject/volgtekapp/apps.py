@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VolgtekappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'volgtekapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401 Подключаем обработчики сигналов (инвалидация кэша свободного времени)
@@ -0,0 +1,344 @@
+import heapq
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import now as tz_now
+
+from .models import Employee, SlotHold, Visit
+from .occupancy import build_counters, free_starts, load_halls_occupancy, load_occupancy, save_counters
+from .slot_cache import get_cached_slots, set_cached_slots
+
+
+# Модуль расчёта свободного времени (движок доступности).
+#
+# Каждый визит занимает интервал [начало, конец) в минутах от начала суток с длительностью его собственной
+# услуги (Visit.start_minute, Visit.end_minute). Слот свободен, пока пиковая загрузка внутри него меньше
+# вместимости зала (Hall.capacity) и сам сотрудник в это время не занят в другом зале. Загрузка зала по минутам
+# хранится материализованной (HallDayOccupancy, см. occupancy.py), поэтому при расчёте визиты зала
+# из базы не читаются.
+#
+# Удержания слотов (SlotHold), пока клиент оформляет запись, занимают место в зале и время сотрудника
+# так же, как визиты, но не входят в материализованную загрузку: действующие удержания читаются
+# отдельным запросом. Собственное удержание клиента ему самому не мешает (exclude_client_id).
+#
+# Функция concurrency_profile - профиль загрузки заметающей прямой по интервалам визитов без
+# материализованной загрузки: проверка одного слота (is_slot_available) и поиск переполнений.
+
+BOOKING_WINDOW_DAYS = 7  # Насколько дней вперёд (кроме сегодняшнего) доступна запись
+EARLIEST_SLOTS_LIMIT = 20  # Максимум вариантов в поиске ближайшего свободного мастера
+
+
+# Перевод времени (time или строка 'HH:MM[:SS]') в минуты от начала суток
+def to_minutes(value):
+    if isinstance(value, str):
+        value = datetime.strptime(value[:5], '%H:%M').time()
+
+    return value.hour * 60 + value.minute
+
+
+# Перевод минут от начала суток в строку формата HH:MM, которую ожидает JS
+def minutes_to_str(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+# Шаг сетки начала слотов в минутах: настройка зала, затем общая SLOT_STEP_MINUTES,
+# иначе - длительность услуги (слоты идут подряд, как раньше)
+def slot_step(hall, duration):
+    return hall.slot_step or getattr(settings, 'SLOT_STEP_MINUTES', None) or duration
+
+
+# Зал, в котором сотрудник оказывает услугу (связь ServiceHall)
+def resolve_hall(employee, service):
+    return employee.hall_for(service)
+
+
+# Занятые интервалы за период одним запросом: {дата: интервалы, отсортированные по началу}.
+# Визиты отбираются по залу или по сотруднику (filters: hall=... / employee=...)
+def load_busy_intervals_range(date_from, date_to, exclude_visit_id=None, **filters):
+    visits = Visit.objects.filter(date__range=(date_from, date_to), **filters)
+
+    if exclude_visit_id:
+        visits = visits.exclude(id=exclude_visit_id)  # Редактируемый визит не занимает свой же слот
+
+    intervals = {}
+
+    for visit_date, start, end in visits.values_list('date', 'start_minute', 'end_minute'):
+        intervals.setdefault(visit_date, []).append((start, end))  # Каждый визит со своей длительностью
+
+    for day_intervals in intervals.values():
+        day_intervals.sort()
+
+    return intervals
+
+
+# Занятые интервалы зала на дату, отсортированные по началу
+def load_busy_intervals(hall, date, exclude_visit_id=None):
+    return load_busy_intervals_range(date, date, exclude_visit_id, hall=hall).get(date, [])
+
+
+# Визиты на дату, пересекающиеся с интервалом [start, end): один запрос по индексу (зал/сотрудник, дата, начало, конец)
+def overlapping_visits(date, start, end, exclude_visit_id=None, **filters):
+    visits = Visit.objects.filter(date=date, start_minute__lt=end, end_minute__gt=start, **filters)
+
+    if exclude_visit_id:
+        visits = visits.exclude(id=exclude_visit_id)
+
+    return visits
+
+
+# Действующие (не истёкшие) удержания слотов
+def active_holds(*conditions, **filters):
+    return SlotHold.objects.filter(*conditions, expires_at__gt=tz_now(), **filters)
+
+
+# Интервалы действующих удержаний за период одним запросом для залов hall_ids и сотрудников employee_ids:
+# ({(зал, дата): интервалы}, {(сотрудник, дата): интервалы}). Удержания клиента exclude_client_id не учитываются
+def load_hold_intervals(date_from, date_to, hall_ids, employee_ids, exclude_client_id=None):
+    holds = active_holds(date__range=(date_from, date_to)).filter(
+        Q(hall_id__in=hall_ids) | Q(employee_id__in=employee_ids))
+
+    if exclude_client_id:
+        holds = holds.exclude(client_id=exclude_client_id)
+
+    hall_held, employee_held = {}, {}
+
+    for hall_id, employee_id, hold_date, start, end in holds.values_list(
+            'hall_id', 'employee_id', 'date', 'start_minute', 'end_minute'):
+        if hall_id in hall_ids:
+            hall_held.setdefault((hall_id, hold_date), []).append((start, end))
+
+        if employee_id in employee_ids:
+            employee_held.setdefault((employee_id, hold_date), []).append((start, end))
+
+    return hall_held, employee_held
+
+
+# Действующие удержания на дату, пересекающиеся с интервалом [start, end) (filters: hall=... / employee=...)
+def overlapping_holds(date, start, end, exclude_client_id=None, **filters):
+    holds = active_holds(date=date, start_minute__lt=end, end_minute__gt=start, **filters)
+
+    if exclude_client_id:
+        holds = holds.exclude(client_id=exclude_client_id)
+
+    return holds
+
+
+# Профиль загрузки: заметающая прямая по событиям начала/конца визитов.
+# Возвращает отсортированные непересекающиеся отрезки (начало, конец, число визитов)
+def concurrency_profile(intervals):
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+
+    segments = []
+    count = 0  # Текущее число одновременных визитов
+    previous = None
+
+    for minute, delta in events:  # При равном времени окончание обрабатывается раньше начала
+        if count and minute > previous:
+            segments.append((previous, minute, count))
+
+        count += delta
+        previous = minute
+
+    return segments
+
+
+# Загрузка зала без редактируемого визита: его интервал вычитается из счётчиков
+def release_visit(hall, occupancy, visit_id):
+    visit = Visit.objects.filter(id=visit_id, hall=hall).values_list('date', 'start_minute', 'end_minute').first()
+
+    if visit and visit[0] in occupancy:
+        visit_date, start, end = visit
+
+        occupancy[visit_date][start:end] -= 1
+
+
+# Пересчёт материализованной загрузки зала на дату по визитам
+def rebuild_occupancy(hall_id, date):
+    save_counters(hall_id, date, build_counters(load_busy_intervals(hall_id, date)))
+
+
+# Свободное время сотрудника в зале по датам для услуги длительностью duration: {дата: [минуты от начала суток]}.
+# Готовые дни берутся из кэша, недостающие считаются по загрузке зала, визитам сотрудника и удержаниям:
+# слот свободен, если в зале есть место и сотрудник в это время не занят ни в одном зале
+def compute_slots(hall, employee, duration, dates, exclude_visit_id=None, use_cache=True, exclude_client_id=None):
+    # Расчёт без редактируемого визита или без собственного удержания клиента не кэшируется
+    use_cache = use_cache and not exclude_visit_id and not (exclude_client_id and active_holds(
+        Q(hall=hall) | Q(employee=employee), client_id=exclude_client_id, date__range=(dates[0], dates[-1])).exists())
+    step = slot_step(hall, duration)
+    slots, keys = get_cached_slots(hall, employee, duration, step, dates) if use_cache else ({}, None)
+    missing = [date for date in dates if date not in slots]
+
+    if missing:
+        occupancy = load_occupancy(hall, missing[0], missing[-1])
+        employee_busy = load_busy_intervals_range(missing[0], missing[-1], exclude_visit_id, employee=employee)
+        hall_held, employee_held = load_hold_intervals(missing[0], missing[-1], {hall.id}, {employee.id},
+                                                       exclude_client_id)
+
+        if exclude_visit_id:
+            release_visit(hall, occupancy, exclude_visit_id)
+
+        open_start, open_end = to_minutes(hall.start_time), to_minutes(hall.end_time)
+
+        computed = {date: free_starts(occupancy.get(date), open_start, open_end, duration, hall.capacity, step,
+                                      blocked=employee_busy.get(date, []) + employee_held.get((employee.id, date), []),
+                                      held=hall_held.get((hall.id, date)))
+                    for date in missing}
+
+        if use_cache:
+            set_cached_slots(keys, computed)
+
+        slots.update(computed)
+
+    return {date: slots[date] for date in dates}
+
+
+# Единая точка входа: свободное время сотрудника в зале на дату для услуги в формате HH:MM
+def get_available_slots(hall, employee, service, date, exclude_visit_id=None, use_cache=True, exclude_client_id=None):
+    duration = service.duration_minutes
+
+    if not hall or not duration:
+        return []
+
+    slots = compute_slots(hall, employee, duration, [date], exclude_visit_id, use_cache, exclude_client_id)[date]
+
+    return [minutes_to_str(slot) for slot in slots]
+
+
+# Свободное время сотрудника в зале на несколько дней сразу: {дата: [минуты от начала суток]}.
+# Загрузка зала и визиты сотрудника за период читаются по одному запросу на диапазон дат
+def get_week_slots(hall, employee, service, date_from, days=BOOKING_WINDOW_DAYS + 1, exclude_visit_id=None,
+                   exclude_client_id=None):
+    duration = service.duration_minutes
+    dates = [date_from + timedelta(days=offset) for offset in range(days)]
+
+    if not hall or not duration:
+        return {date: [] for date in dates}
+
+    return compute_slots(hall, employee, duration, dates, exclude_visit_id, exclude_client_id=exclude_client_id)
+
+
+# Проверка, что выбранное время всё ещё свободно. Всегда считается по базе, минуя кэш и загрузку зала:
+# читаются только визиты и удержания, пересекающиеся со слотом
+def is_slot_available(hall, employee, service, date, slot_time, exclude_visit_id=None, exclude_client_id=None):
+    duration = service.duration_minutes
+    start = to_minutes(slot_time)
+    end = start + duration
+
+    if not hall or not duration:
+        return False
+
+    open_start, open_end = to_minutes(hall.start_time), to_minutes(hall.end_time)
+
+    # Время должно лежать на сетке слотов зала внутри часов работы
+    if start < open_start or end > open_end or (start - open_start) % slot_step(hall, duration):
+        return False
+
+    # Сотрудник не должен быть занят ни в одном зале
+    if (overlapping_visits(date, start, end, exclude_visit_id, employee=employee).exists() or
+            overlapping_holds(date, start, end, exclude_client_id, employee=employee).exists()):
+        return False
+
+    # Пиковая загрузка зала внутри слота с учётом удержаний (интервалы обрезаются границами слота)
+    busy = [*overlapping_visits(date, start, end, exclude_visit_id, hall=hall).values_list(
+                'start_minute', 'end_minute'),
+            *overlapping_holds(date, start, end, exclude_client_id, hall=hall).values_list(
+                'start_minute', 'end_minute')]
+    intervals = [(max(busy_start, start), min(busy_end, end)) for busy_start, busy_end in busy]
+
+    return max((count for _, _, count in concurrency_profile(intervals)), default=0) < hall.capacity
+
+
+# Все пары (сотрудник, зал), где оказывается услуга, одним запросом
+def load_service_pairs(service):
+    return list(Employee.service_halls.through.objects.filter(servicehall__service=service).select_related(
+        'employee__user', 'servicehall__hall'))
+
+
+# Свободное время всех пар (сотрудник, зал) на дату: список слотов в минутах в порядке pairs.
+# Три запроса независимо от числа мастеров: загрузка их залов, визиты мастеров и удержания за день
+def compute_pairs_slots(pairs, duration, date):
+    hall_ids = {pair.servicehall.hall_id for pair in pairs}
+    occupancy = load_halls_occupancy(hall_ids, date)
+    hall_held, employee_held = load_hold_intervals(date, date, hall_ids, {pair.employee_id for pair in pairs})
+
+    # Занятость мастеров за день, сгруппированная в памяти по сотруднику
+    employee_busy = {}
+
+    for employee_id, start, end in Visit.objects.filter(
+            employee_id__in={pair.employee_id for pair in pairs}, date=date).values_list(
+            'employee_id', 'start_minute', 'end_minute'):
+        employee_busy.setdefault(employee_id, []).append((start, end))
+
+    slots = []
+
+    for pair in pairs:
+        hall = pair.servicehall.hall
+        slots.append(free_starts(occupancy.get(hall.id), to_minutes(hall.start_time), to_minutes(hall.end_time),
+                                 duration, hall.capacity, slot_step(hall, duration),
+                                 blocked=employee_busy.get(pair.employee_id, []) +
+                                 employee_held.get((pair.employee_id, date), []),
+                                 held=hall_held.get((hall.id, date))))
+
+    return slots
+
+
+# Ближайшие limit вариантов (сотрудник, зал, дата, время) для услуги среди всех мастеров.
+# Дни перебираются по порядку, каждый день считается сразу для всех мастеров (compute_pairs_slots),
+# потоки слотов мастеров за день сливаются через кучу. Поиск останавливается на limit-м варианте,
+# следующие дни не загружаются. limit ограничивается 1..EARLIEST_SLOTS_LIMIT, период - окном записи от сегодня
+def find_earliest_slots(service, date_from, date_to=None, limit=5):
+    duration = service.duration_minutes
+    now = datetime.now()
+    window_end = now.date() + timedelta(days=BOOKING_WINDOW_DAYS)  # Дальше окна записи (от сегодня) не ищем
+    date_to = min(date_to, window_end) if date_to else window_end
+    dates = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    limit = max(1, min(limit, EARLIEST_SLOTS_LIMIT))
+
+    if not duration or not dates:
+        return []
+
+    pairs = load_service_pairs(service)
+    results = []
+
+    if not pairs:
+        return results
+
+    for date in dates:
+        # Прошедшее время сегодня не предлагаем
+        past = now.hour * 60 + now.minute if date == now.date() else -1
+
+        streams = [[(minute, index) for minute in slots if minute > past]
+                   for index, slots in enumerate(compute_pairs_slots(pairs, duration, date))]
+
+        for minute, index in heapq.merge(*streams):
+            pair = pairs[index]
+            results.append((pair.employee, pair.servicehall.hall, date, minutes_to_str(minute)))
+
+            if len(results) == limit:
+                return results
+
+    return results
+
+
+# Матрица доступности всех мастеров услуги на дату: общая сетка времени и по строке на пару (сотрудник, зал).
+# Четыре запроса независимо от числа мастеров: пары ServiceHall, загрузка их залов, визиты мастеров и удержания
+def get_availability_matrix(service, date):
+    duration = service.duration_minutes
+
+    if not duration:
+        return [], []
+
+    pairs = load_service_pairs(service)
+
+    rows = [(pair.employee, pair.servicehall.hall, set(slots))
+            for pair, slots in zip(pairs, compute_pairs_slots(pairs, duration, date))]
+
+    # Общая сетка - объединение всех возможных начал по часам работы и шагу сетки залов
+    halls = {hall.id: hall for _, hall, _ in rows}.values()
+    grid = sorted({minute for hall in halls
+                   for minute in range(to_minutes(hall.start_time), to_minutes(hall.end_time) - duration + 1,
+                                       slot_step(hall, duration))})
+
+    return [minutes_to_str(minute) for minute in grid], [
+        (employee, hall, [minute in slots for minute in grid]) for employee, hall, slots in rows]
@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+# Бэкенд аутентификации, который загружает пользователя вместе с профилями клиента и сотрудника.
+# Шаблоны (меню в index.html) и декораторы is_client / is_employee обращаются к request.user.client
+# и request.user.employee на каждой странице; с select_related это не добавляет запросов
+class RoleModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('client', 'employee').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .availability import is_slot_available, to_minutes
+from .models import BookingLock, IdempotencyKey, SlotHold
+from .slot_cache import invalidate_days, invalidate_employee_days
+
+# Запись на визит без гонок.
+#
+# Проверка свободного времени и сохранение визита выполняются в одной транзакции после захвата
+# блокировок (зал, дата) и (сотрудник, дата). Блокировка - UPDATE строки BookingLock первым запросом
+# транзакции: в PostgreSQL/MySQL это блокировка строки, в SQLite - блокировка записи всей базы.
+# Вторая запись в тот же зал или к тому же мастеру ждёт окончания первой и проверяет время уже
+# с учётом её визита. Ключи захватываются в отсортированном порядке, чтобы не было взаимных блокировок.
+# Если блокировку не удалось получить за время ожидания базы (OperationalError: database is locked,
+# deadlock), транзакция повторяется с паузой.
+#
+# Удержание слота (SlotHold) ставится под теми же блокировками, что и запись, поэтому два клиента
+# не могут удержать последнее место одновременно. Запись визита снимает удержание клиента.
+#
+# Запись с ключом идемпотентности (IdempotencyKey) сохраняет ключ в той же транзакции, что и визит. Повтор
+# с тем же ключом находит визит без расчёта свободного времени, а одновременный повтор ждёт блокировку
+# первого запроса и тоже возвращает его визит.
+
+BOOKING_ATTEMPTS = 5  # Сколько раз пытаться выполнить транзакцию записи
+
+RETRY_DELAY = 0.05  # Базовая пауза между попытками в секундах (растёт с номером попытки)
+
+SLOT_TAKEN_MESSAGE = 'Зал переполнен на выбранное время. Пожалуйста, выберите другое время.'
+
+BOOKING_BUSY_MESSAGE = 'Сейчас много одновременных записей. Пожалуйста, попробуйте ещё раз.'
+
+HOLD_MINUTES = getattr(settings, 'SLOT_HOLD_MINUTES', 5)  # Время жизни удержания слота
+
+IDEMPOTENCY_KEY_MINUTES = getattr(settings, 'IDEMPOTENCY_KEY_MINUTES', 60)  # Сколько действует ключ идемпотентности
+
+
+# Ключи блокировок визита или удержания в порядке захвата
+def lock_keys(visit):
+    return sorted([f'hall:{visit.hall_id}:{visit.date}', f'employee:{visit.employee_id}:{visit.date}'])
+
+
+# Захват блокировок в текущей транзакции. Строка блокировки создаётся при первой записи на ключ
+def acquire_locks(keys):
+    for key in keys:
+        if BookingLock.objects.filter(key=key).update(version=F('version') + 1):
+            continue
+
+        try:
+            with transaction.atomic():
+                BookingLock.objects.create(key=key, version=1)
+        except IntegrityError:
+            # Строку одновременно создала другая запись: ждём её блокировку
+            BookingLock.objects.filter(key=key).update(version=F('version') + 1)
+
+
+# Выполнение action() в транзакции под блокировками keys. При OperationalError транзакция повторяется
+# до BOOKING_ATTEMPTS раз, перед повтором вызывается on_retry (вернуть объекты в состояние до попытки)
+def run_locked(keys, action, on_retry=None):
+    for attempt in range(1, BOOKING_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                acquire_locks(keys)
+
+                return action()
+        except OperationalError:
+            if on_retry:
+                on_retry()
+
+            if attempt == BOOKING_ATTEMPTS:
+                raise
+
+            time.sleep(RETRY_DELAY * attempt * random.uniform(0.5, 1.5))
+
+
+# Визит, уже записанный клиентом по ключу идемпотентности в пределах IDEMPOTENCY_KEY_MINUTES, или None
+def find_idempotent_visit(client_id, key):
+    record = IdempotencyKey.objects.select_related('visit__employee__user', 'visit__service', 'visit__hall').filter(
+        client_id=client_id, key=key, created_at__gt=now() - timedelta(minutes=IDEMPOTENCY_KEY_MINUTES)).first()
+
+    return record.visit if record else None
+
+
+# Сохранение нового или перенесённого визита, если его время свободно. Зал выбирается по сотруднику
+# и услуге, если не задан. Собственное удержание клиента записи не мешает и снимается вместе с ней.
+# С ключом идемпотентности повтор возвращает визит первой записи. Возвращает сохранённый визит.
+# Занятое время - ValidationError; блокировка не получена за BOOKING_ATTEMPTS попыток - OperationalError
+def save_booking(visit, idempotency_key=None):
+    if not visit.hall_id:
+        visit.hall = visit.employee.hall_for(visit.service)
+
+    pk = visit.pk
+
+    def book():
+        if idempotency_key:
+            booked = find_idempotent_visit(visit.client_id, idempotency_key)
+
+            if booked:
+                return booked  # Одновременный повтор: первый запрос уже записал визит
+
+        if not is_slot_available(visit.hall, visit.employee, visit.service, visit.date, visit.time,
+                                 exclude_visit_id=pk, exclude_client_id=visit.client_id):
+            raise ValidationError(SLOT_TAKEN_MESSAGE)
+
+        visit.save()
+        release_hold(visit.client_id)
+
+        if idempotency_key:
+            # Устаревший ключ с тем же значением, ещё не удалённый фоновой задачей, перезаписывается
+            IdempotencyKey.objects.update_or_create(client_id=visit.client_id, key=idempotency_key,
+                                                    defaults={'visit': visit, 'created_at': now()})
+
+        return visit
+
+    # Транзакция откачена: возвращаем визиту состояние до попытки
+    def reset():
+        visit.pk = pk
+        visit._state.adding = pk is None
+
+    return run_locked(lock_keys(visit), book, reset)
+
+
+# Сброс кэша свободного времени дней, которых касаются удержания (зал, сотрудник, дата)
+def invalidate_hold_days(holds):
+    for hall_id, employee_id, date in set(holds):
+        invalidate_days(hall_id, [date])
+        invalidate_employee_days(employee_id, [date])
+
+
+# Удержание времени slot_time, выбранного клиентом, на HOLD_MINUTES минут. Заменяет прежнее удержание клиента.
+# Занятое время - ValidationError; exclude_visit_id - переносимый визит клиента, который не мешает сам себе
+def place_hold(client, employee, service, date, slot_time, exclude_visit_id=None):
+    start = to_minutes(slot_time)
+    hold = SlotHold(client=client, employee=employee, hall=employee.hall_for(service), date=date,
+                    start_minute=start, end_minute=start + service.duration_minutes)
+
+    def place():
+        if not is_slot_available(hold.hall, employee, service, date, slot_time, exclude_visit_id,
+                                 exclude_client_id=client.id):
+            raise ValidationError(SLOT_TAKEN_MESSAGE)
+
+        previous = list(SlotHold.objects.filter(client=client).values_list('hall_id', 'employee_id', 'date'))
+
+        hold.expires_at = now() + timedelta(minutes=HOLD_MINUTES)
+        SlotHold.objects.update_or_create(client=client, defaults={
+            'employee': employee, 'hall': hold.hall, 'date': date, 'start_minute': hold.start_minute,
+            'end_minute': hold.end_minute, 'expires_at': hold.expires_at})
+
+        invalidate_hold_days(previous + [(hold.hall_id, employee.id, date)])
+
+        return hold
+
+    return run_locked(lock_keys(hold), place)
+
+
+# Снятие удержания клиента (запись оформлена или клиент выбирает время заново)
+def release_hold(client_id):
+    holds = SlotHold.objects.filter(client_id=client_id)
+    released = list(holds.values_list('hall_id', 'employee_id', 'date'))
+
+    if released:
+        holds.delete()
+        invalidate_hold_days(released)
+
+
+# Фоновая очистка: все истёкшие удержания удаляются одним запросом, кэш сбрасывается один раз на день
+# зала и сотрудника. Возвращает число удалённых удержаний
+def expire_holds():
+    moment = now()  # Оба запроса отбирают одни и те же удержания
+    expired = SlotHold.objects.filter(expires_at__lte=moment)
+    days = list(expired.values_list('hall_id', 'employee_id', 'date').distinct())
+
+    deleted, _ = expired.delete()
+    invalidate_hold_days(days)
+
+    return deleted
+
+
+# Фоновая очистка: ключи идемпотентности старше IDEMPOTENCY_KEY_MINUTES удаляются одним запросом
+def expire_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(
+        created_at__lte=now() - timedelta(minutes=IDEMPOTENCY_KEY_MINUTES)).delete()
+
+    return deleted
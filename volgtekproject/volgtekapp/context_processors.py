@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .fragment_cache import get_fragments_version
+
+
+# Параметры кэша фрагментов для шаблонов: версия, время жизни и роль пользователя для ключа меню.
+# Роль - сочетание client / employee / staff (сотрудник может быть и администратором), anonymous для гостя.
+# Версия читается из базы при первом обращении шаблона, ответы без шаблонов (JSON) её не запрашивают
+def fragments(request):
+    user = getattr(request, 'user', None)
+    roles = []
+
+    if user is not None and user.is_authenticated:
+        roles = [role for role, present in (('client', hasattr(user, 'client')),
+                                            ('employee', hasattr(user, 'employee')),
+                                            ('staff', user.is_staff)) if present]
+
+    return {
+        'fragments_version': SimpleLazyObject(get_fragments_version),
+        'fragments_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'nav_role': '-'.join(roles) or 'anonymous',
+    }
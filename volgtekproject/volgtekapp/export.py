@@ -0,0 +1,102 @@
+import csv
+import tempfile
+
+from .models import Visit
+
+# Потоковая выгрузка визитов для администратора.
+#
+# Визиты читаются курсором порциями по EXPORT_CHUNK_SIZE строк (.iterator) вместе со связанными
+# объектами (select_related), поэтому память не растёт с числом строк. CSV отдаётся генератором
+# через StreamingHttpResponse: заголовок уходит клиенту сразу, строки - по мере чтения из базы.
+# XLSX (необязательный пакет XlsxWriter) пишется в режиме constant_memory во временный файл:
+# формат - zip-архив, и отдать его можно только после записи последней строки.
+
+EXPORT_CHUNK_SIZE = 2000  # Строк за одно чтение из базы и за одну порцию ответа
+
+EXPORT_HEADERS = ['ID', 'Дата', 'Время', 'Клиент', 'Телефон клиента', 'Мастер', 'Телефон мастера', 'Услуга',
+                  'Длительность (мин)', 'Зал', 'Цена (рубли)', 'Статус']
+
+
+# Визиты для выгрузки с фильтрами из формы VisitExportForm (cleaned_data)
+def export_queryset(filters):
+    visits = Visit.objects.select_related('client__user', 'employee__user', 'service', 'hall')
+
+    if filters.get('date_from'):
+        visits = visits.filter(date__gte=filters['date_from'])
+
+    if filters.get('date_to'):
+        visits = visits.filter(date__lte=filters['date_to'])
+
+    if filters.get('hall'):
+        visits = visits.filter(hall=filters['hall'])
+
+    if filters.get('employee'):
+        visits = visits.filter(employee=filters['employee'])
+
+    if filters.get('status') not in (None, ''):
+        visits = visits.filter(status=filters['status'])
+
+    return visits.order_by('date', 'time', 'id')
+
+
+# Строка выгрузки для визита
+def export_row(visit):
+    return [
+        visit.id,
+        visit.date.isoformat(),
+        visit.time.strftime('%H:%M'),
+        str(visit.client),
+        visit.client.phone_number or '',
+        str(visit.employee),
+        visit.employee.phone_number or '',
+        visit.service.name,
+        visit.service.duration_minutes,
+        visit.hall.name if visit.hall else '',
+        visit.service.price,
+        visit.get_status_display(),
+    ]
+
+
+# Буфер для csv.writer, который не накапливает данные, а возвращает записанную строку
+class Echo:
+    def write(self, value):
+        return value
+
+
+# Генератор CSV: BOM и заголовок сразу, затем строки порциями по EXPORT_CHUNK_SIZE
+def stream_csv(visits):
+    writer = csv.writer(Echo(), delimiter=';')  # Разделитель ';' - его ожидает Excel в русской локали
+
+    yield '\ufeff' + writer.writerow(EXPORT_HEADERS)
+
+    rows = []
+
+    for visit in visits.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        rows.append(writer.writerow(export_row(visit)))
+
+        if len(rows) == EXPORT_CHUNK_SIZE:
+            yield ''.join(rows)
+            rows = []
+
+    if rows:
+        yield ''.join(rows)
+
+
+# Запись XLSX во временный файл в режиме constant_memory (строки сбрасываются на диск по одной).
+# Возвращает открытый файл, установленный в начало; без пакета XlsxWriter - ImportError
+def write_xlsx(visits):
+    import xlsxwriter
+
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False})
+    worksheet = workbook.add_worksheet('Визиты')
+
+    worksheet.write_row(0, 0, EXPORT_HEADERS)
+
+    for row, visit in enumerate(visits.iterator(chunk_size=EXPORT_CHUNK_SIZE), start=1):
+        worksheet.write_row(row, 0, export_row(visit))
+
+    workbook.close()
+    output.seek(0)
+
+    return output
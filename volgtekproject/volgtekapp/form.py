@@ -1,9 +1,21 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.core.exceptions import ValidationError
 
 from .models import User, Service, Hall, Client, Employee, Visit
 from datetime import datetime, timedelta
-from .time_slots import get_time_slots
+import uuid
+from .availability import BOOKING_WINDOW_DAYS, get_available_slots, resolve_hall
+from .booking import save_booking
+
+
+# Проверка даты записи или удержания: от сегодня до BOOKING_WINDOW_DAYS дней вперёд
+def check_booking_window(date):
+    today = datetime.today().date()
+
+    if not today <= date <= today + timedelta(days=BOOKING_WINDOW_DAYS):
+        raise ValidationError(f'Запись возможна только на ближайшие {BOOKING_WINDOW_DAYS} дней')
+    return date
 
 
 # Форма для добавления/редактирования зала
@@ -20,9 +32,11 @@ class HallForm(forms.ModelForm):
     end_time = forms.TimeField(label='Конец работы зала',
                                widget=forms.TimeInput(attrs={'type': 'time'}, format='%H:%M'))
 
+    slot_step = forms.IntegerField(label='Шаг записи (мин)', required=False, min_value=1)
+
     class Meta:
         model = Hall
-        fields = ['name', 'description', 'capacity', 'location', 'start_time', 'end_time']
+        fields = ['name', 'description', 'capacity', 'location', 'start_time', 'end_time', 'slot_step']
         labels = {
             'name': 'Название зала',
             'description': 'Описание зала',
@@ -30,6 +44,7 @@ class HallForm(forms.ModelForm):
             'location': 'Местоположение зала',
             'start_time': 'Начало работы зала',
             'end_time': 'Конец работы зала',
+            'slot_step': 'Шаг записи (мин)',
         }
 
 
@@ -87,7 +102,8 @@ class EmployeeForm(forms.ModelForm):
 
 # Форма для создания посещения
 class VisitForm(forms.ModelForm):
-    employee = forms.ModelChoiceField(queryset=Employee.objects.all(), label='Выберете нужного сотрудника',
+    employee = forms.ModelChoiceField(queryset=Employee.objects.select_related('user'),  # Имя берётся из user
+                                      label='Выберете нужного сотрудника',
                                       empty_label="Выберите сотрудника",
                                       widget=forms.Select(attrs={'id': 'id_employee'}))
     service = forms.ModelChoiceField(queryset=Service.objects.all(), label='Выберете нужную услугу',
@@ -97,67 +113,84 @@ class VisitForm(forms.ModelForm):
     date = forms.DateField(label='Дата  посещения',
                            widget=forms.DateInput(
                                attrs={'type': 'date', 'id': 'id_date', 'min': datetime.today().strftime('%Y-%m-%d'),
-
-                                      'max': (datetime.today() + timedelta(days=7)).strftime('%Y-%m-%d')}))
+                                      'max': (datetime.today() + timedelta(days=BOOKING_WINDOW_DAYS)).strftime(
+                                          '%Y-%m-%d')}))
 
     time = forms.ChoiceField(label='Время посещения', widget=forms.Select(attrs={'id': 'id_time'}))
 
+    # Ключ идемпотентности: новый при каждом показе пустой формы, повторная отправка той же формы
+    # возвращает уже созданный визит
+    idempotency_key = forms.UUIDField(required=False, initial=uuid.uuid4, widget=forms.HiddenInput)
+
     class Meta:
         model = Visit
         fields = ['employee', 'service', 'date', 'time']
 
-    # Переопределение волшебного метода для инициализации контейнера класса VisitForm
-    def __init__(self, *args, **kwargs):  # args - список аргументов, kwargs - словарь аргументов
+    # Переопределение волшебного метода для инициализации контейнера класса VisitForm.
+    # client - клиент новой записи: удержанное им время остаётся для него свободным
+    def __init__(self, *args, client=None, **kwargs):  # args - список аргументов, kwargs - словарь аргументов
         super(VisitForm, self).__init__(*args, **kwargs)
 
-        # Добавим доступные слоты времени в поле time
-        if 'employee' in self.data and 'service' in self.data and 'date' in self.data:
-            employee_id = self.data.get('employee')
-            service_id = self.data.get('service')
-            date_id = self.data.get('date')
+        client_id = client.id if client else self.instance.client_id
 
-            employee = Employee.objects.get(id=employee_id)
-            service = Service.objects.get(id=service_id)
-            date = datetime.strptime(date_id, '%Y-%m-%d').date()
+        if self.instance.pk:
+            del self.fields['idempotency_key']  # Ключ нужен только при создании записи
 
-            hall = employee.service_halls.filter(service_id=service_id).first().hall
-            available_time = get_time_slots(hall, service, date)
+            # Для скрипта формы: текущее время визита и id визита, который не мешает сам себе при переносе
+            self.fields['time'].widget.attrs.update({'data-selected-time': self.instance.time.strftime('%H:%M'),
+                                                     'data-visit-id': self.instance.pk})
+
+        # Добавим доступные слоты времени в поле time. Значения проверяются самими полями: неизвестный
+        # сотрудник, услуга или неверная дата остаются без слотов, а ошибку покажет is_valid()
+        if 'employee' in self.data and 'service' in self.data and 'date' in self.data:
+            try:
+                employee = self.fields['employee'].clean(self.data.get('employee'))
+                service = self.fields['service'].clean(self.data.get('service'))
+                date = self.fields['date'].clean(self.data.get('date'))
+            except ValidationError:
+                return
+
+            hall = resolve_hall(employee, service)
+            available_time = get_available_slots(hall, employee, service, date, exclude_visit_id=self.instance.pk,
+                                                 exclude_client_id=client_id)
 
             # Преобразуем список доступных временных слотов в choices для поля
             self.fields['time'].choices = [(slot, slot) for slot in available_time]
 
+    # Дата записи должна попадать в окно записи
+    def clean_date(self):
+        return check_booking_window(self.cleaned_data['date'])
+
     def save(self, commit=True):
-        """Переопределяем сохранение формы, чтобы автоматически устанавливать зал и время и проверять переполненность зала"""
+        """Переопределяем сохранение формы, чтобы автоматически устанавливать зал и время.
+        Время проверяется и визит сохраняется сервисом записи (booking.save_booking) под блокировкой"""
         instance = super().save(commit=False)
 
         # Устанавливаем значение для поля hall на основе выбранных сотрудника и услуги
         employee = self.cleaned_data.get('employee')
         service = self.cleaned_data.get('service')
-        time = self.cleaned_data.get('time')  # Получаем выбранное время
-        date = self.cleaned_data.get('date')  # Получаем выбранную дату
 
         if employee and service:
-            # Найти доступные залы для сотрудника
-            available_halls = employee.halls.all()
+            # Зал определяется так же, как при расчёте свободного времени
+            instance.hall = resolve_hall(employee, service)
 
-            if available_halls.exists():
-                instance.hall = available_halls.first()  # Устанавливаем первый доступный зал
+        instance.time = self.cleaned_data.get('time')  # Устанавливаем выбранное время
 
-            # Проверяем, переполнен ли зал на выбранную дату и время
-            hall = instance.hall
-            existing_visits = Visit.objects.filter(hall=hall, date=date, time=time)
-
-            if existing_visits.count() >= hall.capacity:
-                # Если зал переполнен, генерируем ошибку
-                raise forms.ValidationError(
-                    "Зал переполнен на выбранное время. Пожалуйста, выберите другое время.")
+        if commit:
+            save_booking(instance)  # Если время уже занято - ValidationError
+        return instance
 
 
-        instance.time = time  # Устанавливаем выбранное время
+# Форма удержания времени (hold_slot): те же поля, что у записи, время - в формате HH:MM
+class SlotHoldForm(forms.Form):
+    employee = forms.ModelChoiceField(queryset=Employee.objects.all())
+    service = forms.ModelChoiceField(queryset=Service.objects.all())
+    date = forms.DateField(input_formats=['%Y-%m-%d'])
+    time = forms.TimeField(input_formats=['%H:%M'])
 
-        if commit:
-            instance.save()
-        return instance
+    # Удержать можно только время, на которое можно записаться
+    def clean_date(self):
+        return check_booking_window(self.cleaned_data['date'])
 
 
 # Форма регистрации клиента
@@ -192,3 +225,40 @@ class ClientUpdateForm(forms.ModelForm):
             'date_of_birth': 'Дата рождения',
             'gender': 'Пол',
         }
+
+
+# Форма фильтров выгрузки визитов (администратор)
+class VisitExportForm(forms.Form):
+    date_from = forms.DateField(label='С даты', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(label='По дату', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    hall = forms.ModelChoiceField(queryset=Hall.objects.all(), label='Зал', required=False, empty_label='Все залы')
+    employee = forms.ModelChoiceField(queryset=Employee.objects.select_related('user'), label='Мастер',
+                                      required=False, empty_label='Все мастера')
+    status = forms.TypedChoiceField(choices=[('', 'Все статусы'), *Visit.Status.choices], coerce=int,
+                                    empty_value=None, label='Статус', required=False)
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX')], label='Формат', required=False)
+
+
+# Форма выбора периода отчёта (администратор): год целиком или месяц года
+class RollupReportForm(forms.Form):
+    year = forms.IntegerField(label='Год', min_value=2000, max_value=2100)
+    month = forms.TypedChoiceField(choices=[('', 'Весь год'), *[(number, number) for number in range(1, 13)]],
+                                   coerce=int, empty_value=None, label='Месяц', required=False)
+
+
+# Формы проверки строк импорта (manage.py import_catalog) - правила тех же полей, что при добавлении.
+# Связи (залы, услуги, клиент, сотрудник) команда сопоставляет по словарям в памяти, поэтому в формы они не входят
+class EmployeeImportForm(EmployeeForm):
+    username = forms.CharField(label='Логин', max_length=150)
+    first_name = forms.CharField(label='Имя', max_length=150)
+    last_name = forms.CharField(label='Фамилия', max_length=150)
+
+    class Meta(EmployeeForm.Meta):
+        fields = ['phone_number', 'position']
+
+
+class VisitImportForm(forms.Form):
+    date = forms.DateField(label='Дата')
+    time = forms.TimeField(label='Время')
+    status = forms.TypedChoiceField(choices=Visit.Status.choices, coerce=int, empty_value=None, label='Статус',
+                                    required=False)
@@ -0,0 +1,13 @@
+# Форматирование дат на русском без системной локали.
+#
+# locale.setlocale меняет состояние всего процесса и зависит от установленных в ОС локалей
+# (имя 'Russian_Russia.1251' есть только в Windows), поэтому названия месяцев берутся из таблицы.
+
+# Названия месяцев в родительном падеже ("5 марта"), индекс - номер месяца
+MONTHS_GENITIVE = ('', 'января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа', 'сентября',
+                   'октября', 'ноября', 'декабря')
+
+
+# Дата в виде "05 марта 2025"
+def format_date(date):
+    return f'{date.day:02d} {MONTHS_GENITIVE[date.month]} {date.year}'
@@ -0,0 +1,23 @@
+from .models import SlotCacheVersion
+from .slot_cache import increment_version
+
+
+# Версия кэша фрагментов шаблонов (карточки сотрудников, меню).
+#
+# Фрагменты хранятся в кэше 'fragments' (память процесса), а версия - в базе рядом с версиями кэша слотов
+# (SlotCacheVersion) и входит в ключ каждого фрагмента ({% cache ... fragments_version %}). Изменение
+# сотрудника, услуги или зала увеличивает версию: во всех воркерах старые фрагменты перестают находиться
+# и вытесняются по времени жизни. Версия в базе не вытесняется при переполнении кэша, поэтому не может
+# вернуться к старому номеру, под которым в памяти воркеров ещё лежат устаревшие фрагменты.
+
+FRAGMENTS_VERSION_KEY = 'fragments'
+
+
+# Текущая версия фрагментов
+def get_fragments_version():
+    return SlotCacheVersion.objects.filter(key=FRAGMENTS_VERSION_KEY).values_list('version', flat=True).first() or 0
+
+
+# Сброс всех фрагментов, зависящих от сотрудников, услуг и залов
+def invalidate_fragments():
+    increment_version(FRAGMENTS_VERSION_KEY)
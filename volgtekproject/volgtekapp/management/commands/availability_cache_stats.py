@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from volgtekapp.slot_cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает число попаданий и промахов кэша свободного времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Сбросить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+
+        self.stdout.write(f"Попадания: {stats['hits']}, промахи: {stats['misses']}, "
+                          f"доля попаданий: {stats['hit_rate']:.1%}")
+
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,117 @@
+import random
+from io import StringIO
+from datetime import date as dt_date, datetime, time as dt_time, timedelta
+from timeit import timeit
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from volgtekapp.availability import get_available_slots, to_minutes
+from volgtekapp.models import Client, Employee, Hall, Service, Visit
+from volgtekapp.occupancy import free_starts, load_occupancy
+
+
+# Прежняя реализация get_time_slots (вложенный перебор), оставлена только для сравнения
+def legacy_time_slots(hall, service, date):
+    service_duration = service.duration.hour * 60 + service.duration.minute
+
+    occupied_time_slots = []
+
+    for visit in Visit.objects.filter(hall=hall, date=date):
+        visit_start_time = datetime.combine(date, visit.time)
+        occupied_time_slots.append((visit_start_time, visit_start_time + timedelta(minutes=service_duration)))
+
+    available_time_slots = []
+    current_time_temp = datetime.combine(date, hall.start_time)
+
+    while current_time_temp.time() < hall.end_time:
+        slot_start = current_time_temp
+        slot_end = slot_start + timedelta(minutes=service_duration)
+
+        if not any(oc_start < slot_end and slot_start < oc_end for oc_start, oc_end in occupied_time_slots):
+            available_time_slots.append(slot_start.time().strftime('%H:%M'))
+
+        current_time_temp += timedelta(minutes=service_duration)
+
+    return available_time_slots
+
+
+# Тот же перебор без обращения к БД, чтобы сравнить только алгоритмы
+def legacy_scan(open_start, open_end, duration, busy):
+    slots = []
+
+    for slot_start in range(open_start, open_end, duration):
+        slot_end = slot_start + duration
+
+        if not any(oc_start < slot_end and slot_start < oc_end for oc_start, oc_end in busy):
+            slots.append(slot_start)
+
+    return slots
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость расчёта свободного времени со старой реализацией get_time_slots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visits', type=int, default=500, help='Количество визитов в зале за день')
+        parser.add_argument('--duration', type=int, default=5, help='Длительность услуги в минутах')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество повторов замера')
+
+    def handle(self, *args, **options):
+        visits, duration, repeat = options['visits'], options['duration'], options['repeat']
+
+        # Все тестовые данные создаются в транзакции и откатываются после замера
+        with transaction.atomic():
+            hall, employee, service, date = self.seed(visits, duration)
+
+            self.report('БД + алгоритм', repeat,
+                        lambda: legacy_time_slots(hall, service, date),
+                        lambda: get_available_slots(hall, employee, service, date, use_cache=False))
+
+            busy = sorted((to_minutes(t), to_minutes(t) + duration)
+                          for t in Visit.objects.filter(hall=hall, date=date).values_list('time', flat=True))
+            open_start, open_end = to_minutes(hall.start_time), to_minutes(hall.end_time)
+
+            # Движок читает готовую загрузку зала (HallDayOccupancy), как при расчёте слотов в запросе
+            counters = load_occupancy(hall, date, date)[date]
+
+            self.report('только алгоритм', repeat,
+                        lambda: legacy_scan(open_start, open_end, duration, busy),
+                        lambda: free_starts(counters, open_start, open_end, duration, hall.capacity))
+
+            transaction.set_rollback(True)
+
+    def seed(self, visits, duration):
+        user = User.objects.create(username='bench_availability_employee')
+        client_user = User.objects.create(username='bench_availability_client')
+        client = Client.objects.create(user=client_user)
+
+        hall = Hall.objects.create(name='bench', description='', capacity=1, location='',
+                                   start_time=dt_time(8, 0), end_time=dt_time(22, 0))
+        service = Service.objects.create(name='bench', description='', price=0,
+                                         duration=dt_time(duration // 60, duration % 60))
+        employee = Employee.objects.create(user=user, position='bench')
+
+        date = dt_date.today()
+        rng = random.Random(0)
+
+        starts = [rng.randrange(8 * 60, 22 * 60 - duration) for _ in range(visits)]
+
+        # bulk_create не вызывает Visit.save(), поэтому интервал визита задаётся явно
+        Visit.objects.bulk_create(
+            Visit(client=client, employee=employee, service=service, hall=hall, date=date,
+                  time=dt_time(*divmod(start, 60)), start_minute=start, end_minute=start + duration)
+            for start in starts)
+
+        call_command('rebuild_occupancy', stdout=StringIO())  # bulk_create не обновляет загрузку залов
+
+        return hall, employee, service, date
+
+    def report(self, title, repeat, legacy, engine):
+        legacy_time = timeit(legacy, number=repeat) / repeat * 1000
+        engine_time = timeit(engine, number=repeat) / repeat * 1000
+
+        self.stdout.write(f'{title}: старая реализация {legacy_time:.2f} мс, '
+                          f'движок доступности {engine_time:.2f} мс, ускорение x{legacy_time / engine_time:.1f}')
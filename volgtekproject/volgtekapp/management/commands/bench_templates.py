@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from volgtekapp.models import Client, Employee, Hall, Service
+from volgtekapp.views import index
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время отрисовки главной страницы без кэша фрагментов шаблонов и с ним'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50, help='Количество сотрудников (карточек на странице)')
+        parser.add_argument('--repeat', type=int, default=50, help='Количество запросов в каждом замере')
+
+    def handle(self, *args, **options):
+        # Все тестовые данные создаются в транзакции и откатываются после замера
+        with transaction.atomic():
+            user = self.seed(options['employees'])
+
+            # Без кэша фрагментов: кэш 'fragments' заменяется на DummyCache, всё отрисовывается заново
+            without_cache = {**settings.CACHES, 'fragments': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+            with override_settings(CACHES=without_cache):
+                before = self.measure(user, options['repeat'])
+
+            self.request(user)  # Прогрев: фрагменты попадают в кэш
+            after = self.measure(user, options['repeat'])
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Без кэша фрагментов: {before:.2f} мс на запрос')
+        self.stdout.write(f'С кэшем фрагментов:  {after:.2f} мс на запрос')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: {before / after:.1f}x'))
+
+    def seed(self, employees):
+        hall = Hall.objects.create(name='Зал для замера', description='', capacity=5, location='',
+                                   start_time=dt_time(9), end_time=dt_time(21))
+        services = [Service.objects.create(name=f'Услуга {number}', description='', price=500 + number,
+                                           duration=dt_time(1)) for number in range(3)]
+
+        for number in range(employees):
+            employee = Employee.objects.create(
+                user=User.objects.create_user(f'bench_templates_{number}', first_name='Мастер', last_name=str(number)),
+                position='Барбер')
+            employee.halls.add(hall)
+            employee.services.add(*services)
+
+        user = User.objects.create_user('bench_templates_client')
+        Client.objects.create(user=user)
+
+        return User.objects.select_related('client', 'employee').get(id=user.id)
+
+    # Главная страница для пользователя, как её отдаёт представление
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+
+        return index(request)
+
+    # Медиана времени запроса в миллисекундах
+    def measure(self, user, repeat):
+        timings = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.request(user)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return statistics.median(timings)
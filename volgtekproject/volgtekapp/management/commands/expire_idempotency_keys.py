@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from volgtekapp.booking import expire_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие ключи идемпотентности записи одним запросом (для cron или фонового воркера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, запускаясь каждые --interval секунд')
+        parser.add_argument('--interval', type=int, default=600, help='Пауза между запусками в режиме --loop (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = expire_idempotency_keys()
+            self.stdout.write(f'Удалено ключей: {deleted}')
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from volgtekapp.booking import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие удержания слотов одним запросом (для cron или фонового воркера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, запускаясь каждые --interval секунд')
+        parser.add_argument('--interval', type=int, default=60, help='Пауза между запусками в режиме --loop (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = expire_holds()
+            self.stdout.write(f'Удалено удержаний: {deleted}')
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
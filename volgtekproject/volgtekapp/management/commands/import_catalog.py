@@ -0,0 +1,385 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import localtime
+
+from volgtekapp.availability import to_minutes
+from volgtekapp.form import ClientForm, EmployeeImportForm, HallForm, ServiceForm, VisitImportForm
+from volgtekapp.fragment_cache import invalidate_fragments
+from volgtekapp.models import Client, Employee, Hall, ImportCheckpoint, Service, Visit
+from volgtekapp.search import rebuild_search_tokens
+from volgtekapp.service_halls import sync_service_halls
+from volgtekapp.slot_cache import invalidate_days, invalidate_employee_days
+
+KINDS = ('halls', 'services', 'clients', 'employees', 'visits')
+
+VISIT_VALUE_FIELDS = ('date', 'time', 'status')  # Поля VisitImportForm
+
+ERRORS_SHOWN = 20  # Сколько ошибочных строк выводить подробно, дальше - только счётчик
+
+
+class Command(BaseCommand):
+    help = ('Массовый импорт залов, услуг, клиентов, сотрудников или визитов из CSV или JSON Lines: файл читается '
+            'пачками, строки проверяются правилами форм, пачка сохраняется bulk_create в одной транзакции '
+            'с контрольной точкой, поэтому прерванный импорт продолжается с --resume')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS, help='Что импортировать')
+        parser.add_argument('path', help='Файл CSV (с заголовком) или JSON Lines (объект на строку)')
+        parser.add_argument('--format', choices=('csv', 'json'), help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одной пачке и транзакции')
+        restart = parser.add_mutually_exclusive_group()
+        restart.add_argument('--resume', action='store_true', help='Продолжить с контрольной точки прошлого запуска')
+        restart.add_argument('--restart', action='store_true',
+                             help='Начать файл сначала, сбросив контрольную точку прошлого запуска')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Не пересчитывать загрузку залов и итоги после импорта визитов '
+                                 '(например, если дальше загружаются ещё файлы)')
+
+    def handle(self, *args, **options):
+        kind, path = options['kind'], options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля')
+
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл не найден: {path}')
+
+        # Контрольная точка привязана к виду данных и файлу. Если файл уже загружался, нужно явно выбрать:
+        # продолжить (--resume) или начать сначала (--restart)
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=f'{kind}:{os.path.abspath(path)}')
+
+        if checkpoint.rows and not (options['resume'] or options['restart']):
+            raise CommandError(f'Файл уже импортирован до строки {checkpoint.rows}: укажите --resume, чтобы '
+                               f'продолжить, или --restart, чтобы начать сначала')
+
+        if options['resume'] and checkpoint.rows:
+            self.stdout.write(f'Продолжение со строки {checkpoint.rows + 1}')
+        elif checkpoint.rows:
+            checkpoint.rows = 0
+            checkpoint.save(update_fields=['rows', 'updated_at'])
+
+        self.load_lookups()
+        self.counts = {'created': 0, 'skipped': 0, 'errors': 0}
+        importer = getattr(self, f'import_{kind}')
+        processed = 0
+        start = time.perf_counter()
+
+        with open(path, newline='', encoding='utf-8-sig') as source:
+            rows = self.read_rows(source, file_format)
+
+            for _ in islice(rows, checkpoint.rows):
+                pass  # Строки, зафиксированные прошлым запуском
+
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+
+                if not chunk:
+                    break
+
+                # Пачка и контрольная точка фиксируются вместе: после сбоя нет ни потерянных, ни повторных строк
+                with transaction.atomic():
+                    importer(chunk, checkpoint.rows + 1)
+                    checkpoint.rows += len(chunk)
+                    checkpoint.save(update_fields=['rows', 'updated_at'])
+
+                processed += len(chunk)
+                self.progress(checkpoint.rows, processed / (time.perf_counter() - start))
+
+        self.finish(kind, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: добавлено {self.counts["created"]}, пропущено (уже есть) {self.counts["skipped"]}, '
+            f'ошибок {self.counts["errors"]} за {time.perf_counter() - start:.1f} с'))
+
+    # Строки файла по одной: CSV - словари по заголовку, JSON Lines - объекты. Файл JSON с массивом
+    # (начинается с '[') не читается потоково и загружается целиком
+    def read_rows(self, source, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+
+        for line in source:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            if line.startswith('['):
+                yield from json.loads(line + source.read())
+                return
+
+            yield json.loads(line)
+
+    # Словари для сопоставления связей и пропуска уже загруженных строк - по одному запросу на таблицу
+    def load_lookups(self):
+        self.halls = dict(Hall.objects.values_list('name', 'id'))  # {название: id}
+        self.services = dict(Service.objects.values_list('name', 'id'))  # {название: id}
+        self.durations = dict(Service.objects.values_list('id', 'duration_minutes'))  # {услуга: минуты}
+        self.usernames = set(User.objects.values_list('username', flat=True))
+        self.clients = dict(Client.objects.values_list('user__username', 'id'))  # {логин: id}
+        self.employees = dict(Employee.objects.values_list('user__username', 'id'))  # {логин: id}
+        self.checked_values = {}  # {(поле визита, значение из файла): проверенное значение или ValidationError}
+
+        # Зал пары (сотрудник, услуга) как в Employee.hall_for: строка ServiceHall с наименьшим id
+        self.pair_halls = {}
+
+        for employee_id, service_id, hall_id in Employee.service_halls.through.objects.order_by(
+                'servicehall_id').values_list('employee_id', 'servicehall__service_id', 'servicehall__hall_id'):
+            self.pair_halls.setdefault((employee_id, service_id), hall_id)
+
+    def import_halls(self, chunk, first_row):
+        halls = [form.save(commit=False) for form in self.valid_forms(chunk, first_row, HallForm, 'name', self.halls)]
+
+        Hall.objects.bulk_create(halls)
+        self.halls.update((hall.name, hall.id) for hall in halls)
+        self.counts['created'] += len(halls)
+
+    def import_services(self, chunk, first_row):
+        services = []
+
+        for form in self.valid_forms(chunk, first_row, ServiceForm, 'name', self.services):
+            service = form.save(commit=False)
+            service.duration_minutes = to_minutes(service.duration)  # bulk_create не вызывает Service.save()
+            services.append(service)
+
+        Service.objects.bulk_create(services)
+        self.services.update((service.name, service.id) for service in services)
+        self.durations.update((service.id, service.duration_minutes) for service in services)
+        self.counts['created'] += len(services)
+
+    def import_clients(self, chunk, first_row):
+        users = self.create_users(self.valid_forms(chunk, first_row, ClientForm, 'username', self.usernames))
+
+        clients = Client.objects.bulk_create([Client(user=user) for user in users])
+        self.clients.update((client.user.username, client.id) for client in clients)
+        self.counts['created'] += len(clients)
+
+    def import_employees(self, chunk, first_row):
+        forms, relations = [], []
+
+        for number, form in self.valid_forms(chunk, first_row, EmployeeImportForm, 'username', self.usernames,
+                                             numbered=True):
+            row = form.data
+            halls = self.related_ids(number, 'halls', row.get('halls'), self.halls)
+            services = self.related_ids(number, 'services', row.get('services'), self.services)
+
+            if halls is None or services is None:
+                self.usernames.discard(form.cleaned_data['username'])
+                continue
+
+            forms.append(form)
+            relations.append((halls, services))
+
+        users = self.create_users(forms)
+        employees = []
+
+        for form, user in zip(forms, users):
+            employee = form.save(commit=False)
+            employee.user = user
+            employee.sort_name = Employee.make_sort_name(user)  # bulk_create не вызывает Employee.save()
+            employees.append(employee)
+
+        Employee.objects.bulk_create(employees)
+
+        hall_links = [Employee.halls.through(employee_id=employee.id, hall_id=hall_id)
+                      for employee, (halls, _) in zip(employees, relations) for hall_id in halls]
+        service_links = [Employee.services.through(employee_id=employee.id, service_id=service_id)
+                         for employee, (_, services) in zip(employees, relations) for service_id in services]
+
+        Employee.halls.through.objects.bulk_create(hall_links)
+        Employee.services.through.objects.bulk_create(service_links)
+
+        # bulk_create не отправляет m2m_changed: пары услуга - зал и поиск обновляются явно, по пачке целиком
+        employee_ids = [employee.id for employee in employees]
+        sync_service_halls(employee_ids)
+        rebuild_search_tokens(employee_ids)
+
+        self.employees.update((employee.user.username, employee.id) for employee in employees)
+
+        for employee_id, service_id, hall_id in Employee.service_halls.through.objects.filter(
+                employee_id__in=employee_ids).order_by('servicehall_id').values_list(
+                'employee_id', 'servicehall__service_id', 'servicehall__hall_id'):
+            self.pair_halls.setdefault((employee_id, service_id), hall_id)
+
+        self.counts['created'] += len(employees)
+
+    def import_visits(self, chunk, first_row):
+        current = localtime()
+        visits = []
+        days = set()  # Будущие дни (зал, сотрудник, дата), кэш свободного времени которых устарел
+        existing = self.existing_visits(chunk)
+
+        for number, row in enumerate(chunk, first_row):
+            values = self.visit_values(number, row)
+
+            if values is None:
+                continue
+
+            client_id = self.clients.get(row.get('client'))
+            employee_id = self.employees.get(row.get('employee'))
+            service_id = self.services.get(row.get('service'))
+
+            if not (client_id and employee_id and service_id):
+                self.error(number, 'не найден клиент, сотрудник или услуга')
+                continue
+
+            hall_id = self.halls.get(row['hall']) if row.get('hall') else self.pair_halls.get(
+                (employee_id, service_id))
+
+            if not hall_id:
+                self.error(number, 'сотрудник не оказывает услугу ни в одном зале')
+                continue
+
+            visit_date, visit_time, status = values
+            key = (client_id, employee_id, visit_date, visit_time)
+
+            if key in existing:
+                self.counts['skipped'] += 1  # Визит уже загружен (например, файл импортируется повторно)
+                continue
+
+            existing.add(key)
+
+            if status is None:
+                # Без статуса прошедший визит считается выполненным, будущий - запланированным
+                past = datetime.combine(visit_date, visit_time) < current.replace(tzinfo=None)
+                status = Visit.Status.DONE if past else Visit.Status.PLANNED
+
+            start = to_minutes(visit_time)
+            visits.append(Visit(client_id=client_id, employee_id=employee_id, service_id=service_id, hall_id=hall_id,
+                                date=visit_date, time=visit_time, status=status, start_minute=start,
+                                end_minute=start + self.durations[service_id]))
+
+            if visit_date >= current.date():
+                days.add((hall_id, employee_id, visit_date))
+
+        Visit.objects.bulk_create(visits, batch_size=1000)
+
+        for hall_id, employee_id, visit_date in days:
+            invalidate_days(hall_id, [visit_date])
+            invalidate_employee_days(employee_id, [visit_date])
+
+        self.counts['created'] += len(visits)
+
+    # Уже сохранённые визиты клиентов пачки: ключи (клиент, сотрудник, дата, время). Клиенты запрашиваются
+    # по 1000, чтобы не упереться в предел параметров запроса SQLite при большой пачке
+    def existing_visits(self, chunk):
+        clients = sorted({self.clients[row.get('client')] for row in chunk if row.get('client') in self.clients})
+        existing = set()
+
+        for index in range(0, len(clients), 1000):
+            existing.update(Visit.objects.filter(client_id__in=clients[index:index + 1000]).values_list(
+                'client_id', 'employee_id', 'date', 'time'))
+
+        return existing
+
+    # Проверенные дата, время и статус визита или None. Значения повторяются от строки к строке, поэтому каждое
+    # проверяется полем VisitImportForm (у формы нет общей проверки полей) один раз, а результат запоминается
+    def visit_values(self, number, row):
+        values, errors = [], []
+
+        for field in VISIT_VALUE_FIELDS:
+            key = (field, repr(row.get(field)))
+
+            if key not in self.checked_values:
+                try:
+                    self.checked_values[key] = VisitImportForm.base_fields[field].clean(row.get(field))
+                except ValidationError as error:
+                    self.checked_values[key] = error
+
+            value = self.checked_values[key]
+
+            if isinstance(value, ValidationError):
+                errors.append(f'{field}: {" ".join(value.messages)}')
+            else:
+                values.append(value)
+
+        if errors:
+            self.error(number, '; '.join(errors))
+            return None
+
+        return values
+
+    # Проверенные формы строк пачки. Строки, ключ которых (key) уже есть в existing, пропускаются;
+    # ключи принятых строк добавляются в existing, чтобы повтор внутри файла тоже был пропущен
+    def valid_forms(self, chunk, first_row, form_class, key, existing, numbered=False):
+        forms = []
+
+        for number, row in enumerate(chunk, first_row):
+            if str(row.get(key) or '').strip() in existing:
+                self.counts['skipped'] += 1
+                continue
+
+            form = form_class(row)
+
+            if self.is_valid(number, form):
+                if isinstance(existing, set):
+                    existing.add(form.cleaned_data[key])
+                else:
+                    existing[form.cleaned_data[key]] = None  # id появится после bulk_create
+
+                forms.append((number, form) if numbered else form)
+
+        return forms
+
+    # Пользователи для проверенных форм клиентов или сотрудников, без пароля (вход после сброса пароля)
+    def create_users(self, forms):
+        password = make_password(None)
+
+        return User.objects.bulk_create([User(
+            username=form.cleaned_data['username'], first_name=form.cleaned_data['first_name'],
+            last_name=form.cleaned_data['last_name'], email=form.cleaned_data.get('email', ''), password=password)
+            for form in forms])
+
+    # id связанных объектов по названиям: список в JSON или строка через ';' в CSV. None - есть неизвестные
+    def related_ids(self, number, field, value, lookup):
+        names = value if isinstance(value, list) else [name for name in (value or '').split(';')]
+        names = [str(name).strip() for name in names if str(name).strip()]
+        unknown = [name for name in names if not lookup.get(name)]
+
+        if unknown:
+            self.error(number, f'{field}: не найдены {", ".join(unknown)}')
+            return None
+
+        return {lookup[name] for name in names}
+
+    def is_valid(self, number, form):
+        if form.is_valid():
+            return True
+
+        self.error(number, '; '.join(f'{field}: {" ".join(messages)}' for field, messages in form.errors.items()))
+
+        return False
+
+    def error(self, number, message):
+        self.counts['errors'] += 1
+
+        if self.counts['errors'] <= ERRORS_SHOWN:
+            self.stderr.write(f'Строка {number}: {message}')
+        elif self.counts['errors'] == ERRORS_SHOWN + 1:
+            self.stderr.write('Дальнейшие ошибки только подсчитываются')
+
+    def progress(self, rows, rate):
+        self.stdout.write(f'Обработано строк: {rows}, добавлено: {self.counts["created"]}, '
+                          f'пропущено: {self.counts["skipped"]}, ошибок: {self.counts["errors"]} '
+                          f'({rate:.0f} строк/с)')
+
+    # Производные данные, которые bulk_create не обновляет сигналами
+    def finish(self, kind, options):
+        if kind in ('halls', 'services', 'employees'):
+            invalidate_fragments()
+
+        if kind == 'visits' and not options['no_rebuild']:
+            call_command('rebuild_occupancy', stdout=self.stdout)
+            call_command('rebuild_rollups', stdout=self.stdout)
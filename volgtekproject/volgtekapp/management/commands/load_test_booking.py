@@ -0,0 +1,174 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date as dt_date, time as dt_time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+
+from volgtekapp.availability import concurrency_profile, is_slot_available, minutes_to_str, to_minutes
+from volgtekapp.booking import save_booking
+from volgtekapp.models import Client, Employee, Hall, Service, Visit
+
+# Кэш на время теста: память процесса вместо общего кэша, чтобы слоты временной базы не смешивались с рабочими
+LOAD_TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'load_test_booking'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'load_test_fragments'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест записи: несколько потоков одновременно записываются в один зал, '
+            'после чего проверяется, что зал и сотрудники не переполнены')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Количество одновременных потоков')
+        parser.add_argument('--attempts', type=int, default=30, help='Попыток записи в каждом потоке')
+        parser.add_argument('--employees', type=int, default=3, help='Количество сотрудников в зале')
+        parser.add_argument('--capacity', type=int, default=2, help='Вместимость зала')
+        parser.add_argument('--no-lock', action='store_true',
+                            help='Старая схема: проверка и сохранение без блокировки (для сравнения)')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Нагрузочный тест рассчитан на SQLite')
+
+        # Тест идёт на отдельном файле SQLite с теми же настройками (WAL, IMMEDIATE) и применёнными миграциями,
+        # рабочие база и кэш не затрагиваются; файл удаляется после замера
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES=LOAD_TEST_CACHES):
+            with self.temporary_database(os.path.join(directory, 'load_test_booking.sqlite3')):
+                self.run_test(options)
+
+    # Подмена файла базы для всех соединений, в том числе соединений потоков, на время теста
+    @contextmanager
+    def temporary_database(self, path):
+        settings_dict = connections['default'].settings_dict  # Общий словарь настроек соединений default
+        name = settings_dict['NAME']
+
+        connections.close_all()
+        settings_dict['NAME'] = path
+
+        try:
+            call_command('migrate', interactive=False, verbosity=0)
+            yield
+        finally:
+            connections.close_all()
+            settings_dict['NAME'] = name
+
+    def run_test(self, options):
+        hall, service, employees, clients = self.seed(options)
+
+        day = dt_date.today() + timedelta(days=1)
+        starts = [minutes_to_str(minute) for minute in range(to_minutes(hall.start_time),
+                                                             to_minutes(hall.end_time), 30)]
+
+        results = {'booked': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(client):
+            counts = {'booked': 0, 'rejected': 0, 'errors': 0}
+            barrier.wait()  # Все потоки начинают одновременно
+
+            try:
+                for _ in range(options['attempts']):
+                    visit = Visit(client=client, employee=random.choice(employees), service=service, hall=hall,
+                                  date=day, time=random.choice(starts))
+                    counts[self.book(visit, options['no_lock'])] += 1
+            finally:
+                connections.close_all()  # У каждого потока своё соединение с базой
+
+            with lock:
+                for key, value in counts.items():
+                    results[key] += value
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+
+        start = time.perf_counter()
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'Записано: {results["booked"]}, отклонено: {results["rejected"]}, '
+                          f'ошибок: {results["errors"]} за {elapsed:.2f} с')
+        self.stdout.write(f'Записей в секунду: {results["booked"] / elapsed:.1f}, '
+                          f'попыток в секунду: {sum(results.values()) / elapsed:.1f}')
+
+        overbooked = self.overbookings(hall, employees, day)
+
+        if overbooked:
+            self.stdout.write(self.style.ERROR(f'Переполнений: {len(overbooked)}'))
+
+            for line in overbooked:
+                self.stdout.write(f'  {line}')
+        else:
+            self.stdout.write(self.style.SUCCESS('Переполнений нет'))
+
+    def seed(self, options):
+        hall = Hall.objects.create(name='Зал для нагрузочного теста', description='', capacity=options['capacity'],
+                                   location='', start_time=dt_time(9), end_time=dt_time(12))
+        service = Service.objects.create(name='Услуга для нагрузочного теста', description='', price=500,
+                                         duration=dt_time(0, 30))
+
+        employees = []
+
+        for index in range(options['employees']):
+            employee = Employee.objects.create(
+                user=User.objects.create_user(f'employee_{index}', first_name='Мастер', last_name=str(index)),
+                position='Барбер')
+            employee.halls.add(hall)
+            employee.services.add(service)
+            employees.append(employee)
+
+        clients = [Client.objects.create(user=User.objects.create_user(f'client_{index}'))
+                   for index in range(options['threads'])]
+
+        return hall, service, employees, clients
+
+    # Одна попытка записи: результат 'booked', 'rejected' (время занято) или 'errors' (база занята)
+    def book(self, visit, no_lock):
+        try:
+            if no_lock:
+                if not is_slot_available(visit.hall, visit.employee, visit.service, visit.date, visit.time):
+                    return 'rejected'
+
+                visit.save()
+            else:
+                save_booking(visit)
+        except ValidationError:
+            return 'rejected'
+        except OperationalError:
+            return 'errors'
+
+        return 'booked'
+
+    # Нарушения после теста: загрузка зала выше вместимости и пересекающиеся визиты одного сотрудника
+    def overbookings(self, hall, employees, day):
+        problems = []
+        visits = Visit.objects.filter(hall=hall, date=day)
+
+        intervals = list(visits.values_list('start_minute', 'end_minute'))
+
+        for start, end, count in concurrency_profile(intervals):
+            if count > hall.capacity:
+                problems.append(f'зал: {minutes_to_str(start)}-{minutes_to_str(end)} - {count} визитов')
+
+        for employee in employees:
+            for start, end, count in concurrency_profile(
+                    list(visits.filter(employee=employee).values_list('start_minute', 'end_minute'))):
+                if count > 1:
+                    problems.append(f'{employee}: {minutes_to_str(start)}-{minutes_to_str(end)} - {count} визитов')
+
+        return problems
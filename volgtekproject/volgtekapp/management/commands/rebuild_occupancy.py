@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from volgtekapp.models import HallDayOccupancy, Visit
+from volgtekapp.occupancy import apply_interval, empty_counters, unpack_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает загрузку залов по дням (HallDayOccupancy) по визитам или сверяет её с визитами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сверить сохранённую загрузку, ничего не меняя')
+
+    def handle(self, *args, **options):
+        expected = self.build_from_visits()
+
+        if options['verify']:
+            self.verify(expected)
+            return
+
+        # Полная перестройка в одной транзакции
+        with transaction.atomic():
+            HallDayOccupancy.objects.all().delete()
+            HallDayOccupancy.objects.bulk_create(
+                (HallDayOccupancy(hall_id=hall_id, date=date, counters=counters.tobytes())
+                 for (hall_id, date), counters in expected.items()), batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитана загрузка для {len(expected)} дней'))
+
+    # Счётчики по всем визитам: {(зал, дата): array('H')}, визиты читаются одним потоковым запросом
+    def build_from_visits(self):
+        expected = {}
+
+        visits = Visit.objects.filter(hall__isnull=False).values_list(
+            'hall_id', 'date', 'start_minute', 'end_minute').iterator(chunk_size=2000)
+
+        for hall_id, date, start, end in visits:
+            counters = expected.setdefault((hall_id, date), empty_counters())
+            apply_interval(counters, start, end, 1)
+
+        return expected
+
+    def verify(self, expected):
+        mismatches = 0
+        stored_days = set()
+
+        for hall_id, date, counters in HallDayOccupancy.objects.values_list('hall_id', 'date', 'counters').iterator():
+            stored_days.add((hall_id, date))
+            stored = unpack_counters(counters)
+
+            if stored != expected.get((hall_id, date), empty_counters()):
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'Расхождение: зал {hall_id}, дата {date}'))
+
+        for hall_id, date in expected.keys() - stored_days:
+            mismatches += 1
+            self.stdout.write(self.style.WARNING(f'Нет загрузки: зал {hall_id}, дата {date}'))
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'Найдено расхождений: {mismatches}. '
+                                               f'Запустите команду без --verify для пересчёта'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Загрузка залов совпадает с визитами'))
@@ -0,0 +1,68 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from volgtekapp.models import DailyRollup
+from volgtekapp.rollups import build_rollups
+
+# Поля, по которым сверяются сохранённые и пересчитанные итоги
+ROLLUP_VALUES = ('visit_count', 'done_count', 'booked_minutes', 'revenue', 'done_revenue')
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные итоги по визитам (DailyRollup) или сверяет их с визитами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat, help='Начало периода (YYYY-MM-DD)')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='Конец периода (YYYY-MM-DD)')
+        parser.add_argument('--verify', action='store_true', help='Только сверить сохранённые итоги, ничего не меняя')
+
+    def handle(self, *args, **options):
+        date_from, date_to = options['date_from'], options['date_to']
+        expected = build_rollups(date_from, date_to)
+
+        stored = DailyRollup.objects.all()
+
+        if date_from:
+            stored = stored.filter(date__gte=date_from)
+
+        if date_to:
+            stored = stored.filter(date__lte=date_to)
+
+        if options['verify']:
+            self.verify(stored, expected)
+            return
+
+        # Замена итогов периода в одной транзакции
+        with transaction.atomic():
+            stored.delete()
+            DailyRollup.objects.bulk_create(expected, batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано итогов: {len(expected)}'))
+
+    def verify(self, stored, expected):
+        def key(rollup):
+            return rollup.date, rollup.hall_id, rollup.employee_id, rollup.service_id
+
+        def values(rollup):
+            return [getattr(rollup, field) for field in ROLLUP_VALUES]
+
+        expected = {key(rollup): values(rollup) for rollup in expected}
+        mismatches = 0
+
+        for rollup in stored.iterator():
+            if values(rollup) != expected.pop(key(rollup), None):
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'Расхождение: {rollup}'))
+
+        for rollup_date, hall_id, employee_id, service_id in expected:
+            mismatches += 1
+            self.stdout.write(self.style.WARNING(
+                f'Нет итога: {rollup_date}, зал {hall_id}, сотрудник {employee_id}, услуга {service_id}'))
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'Найдено расхождений: {mismatches}. '
+                                               f'Запустите команду без --verify для пересчёта'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Дневные итоги совпадают с визитами'))
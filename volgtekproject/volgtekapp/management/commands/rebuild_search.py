@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from volgtekapp.models import EmployeeSearchToken
+from volgtekapp.search import rebuild_search_tokens
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковый индекс сотрудников (EmployeeSearchToken) по их данным, услугам и залам'
+
+    def handle(self, *args, **options):
+        rebuild_search_tokens()
+
+        self.stdout.write(self.style.SUCCESS(f'Слов в поисковом индексе: {EmployeeSearchToken.objects.count()}'))
@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Замер выполняется в отдельном чистом процессе, как при запуске воркера: в текущем процессе
+# Django и приложение уже загружены. Скрипт печатает JSON с временами этапов в миллисекундах
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls = time.perf_counter()
+print(json.dumps({
+    'setup': (setup - start) * 1000,
+    'urls': (urls - setup) * 1000,
+    'heavy': [name for name in HEAVY_MODULES if name in sys.modules],
+}))
+'''
+
+HEAVY_MODULES = ('numpy', 'pandas')  # Модули, которые не должны загружаться при старте
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время холодного старта воркера: импорт Django и приложений, загрузку URLconf'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Число запусков (выводится медиана)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Сколько самых медленных модулей показать (по данным python -X importtime)')
+
+    def handle(self, *args, **options):
+        runs = [json.loads(self.run_probe().stdout) for _ in range(options['repeat'])]
+
+        setup = statistics.median(run['setup'] for run in runs)
+        urls = statistics.median(run['urls'] for run in runs)
+
+        self.stdout.write(f'Импорт и django.setup(): {setup:.1f} мс')
+        self.stdout.write(f'Загрузка URLconf: {urls:.1f} мс')
+        self.stdout.write(f'Всего: {setup + urls:.1f} мс (медиана по {len(runs)} запускам)')
+
+        heavy = runs[0]['heavy']
+
+        if heavy:
+            self.stdout.write(self.style.WARNING(f'При старте загружены тяжёлые модули: {", ".join(heavy)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Тяжёлые модули при старте не загружаются'))
+
+        if options['top']:
+            self.stdout.write('Самые медленные модули (накопительно):')
+
+            for cumulative, name in self.slowest_modules(options['top']):
+                self.stdout.write(f'  {cumulative / 1000:8.1f} мс  {name}')
+
+    # Запуск замера в новом интерпретаторе с теми же настройками
+    def run_probe(self, *flags):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'volgtekproject.settings')
+        probe = f'HEAVY_MODULES = {HEAVY_MODULES!r}\n{PROBE}'
+
+        return subprocess.run([sys.executable, *flags, '-c', probe], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True, check=True)
+
+    # Модули верхнего уровня с наибольшим накопительным временем импорта: [(микросекунды, имя)]
+    def slowest_modules(self, top):
+        modules = []
+
+        # Строки вида "import time:   self |   cumulative | module"; вложенные импорты сдвинуты на два пробела
+        for line in self.run_probe('-X', 'importtime').stderr.splitlines():
+            parts = line.removeprefix('import time:').split('|')
+
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue  # Заголовок
+
+            name = parts[2].rstrip()
+
+            if len(name) - len(name.lstrip()) == 1:  # Отступ в один пробел - импорт верхнего уровня
+                modules.append((int(parts[1]), name.strip()))
+
+        return sorted(modules, reverse=True)[:top]
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from volgtekapp.time_slots import update_status_visits
+
+
+class Command(BaseCommand):
+    help = 'Переводит наступившие визиты из статуса «Запланирована» в «Выполнена» (для cron или фонового воркера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, запускаясь каждые --interval секунд')
+        parser.add_argument('--interval', type=int, default=60, help='Пауза между запусками в режиме --loop (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = update_status_visits()
+            self.stdout.write(f'Обновлено визитов: {updated}')
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:27
+
+from array import array
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Начальное заполнение загрузки залов по уже существующим визитам
+def fill_occupancy(apps, schema_editor):
+    Visit = apps.get_model('volgtekapp', 'Visit')
+    HallDayOccupancy = apps.get_model('volgtekapp', 'HallDayOccupancy')
+
+    days = {}
+
+    for hall_id, date, time, duration in Visit.objects.filter(hall__isnull=False).values_list(
+            'hall_id', 'date', 'time', 'service__duration').iterator():
+        counters = days.setdefault((hall_id, date), array('H', bytes(2 * 24 * 60)))
+        start = time.hour * 60 + time.minute
+
+        for minute in range(start, min(start + duration.hour * 60 + duration.minute, 24 * 60)):
+            counters[minute] += 1
+
+    HallDayOccupancy.objects.bulk_create(
+        HallDayOccupancy(hall_id=hall_id, date=date, counters=counters.tobytes())
+        for (hall_id, date), counters in days.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0017_alter_visit_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HallDayOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('counters', models.BinaryField()),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='volgtekapp.hall')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hall', 'date'), name='unique_hall_day_occupancy')],
+            },
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0018_halldayoccupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hall',
+            name='slot_step',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+STATUS_CODES = {'Запланирована': 0, 'Выполнена': 1}
+
+
+# Перенос строковых статусов в числовые коды
+def forwards(apps, schema_editor):
+    Visit = apps.get_model('volgtekapp', 'Visit')
+
+    for label, code in STATUS_CODES.items():
+        Visit.objects.filter(status=label).update(status_code=code)
+
+
+def backwards(apps, schema_editor):
+    Visit = apps.get_model('volgtekapp', 'Visit')
+
+    for label, code in STATUS_CODES.items():
+        Visit.objects.filter(status_code=code).update(status=label)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0019_hall_slot_step'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Запланирована'), (1, 'Выполнена')], default=0),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='visit',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='visit',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='visit',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Запланирована'), (1, 'Выполнена')], db_index=True, default=0),
+        ),
+    ]
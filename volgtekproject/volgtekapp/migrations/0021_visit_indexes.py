@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0020_visit_status_choices'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visit',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Запланирована'), (1, 'Выполнена')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['hall', 'date', 'time'], name='visit_hall_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['employee', 'date', 'time'], name='visit_employee_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['client', 'date', 'time'], name='visit_client_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['status', 'date', 'time'], name='visit_status_date_time_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+# Заполнение длительности услуг в минутах и интервалов существующих визитов
+def fill_minutes(apps, schema_editor):
+    Service = apps.get_model('volgtekapp', 'Service')
+    Visit = apps.get_model('volgtekapp', 'Visit')
+
+    for service in Service.objects.all():
+        service.duration_minutes = service.duration.hour * 60 + service.duration.minute
+        service.save(update_fields=['duration_minutes'])
+
+    visits = []
+
+    for visit in Visit.objects.select_related('service').only('time', 'service__duration_minutes').iterator():
+        visit.start_minute = visit.time.hour * 60 + visit.time.minute
+        visit.end_minute = visit.start_minute + visit.service.duration_minutes
+        visits.append(visit)
+
+    Visit.objects.bulk_update(visits, ['start_minute', 'end_minute'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0021_visit_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='visit',
+            name='visit_hall_date_time_idx',
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='end_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_minutes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['hall', 'date', 'start_minute', 'end_minute'], name='visit_hall_overlap_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['employee', 'date', 'start_minute', 'end_minute'], name='visit_employee_overlap_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0022_visit_minutes_service_duration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date', 'time'], name='visit_date_time_idx'),
+        ),
+    ]
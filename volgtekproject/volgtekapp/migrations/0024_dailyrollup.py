@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+# Начальное заполнение дневных итогов по существующим визитам
+def fill_rollups(apps, schema_editor):
+    Visit = apps.get_model('volgtekapp', 'Visit')
+    DailyRollup = apps.get_model('volgtekapp', 'DailyRollup')
+
+    groups = Visit.objects.values('date', 'hall_id', 'employee_id', 'service_id', 'service__duration_minutes',
+                                  'service__price').annotate(
+        visits=Count('id'), done=Count('id', filter=Q(status=1))).order_by()
+
+    DailyRollup.objects.bulk_create((
+        DailyRollup(date=group['date'], hall_id=group['hall_id'], employee_id=group['employee_id'],
+                    service_id=group['service_id'], visit_count=group['visits'], done_count=group['done'],
+                    booked_minutes=group['visits'] * group['service__duration_minutes'],
+                    revenue=group['visits'] * group['service__price'],
+                    done_revenue=group['done'] * group['service__price'])
+        for group in groups), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0023_visit_date_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('visit_count', models.PositiveIntegerField(default=0)),
+                ('done_count', models.PositiveIntegerField(default=0)),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('done_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='volgtekapp.employee')),
+                ('hall', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='volgtekapp.hall')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='volgtekapp.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'hall', 'employee', 'service'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
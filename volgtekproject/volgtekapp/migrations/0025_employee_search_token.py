@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:50
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Начальное заполнение поискового индекса по существующим сотрудникам (веса и нормализация - как в search.py)
+def fill_search_tokens(apps, schema_editor):
+    Employee = apps.get_model('volgtekapp', 'Employee')
+    EmployeeSearchToken = apps.get_model('volgtekapp', 'EmployeeSearchToken')
+
+    def words(text):
+        return [word[:64] for word in re.findall(r'\w+', (text or '').lower().replace('ё', 'е'))]
+
+    tokens = []
+
+    for employee in Employee.objects.select_related('user').prefetch_related('services', 'halls'):
+        weights = {}
+        parts = [(employee.user.first_name, 4), (employee.user.last_name, 4), (employee.position, 3),
+                 *((service.name, 2) for service in employee.services.all()),
+                 *((hall.name, 1) for hall in employee.halls.all())]
+
+        for text, weight in parts:
+            for word in words(text):
+                weights[word] = max(weight, weights.get(word, 0))
+
+        tokens.extend(EmployeeSearchToken(employee_id=employee.id, token=token, weight=weight)
+                      for token, weight in weights.items())
+
+    EmployeeSearchToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0024_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='volgtekapp.employee')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('token', 'employee'), name='unique_employee_search_token')],
+            },
+        ),
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
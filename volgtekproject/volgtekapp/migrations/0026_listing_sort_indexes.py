@@ -0,0 +1,53 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Заполнение ключа сортировки для существующих сотрудников
+def fill_sort_name(apps, schema_editor):
+    Employee = apps.get_model('volgtekapp', 'Employee')
+
+    employees = list(Employee.objects.select_related('user'))
+
+    for employee in employees:
+        employee.sort_name = f"{employee.user.last_name} {employee.user.first_name}".lower()
+
+    Employee.objects.bulk_update(employees, ['sort_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0025_employee_search_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='sort_name',
+            field=models.CharField(default='', editable=False, max_length=301),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['sort_name', 'id'], name='employee_sort_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hall',
+            index=models.Index(fields=['name', 'id'], name='hall_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['name', 'id'], name='service_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price', 'id'], name='service_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['duration_minutes', 'id'], name='service_duration_idx'),
+        ),
+        migrations.RunPython(fill_sort_name, migrations.RunPython.noop),
+    ]
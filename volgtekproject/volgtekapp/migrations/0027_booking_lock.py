@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0026_listing_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
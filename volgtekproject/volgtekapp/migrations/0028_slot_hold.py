@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0027_booking_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_minute', models.PositiveSmallIntegerField()),
+                ('end_minute', models.PositiveSmallIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='slot_hold', to='volgtekapp.client')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='volgtekapp.employee')),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='volgtekapp.hall')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hall', 'date', 'start_minute', 'end_minute'], name='slothold_hall_overlap_idx'), models.Index(fields=['employee', 'date', 'start_minute', 'end_minute'], name='slothold_employee_overlap_idx'), models.Index(fields=['expires_at'], name='slothold_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+# Перед добавлением уникальности (услуга, зал) сливаем дубли: остаётся строка с наименьшим id,
+# связи сотрудников с дублями переносятся на неё (без повторов), дубли удаляются
+def merge_duplicate_service_halls(apps, schema_editor):
+    ServiceHall = apps.get_model('volgtekapp', 'ServiceHall')
+    Employee = apps.get_model('volgtekapp', 'Employee')
+    through = Employee.service_halls.through
+
+    kept = {}  # {(услуга, зал): id оставляемой строки}
+    duplicates = {}  # {id дубля: id оставляемой строки}
+
+    for service_hall_id, service_id, hall_id in ServiceHall.objects.order_by('id').values_list(
+            'id', 'service_id', 'hall_id'):
+        if (service_id, hall_id) in kept:
+            duplicates[service_hall_id] = kept[(service_id, hall_id)]
+        else:
+            kept[(service_id, hall_id)] = service_hall_id
+
+    if not duplicates:
+        return
+
+    existing = set(through.objects.filter(servicehall_id__in=set(duplicates.values())).values_list(
+        'employee_id', 'servicehall_id'))
+    moved = {(employee_id, duplicates[service_hall_id]) for employee_id, service_hall_id in
+             through.objects.filter(servicehall_id__in=duplicates).values_list('employee_id', 'servicehall_id')}
+
+    through.objects.bulk_create([through(employee_id=employee_id, servicehall_id=service_hall_id)
+                                 for employee_id, service_hall_id in moved - existing], batch_size=500)
+
+    ServiceHall.objects.filter(id__in=duplicates).delete()  # Связи с дублями удаляются каскадом
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0029_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_service_halls, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='servicehall',
+            constraint=models.UniqueConstraint(fields=('service', 'hall'), name='unique_service_hall'),
+        ),
+    ]
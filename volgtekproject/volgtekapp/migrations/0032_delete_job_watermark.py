@@ -0,0 +1,16 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volgtekapp', '0031_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='JobWatermark',
+        ),
+    ]
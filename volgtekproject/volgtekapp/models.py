@@ -1,8 +1,12 @@
+from datetime import datetime
+
 from django.contrib.auth.models import User
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils.timezone import now
 
+from .formats import format_date
+
 
 # Create your models here.
 
@@ -19,6 +23,14 @@ class Hall(models.Model):
 
     end_time = models.TimeField()  # Конец рабочего дня
 
+    # Шаг сетки начала записи в минутах (пусто - общая настройка SLOT_STEP_MINUTES или длительность услуги)
+    slot_step = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='hall_name_idx'),  # Список залов по названию
+        ]
+
     def __str__(self):
         return self.name
 
@@ -49,6 +61,24 @@ class Service(models.Model):
 
     duration = models.TimeField()  # Длительность услуги
 
+    # Длительность в минутах - настоящая длительность, вычисляется из duration при сохранении.
+    # По ней считается конец визитов (Visit.end_minute) без чтения времени услуги
+    duration_minutes = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        """Метод сохранения услуги с пересчётом длительности в минутах."""
+        self.duration_minutes = self.duration.hour * 60 + self.duration.minute
+
+        super(Service, self).save(*args, **kwargs)
+
+    class Meta:
+        # Сортировки списка услуг (по названию, цене и длительности), последнее поле - для курсора
+        indexes = [
+            models.Index(fields=['name', 'id'], name='service_name_idx'),
+            models.Index(fields=['price', 'id'], name='service_price_idx'),
+            models.Index(fields=['duration_minutes', 'id'], name='service_duration_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -68,26 +98,45 @@ class Employee(models.Model):
     # Дополнительная модель для связи услуги с залом
     service_halls = models.ManyToManyField('ServiceHall', related_name='employees')
 
+    # Фамилия и имя пользователя в нижнем регистре для сортировки списков сотрудников по индексу.
+    # Заполняется при сохранении сотрудника и обновляется сигналом при изменении имени пользователя
+    sort_name = models.CharField(max_length=301, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sort_name', 'id'], name='employee_sort_name_idx'),  # Список сотрудников по фамилии
+        ]
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
-    def save(self, *args, **kwargs):
-        """Метод сохранения сотрудника и связи с услугами и залами."""
+    @staticmethod
+    def make_sort_name(user):
+        return f"{user.last_name} {user.first_name}".lower()
+
+    def hall_for(self, service):
+        """Зал, в котором сотрудник оказывает услугу (первый, если таких залов несколько), или None."""
+        service_hall = self.service_halls.select_related('hall').filter(service=service).first()
 
-        super().save(*args, **kwargs)  # Сначала сохраняем сотрудника
+        return service_hall.hall if service_hall else None
 
-        # Логика автоматического заполнения service_halls
-        for hall in self.halls.all():
-            for service in self.services.all():
-                service_hall, created = ServiceHall.objects.get_or_create(service=service,
-                                                                          hall=hall)  # Проверяем, существует ли связь между Hall и Service. Если такой записи в ServiceHall нет, то создаём.
-                self.service_halls.add(service_hall)
+    def save(self, *args, **kwargs):
+        """Метод сохранения сотрудника с ключом сортировки. Связи service_halls заполняются сигналом
+        при изменении залов и услуг (service_halls.py), то есть уже после save_m2m() формы."""
+        self.sort_name = self.make_sort_name(self.user)
+
+        super().save(*args, **kwargs)
 
 
 class ServiceHall(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE)  # Услуга
     hall = models.ForeignKey(Hall, on_delete=models.CASCADE)  # Зал
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'hall'], name='unique_service_hall'),  # Одна строка на пару
+        ]
+
     def __str__(self):
         return f"{self.service.name} - {self.hall.name}"
 
@@ -103,23 +152,218 @@ class Visit(models.Model):
 
     time = models.TimeField() # Время визита, строка в формате HH:MM
 
-    status = models.CharField(max_length=255, choices=[
-        ('Запланирована', 'Запланирована'),
-        ('Выполнена', 'Выполнена'),
-    ], default='Запланирована')  # Статус
+    # Статус визита. Хранится числом и входит в индекс (status, date, time), чтобы фоновое обновление
+    # статусов не сканировало таблицу
+    class Status(models.IntegerChoices):
+        PLANNED = 0, 'Запланирована'
+        DONE = 1, 'Выполнена'
+
+    status = models.PositiveSmallIntegerField(choices=Status.choices, default=Status.PLANNED)  # Статус
 
     # Автоматически выбираем зал в зависимости от услуги и мастера
     hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='visits', null=True, blank=True)
 
+    # Начало и конец визита в минутах от начала суток, [start_minute, end_minute). Заполняются в save(),
+    # чтобы пересечение с интервалом [a, b) проверялось в базе одним запросом по индексу:
+    # start_minute < b AND end_minute > a
+    start_minute = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    end_minute = models.PositiveSmallIntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
-        """Метод сохранения визита и автоматического выбора зала."""
+        """Метод сохранения визита, автоматического выбора зала и расчёта интервала визита."""
         if not self.hall:
-            service_hall = self.employee.service_halls.get(service=self.service)
-            self.hall = service_hall.hall
+            self.hall = self.employee.hall_for(self.service)  # Тот же зал, что и при расчёте свободного времени
 
+        if isinstance(self.time, str):
+            self.time = datetime.strptime(self.time[:5], '%H:%M').time()  # Время из формы приходит строкой
 
+        self.start_minute = self.time.hour * 60 + self.time.minute
+        self.end_minute = self.start_minute + self.service.duration_minutes
 
         super(Visit, self).save(*args, **kwargs) # Сохраняем визит
 
+    # Составные индексы под основные запросы: расчёт свободного времени (зал/сотрудник + дата),
+    # пересечение интервалов, списки визитов с keyset-пагинацией по (date, time, id)
+    # и фоновое обновление статусов. Проверяются тестами в tests.py
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee', 'date', 'time'], name='visit_employee_date_time_idx'),
+            models.Index(fields=['hall', 'date', 'start_minute', 'end_minute'], name='visit_hall_overlap_idx'),
+            models.Index(fields=['employee', 'date', 'start_minute', 'end_minute'], name='visit_employee_overlap_idx'),
+            models.Index(fields=['client', 'date', 'time'], name='visit_client_date_time_idx'),
+            models.Index(fields=['status', 'date', 'time'], name='visit_status_date_time_idx'),
+            models.Index(fields=['date', 'time'], name='visit_date_time_idx'),  # Список всех визитов (администратор)
+        ]
+
+    @property
+    def is_planned(self):
+        return self.status == self.Status.PLANNED
+
+    # Дата и время начала визита для списков: "05 марта 2025 10:00"
+    def start_display(self):
+        return f"{format_date(self.date)} {self.time.strftime('%H:%M')}"
+
     def __str__(self):
         return f"{self.client} - {self.service.name} с {self.employee}"
+
+
+class HallDayOccupancy(models.Model):
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='occupancy')  # Зал
+
+    date = models.DateField()  # Дата
+
+    # Число одновременных визитов на каждую минуту суток, упакованное как array('H')
+    counters = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hall', 'date'], name='unique_hall_day_occupancy'),
+        ]
+
+    def __str__(self):
+        return f"{self.hall} - {self.date}"
+
+
+# Дневные итоги по визитам для отчётов: одна строка на (дата, зал, сотрудник, услуга).
+# Обновляются инкрементально сигналами визитов и фоновым обновлением статусов (rollups.py),
+# пересчитываются с нуля командой rebuild_rollups
+class DailyRollup(models.Model):
+    date = models.DateField()  # Дата
+
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='rollups', null=True, blank=True)  # Зал
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='rollups')  # Сотрудник
+
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='rollups')  # Услуга
+
+    visit_count = models.PositiveIntegerField(default=0)  # Число визитов
+
+    done_count = models.PositiveIntegerField(default=0)  # Из них выполненных
+
+    booked_minutes = models.PositiveIntegerField(default=0)  # Занятое время мастера в минутах
+
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)  # Стоимость всех визитов
+
+    done_revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)  # Стоимость выполненных визитов
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hall', 'employee', 'service'], name='unique_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.hall} - {self.employee} - {self.service}"
+
+
+# Поисковый индекс сотрудников: нормализованные слова имени, должности, услуг и залов с весом поля.
+# Поддерживается сигналами (search.py), пересчитывается командой rebuild_search
+class EmployeeSearchToken(models.Model):
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='search_tokens')  # Сотрудник
+
+    token = models.CharField(max_length=64)  # Слово в нижнем регистре, ё заменена на е
+
+    weight = models.PositiveSmallIntegerField(default=1)  # Вес поля, из которого взято слово
+
+    class Meta:
+        constraints = [
+            # Индекс (token, employee) обслуживает поиск по префиксу диапазоном
+            # token >= префикс AND token < префикс + '\U0010ffff'
+            models.UniqueConstraint(fields=['token', 'employee'], name='unique_employee_search_token'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee} - {self.token}"
+
+
+# Строки блокировок записи: одна на ключ "hall:<зал>:<дата>" или "employee:<сотрудник>:<дата>".
+# Бронирование начинает транзакцию с UPDATE своих строк (booking.py), поэтому параллельные записи
+# в один зал или к одному мастеру на одну дату выполняются по очереди
+class BookingLock(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # Зал или сотрудник и дата
+
+    version = models.PositiveBigIntegerField(default=0)  # Число захватов блокировки
+
+    def __str__(self):
+        return self.key
+
+
+# Версии кэша свободного времени (slot_cache.py): одна строка на зал, день зала или день сотрудника,
+# и версия фрагментов шаблонов (fragment_cache.py). Хранятся в базе, а не в кэше: увеличение атомарно
+# (UPDATE ... version + 1), а версию не вытеснит переполнение кэша - иначе она вернулась бы к нулю
+# и снова нашлись бы старые слоты или фрагменты
+class SlotCacheVersion(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # Зал, день зала, день сотрудника или фрагменты
+
+    version = models.PositiveBigIntegerField(default=0)  # Номер версии
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+# Временное удержание слота, пока клиент оформляет запись: выбранное время считается занятым для остальных
+# до expires_at. У клиента одно удержание - выбор другого времени его заменяет, запись визита его снимает.
+# Истёкшие удержания не учитываются при расчёте и удаляются пачкой фоновой задачей (expire_slot_holds)
+class SlotHold(models.Model):
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, related_name='slot_hold')  # Клиент
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='slot_holds')  # Сотрудник
+
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='slot_holds')  # Зал
+
+    date = models.DateField()  # Дата
+
+    start_minute = models.PositiveSmallIntegerField()  # Начало удерживаемого интервала в минутах от начала суток
+
+    end_minute = models.PositiveSmallIntegerField()  # Конец удерживаемого интервала
+
+    expires_at = models.DateTimeField()  # Время, после которого удержание не действует
+
+    # Индексы под пересечение интервалов (как у визитов) и пакетное удаление истёкших удержаний
+    class Meta:
+        indexes = [
+            models.Index(fields=['hall', 'date', 'start_minute', 'end_minute'], name='slothold_hall_overlap_idx'),
+            models.Index(fields=['employee', 'date', 'start_minute', 'end_minute'],
+                         name='slothold_employee_overlap_idx'),
+            models.Index(fields=['expires_at'], name='slothold_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.hall} {self.date} до {self.expires_at}"
+
+
+# Ключ идемпотентности записи: повторная отправка той же формы или запроса с тем же ключом возвращает уже
+# созданный визит. Ключ - UUID (16 байт), уникален в пределах клиента; записи старше IDEMPOTENCY_KEY_MINUTES
+# не учитываются и удаляются фоновой задачей (expire_idempotency_keys)
+class IdempotencyKey(models.Model):
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='idempotency_keys')  # Клиент
+
+    key = models.UUIDField()  # Ключ, сгенерированный формой или приложением клиента
+
+    visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name='idempotency_keys')  # Созданный визит
+
+    created_at = models.DateTimeField(default=now)  # Время первой успешной записи по ключу
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'key'], name='unique_client_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),  # Удаление устаревших ключей
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.key}"
+
+
+# Контрольная точка импорта (manage.py import_catalog): сколько строк файла уже обработано. Обновляется
+# в одной транзакции с пачкой строк, поэтому --resume продолжает ровно с первой незафиксированной строки
+class ImportCheckpoint(models.Model):
+    name = models.CharField(max_length=512, unique=True)  # Вид данных и полный путь к файлу
+
+    rows = models.PositiveBigIntegerField(default=0)  # Обработано строк файла
+
+    updated_at = models.DateTimeField(auto_now=True)  # Время последней зафиксированной пачки
+
+    def __str__(self):
+        return f"{self.name}: {self.rows}"
@@ -0,0 +1,132 @@
+from array import array
+
+from django.db import transaction
+
+from .models import HallDayOccupancy
+
+
+# Материализованная загрузка залов.
+#
+# Для каждой пары (зал, дата) хранится массив из 1440 счётчиков - число одновременных визитов
+# на каждую минуту суток (array('H'), около 3 КБ). Массив обновляется инкрементально при
+# сохранении и удалении визита, а поиск свободных слотов сводится к векторному проходу
+# скользящим максимумом по небольшому массиву без загрузки самих визитов.
+#
+# NumPy импортируется внутри функций, которые его используют: модуль подключается при старте
+# приложения (через сигналы), и импорт NumPy не должен замедлять запуск каждого воркера.
+
+MINUTES_PER_DAY = 24 * 60
+
+
+# Пустой массив счётчиков на сутки
+def empty_counters():
+    return array('H', bytes(2 * MINUTES_PER_DAY))
+
+
+# Распаковка счётчиков из BinaryField
+def unpack_counters(data):
+    counters = array('H')
+    counters.frombytes(bytes(data))
+
+    return counters
+
+
+# Добавление (delta=1) или снятие (delta=-1) интервала [start, end) в массиве счётчиков
+def apply_interval(counters, start, end, delta):
+    for minute in range(max(start, 0), min(end, MINUTES_PER_DAY)):
+        counters[minute] = max(counters[minute] + delta, 0)
+
+
+# Счётчики, построенные с нуля по интервалам визитов
+def build_counters(intervals):
+    counters = empty_counters()
+
+    for start, end in intervals:
+        apply_interval(counters, start, end, 1)
+
+    return counters
+
+
+# Инкрементальное изменение загрузки зала на дату: changes - список (начало, конец, delta)
+def update_occupancy(hall_id, date, changes):
+    with transaction.atomic():
+        occupancy = HallDayOccupancy.objects.select_for_update().filter(hall_id=hall_id, date=date).first()
+        counters = unpack_counters(occupancy.counters) if occupancy else empty_counters()
+
+        for start, end, delta in changes:
+            apply_interval(counters, start, end, delta)
+
+        if occupancy:
+            occupancy.counters = counters.tobytes()
+            occupancy.save(update_fields=['counters'])
+        else:
+            HallDayOccupancy.objects.create(hall_id=hall_id, date=date, counters=counters.tobytes())
+
+
+# Запись пересчитанных с нуля счётчиков зала на дату
+def save_counters(hall_id, date, counters):
+    HallDayOccupancy.objects.update_or_create(hall_id=hall_id, date=date, defaults={'counters': counters.tobytes()})
+
+
+# Загрузка зала за период одним запросом: {дата: np.ndarray счётчиков}
+def load_occupancy(hall, date_from, date_to):
+    import numpy as np
+
+    rows = HallDayOccupancy.objects.filter(hall=hall, date__range=(date_from, date_to)).values_list(
+        'date', 'counters')
+
+    return {date: np.frombuffer(bytes(counters), dtype=np.uint16).astype(np.int32) for date, counters in rows}
+
+
+# Загрузка нескольких залов на одну дату одним запросом: {зал: np.ndarray счётчиков}
+def load_halls_occupancy(hall_ids, date):
+    import numpy as np
+
+    rows = HallDayOccupancy.objects.filter(hall_id__in=hall_ids, date=date).values_list('hall_id', 'counters')
+
+    return {hall_id: np.frombuffer(bytes(counters), dtype=np.uint16).astype(np.int32) for hall_id, counters in rows}
+
+
+# Число интервалов, покрывающих каждую минуту суток (разностный массив по границам интервалов)
+def interval_coverage(intervals):
+    import numpy as np
+
+    bounds = np.clip(np.array(intervals, dtype=np.int64), 0, MINUTES_PER_DAY)
+    marks = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int32)
+    np.add.at(marks, bounds[:, 0], 1)
+    np.add.at(marks, bounds[:, 1], -1)
+
+    return np.cumsum(marks[:-1])
+
+
+# Векторный поиск свободных начал слотов на сетке с шагом step: скользящий максимум загрузки по окну
+# длительности услуги. blocked - интервалы, в которые слот невозможен независимо от загрузки (занятость сотрудника),
+# held - удержания слотов в зале, занимающие место так же, как визиты
+def free_starts(counters, open_start, open_end, duration, capacity, step=None, blocked=None, held=None):
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    step = step or duration
+    open_end = min(open_end, MINUTES_PER_DAY)
+
+    if open_end - open_start < duration:
+        return []
+
+    starts = np.arange(open_start, open_end - duration + 1, step)  # Кандидаты - минуты от начала суток
+
+    if counters is None and not blocked and not held:
+        return starts.tolist()  # Визитов и удержаний в этот день нет
+
+    if counters is None:
+        counters = np.zeros(MINUTES_PER_DAY, dtype=np.int32)
+
+    if held:
+        counters = counters + interval_coverage(held)
+
+    if blocked:
+        # Занятые минуты сотрудника считаются заполненным залом
+        counters = np.where(interval_coverage(blocked) > 0, capacity, counters)
+
+    peaks = sliding_window_view(counters[open_start:open_end], duration).max(axis=1)  # Пик загрузки для каждого начала
+
+    return starts[peaks[starts - open_start] < capacity].tolist()
@@ -0,0 +1,128 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# Keyset-пагинация (по курсору).
+#
+# Вместо OFFSET страница начинается с условия "после последней показанной строки" по упорядоченному
+# набору полей, заканчивающемуся уникальным id: (date, time, id) > (d, t, i). Такой запрос идёт по индексу
+# и стоит одинаково для первой и для тысячной страницы. Курсор - значения полей последней (или первой)
+# строки страницы, закодированные в строку для GET-параметра. Поле с '-' упорядочивается по убыванию
+# (условие для него - "меньше"); индекс по тем же полям SQLite читает в обратном порядке.
+
+PAGE_SIZES = (25, 50, 100, 200)  # Допустимые размеры страницы
+DEFAULT_PAGE_SIZE = 50
+
+
+# Размер страницы из GET-параметра per_page (только из списка допустимых)
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('per_page', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+
+    return page_size if page_size in PAGE_SIZES else DEFAULT_PAGE_SIZE
+
+
+# Имя поля без признака убывания
+def field_name(field):
+    return field.removeprefix('-')
+
+
+# Обратный порядок поля: 'date' <-> '-date'
+def reverse_field(field):
+    return field_name(field) if field.startswith('-') else f'-{field}'
+
+
+# Курсор строки: значения полей сортировки в виде base64(JSON)
+def encode_cursor(obj, ordering):
+    values = [str(getattr(obj, field_name(field))) for field in ordering]
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+# Значения полей сортировки из курсора (None, если курсор повреждён)
+def decode_cursor(cursor, model, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [model._meta.get_field(field_name(field)).to_python(value)
+                for field, value in zip(ordering, values, strict=True)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+# Условие "строка после курсора" в лексикографическом порядке полей (до курсора - для обратного порядка):
+# (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+def keyset_filter(ordering, values):
+    conditions = []
+
+    for index, field in enumerate(ordering):
+        equal = {field_name(previous): value for previous, value in zip(ordering[:index], values[:index])}
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        conditions.append(Q(**equal, **{f'{field_name(field)}__{lookup}': values[index]}))
+
+    return reduce(or_, conditions)
+
+
+# Страница queryset по курсору из GET-параметров after / before.
+# Возвращает словарь: objects - строки страницы, next_cursor / previous_cursor - курсоры соседних страниц
+# (None, если страницы нет), page_size - размер страницы, params / query - остальные GET-параметры
+# (сортировка, поиск) словарём и строкой для ссылок на соседние страницы
+def keyset_paginate(request, queryset, ordering=('date', 'time', 'id')):
+    page_size = get_page_size(request)
+    model = queryset.model
+
+    params = request.GET.copy()
+
+    for name in ('after', 'before', 'per_page', 'format'):
+        params.pop(name, None)
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    after_values = decode_cursor(after, model, ordering) if after else None
+    before_values = decode_cursor(before, model, ordering) if before else None
+
+    if before_values:
+        # Предыдущая страница: идём в обратном порядке от курсора и разворачиваем результат
+        reverse_ordering = [reverse_field(field) for field in ordering]
+        rows = list(queryset.filter(keyset_filter(reverse_ordering, before_values)).order_by(
+            *reverse_ordering)[:page_size + 1])
+        has_previous, has_next = len(rows) > page_size, True
+        rows = rows[:page_size][::-1]
+    else:
+        if after_values:
+            queryset = queryset.filter(keyset_filter(ordering, after_values))
+
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_previous, has_next = bool(after_values), len(rows) > page_size
+        rows = rows[:page_size]
+
+    return {
+        'objects': rows,
+        'next_cursor': encode_cursor(rows[-1], ordering) if rows and has_next else None,
+        'previous_cursor': encode_cursor(rows[0], ordering) if rows and has_previous else None,
+        'page_size': page_size,
+        'page_sizes': PAGE_SIZES,
+        'params': params.dict(),
+        'query': params.urlencode(),
+    }
+
+
+# Страница с выбором сортировки из GET-параметра sort. sorts - {значение sort: (подпись, поля порядка)},
+# первый вариант - по умолчанию. К результату keyset_paginate добавляются sort и sorts [(значение, подпись)]
+def sorted_paginate(request, queryset, sorts):
+    sort = request.GET.get('sort')
+
+    if sort not in sorts:
+        sort = next(iter(sorts))
+
+    page = keyset_paginate(request, queryset, sorts[sort][1])
+    page['sort'] = sort
+    page['sorts'] = [(value, label) for value, (label, ordering) in sorts.items()]
+
+    return page
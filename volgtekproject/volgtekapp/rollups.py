@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import DailyRollup, Service, Visit
+
+# Дневные итоги (DailyRollup) для отчётов.
+#
+# Ключ итога - (дата, зал, сотрудник, услуга). Изменение визита превращается в приращения
+# числа визитов и выполненных визитов по ключам; минуты и выручка считаются из длительности и цены услуги,
+# поэтому для всех визитов ключа они равны числу визитов, умноженному на значение услуги.
+# Приращения записываются атомарно через F(), без чтения и перезаписи счётчиков.
+
+
+# Ключ итога для визита
+def rollup_key(visit):
+    return visit.date, visit.hall_id, visit.employee_id, visit.service_id
+
+
+# Применение приращений: changes - {ключ: [изменение числа визитов, изменение числа выполненных]}
+def apply_changes(changes):
+    changes = {key: delta for key, delta in changes.items() if any(delta)}
+
+    if not changes:
+        return
+
+    services = {service_id: (minutes, price) for service_id, minutes, price in Service.objects.filter(
+        id__in={key[3] for key in changes}).values_list('id', 'duration_minutes', 'price')}
+
+    with transaction.atomic():
+        for (date, hall_id, employee_id, service_id), (visits, done) in changes.items():
+            minutes, price = services.get(service_id, (0, 0))
+            rollup = DailyRollup.objects.filter(date=date, hall_id=hall_id, employee_id=employee_id,
+                                                service_id=service_id)
+
+            # Строка создаётся только при добавлении визита. При каскадном удалении услуги, сотрудника
+            # или зала их итоги удаляются раньше визитов, и вычитать уже нечего
+            if visits > 0:
+                DailyRollup.objects.get_or_create(date=date, hall_id=hall_id, employee_id=employee_id,
+                                                  service_id=service_id)
+
+            rollup.update(
+                visit_count=F('visit_count') + visits,
+                done_count=F('done_count') + done,
+                booked_minutes=F('booked_minutes') + visits * minutes,
+                revenue=F('revenue') + visits * price,
+                done_revenue=F('done_revenue') + done * price,
+            )
+
+            rollup.filter(visit_count=0).delete()  # Пустые итоги не храним
+
+
+# Визит создан, изменён или удалён. previous - (ключ, статус) до изменения или None для нового визита,
+# visit - сохранённый визит или None для удалённого
+def record_visit_change(previous, visit):
+    changes = {}
+
+    if previous:
+        key, status = previous
+        delta = changes.setdefault(key, [0, 0])
+        delta[0] -= 1
+        delta[1] -= status == Visit.Status.DONE
+
+    if visit:
+        delta = changes.setdefault(rollup_key(visit), [0, 0])
+        delta[0] += 1
+        delta[1] += visit.status == Visit.Status.DONE
+
+    apply_changes(changes)
+
+
+# Визиты помечены выполненными массовым update() (сигналы не вызываются).
+# groups - строки values('date', 'hall_id', 'employee_id', 'service_id') с числом визитов count
+def record_visits_done(groups):
+    apply_changes({(group['date'], group['hall_id'], group['employee_id'], group['service_id']): [0, group['count']]
+                   for group in groups})
+
+
+# Изменились цена или длительность услуги: пересчитываем минуты и выручку её итогов по числу визитов
+def refresh_service_rollups(service):
+    DailyRollup.objects.filter(service=service).update(
+        booked_minutes=F('visit_count') * service.duration_minutes,
+        revenue=F('visit_count') * service.price,
+        done_revenue=F('done_count') * service.price,
+    )
+
+
+# Итоги, посчитанные по визитам за период (без ограничения, если даты не заданы): список несохранённых DailyRollup
+def build_rollups(date_from=None, date_to=None):
+    visits = Visit.objects.all()
+
+    if date_from:
+        visits = visits.filter(date__gte=date_from)
+
+    if date_to:
+        visits = visits.filter(date__lte=date_to)
+
+    groups = visits.values('date', 'hall_id', 'employee_id', 'service_id', 'service__duration_minutes',
+                           'service__price').annotate(
+        visits=Count('id'), done=Count('id', filter=Q(status=Visit.Status.DONE))).order_by()
+
+    return [DailyRollup(date=group['date'], hall_id=group['hall_id'], employee_id=group['employee_id'],
+                        service_id=group['service_id'], visit_count=group['visits'], done_count=group['done'],
+                        booked_minutes=group['visits'] * group['service__duration_minutes'],
+                        revenue=group['visits'] * group['service__price'],
+                        done_revenue=group['done'] * group['service__price'])
+            for group in groups]
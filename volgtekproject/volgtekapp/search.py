@@ -0,0 +1,97 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+
+from .models import Employee, EmployeeSearchToken
+
+# Поиск сотрудников на главной странице.
+#
+# Вместо LIKE '%…%' по пяти связанным таблицам поиск идёт по индексу слов (EmployeeSearchToken):
+# имя, фамилия, должность, названия услуг и залов разбиваются на слова, приводятся к нижнему регистру
+# (ё -> е) и хранятся по одному слову на строку с весом поля. Слово запроса ищется как префикс -
+# диапазоном по индексу (token, employee). Сотрудник найден, если каждое слово запроса совпало хотя бы
+# с одним его словом; релевантность - сумма лучших весов по словам запроса.
+# Индекс обновляется сигналами при изменении сотрудника, пользователя, услуг, залов и связей между ними.
+
+SEARCH_WEIGHTS = {'name': 4, 'position': 3, 'service': 2, 'hall': 1}  # Вес слова по полю, из которого оно взято
+
+MAX_SEARCH_WORDS = 5  # Сколько слов запроса учитывается
+
+SEARCH_RESULTS_LIMIT = 100  # Максимум найденных сотрудников (самые релевантные)
+
+TOKEN_LENGTH = EmployeeSearchToken._meta.get_field('token').max_length
+
+WORD = re.compile(r'\w+')
+
+
+# Нормализованные слова текста: нижний регистр, ё заменена на е
+def normalize_words(text):
+    return [word[:TOKEN_LENGTH] for word in WORD.findall((text or '').lower().replace('ё', 'е'))]
+
+
+# Слова сотрудника с весом: {слово: наибольший вес среди полей, где оно встречается}.
+# Сотрудник должен быть загружен с пользователем, услугами и залами
+def employee_tokens(employee):
+    parts = [
+        (employee.user.first_name, SEARCH_WEIGHTS['name']),
+        (employee.user.last_name, SEARCH_WEIGHTS['name']),
+        (employee.position, SEARCH_WEIGHTS['position']),
+        *((service.name, SEARCH_WEIGHTS['service']) for service in employee.services.all()),
+        *((hall.name, SEARCH_WEIGHTS['hall']) for hall in employee.halls.all()),
+    ]
+
+    tokens = {}
+
+    for text, weight in parts:
+        for word in normalize_words(text):
+            tokens[word] = max(weight, tokens.get(word, 0))
+
+    return tokens
+
+
+# Пересчёт слов сотрудников employee_ids (всех сотрудников, если None)
+def rebuild_search_tokens(employee_ids=None):
+    employees = Employee.objects.select_related('user').prefetch_related('services', 'halls')
+    tokens = EmployeeSearchToken.objects.all()
+
+    if employee_ids is not None:
+        employee_ids = set(employee_ids)
+
+        if not employee_ids:
+            return
+
+        employees = employees.filter(id__in=employee_ids)
+        tokens = tokens.filter(employee_id__in=employee_ids)
+
+    with transaction.atomic():
+        tokens.delete()
+        EmployeeSearchToken.objects.bulk_create((
+            EmployeeSearchToken(employee=employee, token=token, weight=weight)
+            for employee in employees for token, weight in employee_tokens(employee).items()), batch_size=500)
+
+
+# Условие "слово начинается с prefix" диапазоном, который идёт по индексу
+# (LIKE 'prefix%' в SQLite индекс не использует)
+def prefix_match(prefix):
+    return Q(token__gte=prefix, token__lt=prefix + '\U0010ffff')
+
+
+# id не более limit найденных сотрудников по убыванию релевантности, одним запросом по индексу слов
+def search_employees(term, limit=SEARCH_RESULTS_LIMIT):
+    words = list(dict.fromkeys(normalize_words(term)))[:MAX_SEARCH_WORDS]
+
+    if not words:
+        return []
+
+    # Лучший вес совпадения для каждого слова запроса (0 - слово у сотрудника не найдено)
+    scores = {f'word_{index}': Max(Case(When(prefix_match(word), then=F('weight')), default=Value(0),
+                                        output_field=IntegerField()))
+              for index, word in enumerate(words)}
+
+    return list(EmployeeSearchToken.objects.filter(reduce(or_, map(prefix_match, words))).values(
+        'employee_id').annotate(**scores).filter(**{f'{name}__gt': 0 for name in scores}).annotate(
+        rank=sum(F(name) for name in scores)).order_by('-rank', 'employee_id').values_list(
+        'employee_id', flat=True)[:limit])
@@ -0,0 +1,71 @@
+from .models import Employee, ServiceHall
+
+# Связи сотрудников с парами услуга - зал (Employee.service_halls).
+#
+# Сотрудник оказывает каждую свою услугу в каждом своём зале, поэтому нужный набор связей - произведение
+# его залов и услуг. Синхронизация вызывается сигналом m2m_changed залов и услуг (signals.py) после того,
+# как связи уже сохранены, и выполняется набором запросов независимо от числа пар: недостающие строки
+# ServiceHall создаются пачкой (уникальность (услуга, зал) исключает дубли), связи сотрудников сравниваются
+# с нужными множествами, лишние удаляются одним запросом, недостающие добавляются одной пачкой.
+
+
+# Синхронизация service_halls сотрудников employee_ids с их залами и услугами
+def sync_service_halls(employee_ids):
+    employee_ids = set(employee_ids)
+
+    if not employee_ids:
+        return
+
+    halls, services = {}, {}  # {сотрудник: множество залов / услуг}
+
+    for employee_id, hall_id in Employee.halls.through.objects.filter(employee_id__in=employee_ids).values_list(
+            'employee_id', 'hall_id'):
+        halls.setdefault(employee_id, set()).add(hall_id)
+
+    for employee_id, service_id in Employee.services.through.objects.filter(
+            employee_id__in=employee_ids).values_list('employee_id', 'service_id'):
+        services.setdefault(employee_id, set()).add(service_id)
+
+    # Нужные пары (услуга, зал) каждого сотрудника
+    wanted = {employee_id: {(service_id, hall_id) for hall_id in halls.get(employee_id, ())
+                            for service_id in services.get(employee_id, ())}
+              for employee_id in employee_ids}
+    pairs = set().union(*wanted.values())
+
+    service_hall_ids = load_service_hall_ids(pairs)
+    missing = pairs - service_hall_ids.keys()
+
+    if missing:
+        ServiceHall.objects.bulk_create([ServiceHall(service_id=service_id, hall_id=hall_id)
+                                         for service_id, hall_id in missing], ignore_conflicts=True)
+        service_hall_ids = load_service_hall_ids(pairs)  # При ignore_conflicts id созданных строк не возвращаются
+
+    # Разница между нужными и существующими связями сотрудников
+    through = Employee.service_halls.through
+    desired = {(employee_id, service_hall_ids[pair]) for employee_id, employee_pairs in wanted.items()
+               for pair in employee_pairs}
+    current = {(employee_id, service_hall_id): link_id for link_id, employee_id, service_hall_id in
+               through.objects.filter(employee_id__in=employee_ids).values_list('id', 'employee_id', 'servicehall_id')}
+
+    stale = [link_id for link, link_id in current.items() if link not in desired]
+
+    if stale:
+        through.objects.filter(id__in=stale).delete()
+
+    added = desired - current.keys()
+
+    if added:
+        through.objects.bulk_create([through(employee_id=employee_id, servicehall_id=service_hall_id)
+                                     for employee_id, service_hall_id in added], ignore_conflicts=True)
+
+
+# id строк ServiceHall для пар (услуга, зал): {(услуга, зал): id}
+def load_service_hall_ids(pairs):
+    if not pairs:
+        return {}
+
+    rows = ServiceHall.objects.filter(service_id__in={service_id for service_id, _ in pairs},
+                                      hall_id__in={hall_id for _, hall_id in pairs}).values_list(
+        'id', 'service_id', 'hall_id')
+
+    return {(service_id, hall_id): service_hall_id for service_hall_id, service_id, hall_id in rows}
@@ -0,0 +1,229 @@
+from datetime import date as dt_date
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from django.db.models import F
+
+from .availability import rebuild_occupancy
+from .fragment_cache import invalidate_fragments
+from .models import Employee, Hall, Service, Visit
+from .occupancy import update_occupancy
+from .rollups import record_visit_change, refresh_service_rollups
+from .search import rebuild_search_tokens
+from .service_halls import sync_service_halls
+from .slot_cache import invalidate_days, invalidate_employee_days, invalidate_hall
+
+
+# Запоминаем зал, сотрудника, дату и интервал визита до изменения, чтобы при переносе обновить и старый день,
+# а также ключ и статус визита для дневных итогов
+@receiver(pre_save, sender=Visit)
+def remember_visit_slot(sender, instance, **kwargs):
+    instance._previous_slot = None
+    instance._previous_rollup = None
+
+    if instance.pk:
+        previous = Visit.objects.filter(pk=instance.pk).values_list(
+            'hall_id', 'employee_id', 'date', 'start_minute', 'end_minute', 'service_id', 'status').first()
+
+        if previous:
+            hall_id, employee_id, date, start, end, service_id, status = previous
+            instance._previous_slot = hall_id, employee_id, date, start, end
+            instance._previous_rollup = (date, hall_id, employee_id, service_id), status
+
+
+# Визит создан или перенесён: обновляем загрузку зала и сбрасываем слоты его дня (и прежнего дня при переносе)
+@receiver(post_save, sender=Visit)
+def invalidate_visit_slots(sender, instance, **kwargs):
+    changes = {}  # {(зал, дата): [(начало, конец, delta)]}
+    previous = getattr(instance, '_previous_slot', None)
+
+    if previous:
+        hall_id, employee_id, date, start, end = previous
+        invalidate_employee_days(employee_id, [date])
+
+        if hall_id:
+            changes.setdefault((hall_id, date), []).append((start, end, -1))
+
+    invalidate_employee_days(instance.employee_id, [instance.date])
+
+    if instance.hall_id:
+        changes.setdefault((instance.hall_id, instance.date), []).append(
+            (instance.start_minute, instance.end_minute, 1))
+
+    for (hall_id, date), day_changes in changes.items():
+        update_occupancy(hall_id, date, day_changes)
+        invalidate_days(hall_id, [date])
+
+
+# Визит создан, перенесён или сменил статус: переносим его из прежнего дневного итога в текущий
+@receiver(post_save, sender=Visit)
+def update_visit_rollups(sender, instance, **kwargs):
+    record_visit_change(getattr(instance, '_previous_rollup', None), instance)
+
+
+# Визит удалён: освобождаем его интервал в загрузке зала и его день в кэше
+@receiver(post_delete, sender=Visit)
+def invalidate_deleted_visit_slots(sender, instance, **kwargs):
+    invalidate_employee_days(instance.employee_id, [instance.date])
+
+    if instance.hall_id:
+        update_occupancy(instance.hall_id, instance.date, [(instance.start_minute, instance.end_minute, -1)])
+        invalidate_days(instance.hall_id, [instance.date])
+
+
+# Визит удалён: убираем его из дневного итога
+@receiver(post_delete, sender=Visit)
+def remove_visit_rollup(sender, instance, **kwargs):
+    record_visit_change(((instance.date, instance.hall_id, instance.employee_id, instance.service_id),
+                         instance.status), None)
+
+
+# Изменились часы работы или вместимость зала: сбрасываем все его дни
+@receiver(post_save, sender=Hall)
+@receiver(post_delete, sender=Hall)
+def invalidate_hall_slots(sender, instance, **kwargs):
+    invalidate_hall(instance.pk)
+
+
+# Запоминаем название, длительность и цену услуги до изменения
+@receiver(pre_save, sender=Service)
+def remember_service_values(sender, instance, **kwargs):
+    instance._previous_name = None
+    instance._previous_duration = None
+    instance._previous_price = None
+
+    if instance.pk:
+        instance._previous_name, instance._previous_duration, instance._previous_price = Service.objects.filter(
+            pk=instance.pk).values_list('name', 'duration_minutes', 'price').first() or (None, None, None)
+
+
+# Изменилась длительность услуги: сдвигаем конец её визитов, пересчитываем загрузку и сбрасываем кэш дней
+# с её визитами, начиная с сегодняшнего. Прошедшие визиты сохраняют прежнюю длительность: по прошедшим дням
+# свободное время не ищут, а их загрузка остаётся согласованной с визитами (rebuild_occupancy --verify).
+# Загрузка пересчитывается один раз на (зал, дата), кэш сотрудников сбрасывается по их дням.
+# Ключи для самой услуги меняются сами - длительность входит в ключ кэша
+@receiver(post_save, sender=Service)
+def invalidate_service_slots(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_previous_duration', None) == instance.duration_minutes:
+        return
+
+    visits = Visit.objects.filter(service_id=instance.pk, date__gte=dt_date.today())
+    visits.update(end_minute=F('start_minute') + instance.duration_minutes)
+
+    days = visits.filter(hall__isnull=False).values_list('hall_id', 'employee_id', 'date').distinct()
+
+    hall_days, employee_days = set(), set()
+
+    for hall_id, employee_id, day in days:
+        hall_days.add((hall_id, day))
+        employee_days.add((employee_id, day))
+
+    for hall_id, day in hall_days:
+        rebuild_occupancy(hall_id, day)
+        invalidate_days(hall_id, [day])
+
+    for employee_id, day in employee_days:
+        invalidate_employee_days(employee_id, [day])
+
+
+# Изменились цена или длительность услуги: пересчитываем минуты и выручку её дневных итогов
+@receiver(post_save, sender=Service)
+def refresh_service_rollup_values(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    if (getattr(instance, '_previous_duration', None), getattr(instance, '_previous_price', None)) != (
+            instance.duration_minutes, instance.price):
+        refresh_service_rollups(instance)
+
+
+# Сотрудник создан или изменён: пересчитываем его слова в поисковом индексе
+@receiver(post_save, sender=Employee)
+def update_employee_search(sender, instance, **kwargs):
+    rebuild_search_tokens([instance.pk])
+
+
+# Изменились имя или фамилия пользователя-сотрудника: обновляем ключ сортировки и поисковый индекс.
+# Сохранения только других полей (например, last_login при каждом входе) их не затрагивают
+@receiver(post_save, sender=User)
+def update_user_name(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+
+    employees = Employee.objects.filter(user_id=instance.pk)
+
+    if employees.update(sort_name=Employee.make_sort_name(instance)):
+        rebuild_search_tokens(employees.values_list('id', flat=True))
+        invalidate_fragments()  # Имя выводится в карточке сотрудника
+
+
+# Изменились залы или услуги сотрудника (с любой стороны связи): синхронизируем его связи услуга - зал
+# и пересчитываем слова в поисковом индексе
+@receiver(m2m_changed, sender=Employee.halls.through)
+@receiver(m2m_changed, sender=Employee.services.through)
+def update_employee_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    employee_ids = None
+
+    if action == 'pre_clear' and reverse:
+        # После очистки со стороны зала или услуги pk_set пуст: запоминаем сотрудников заранее
+        instance._relation_employee_ids = list(instance.employees.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        employee_ids = pk_set if reverse else [instance.pk]
+    elif action == 'post_clear':
+        employee_ids = getattr(instance, '_relation_employee_ids', []) if reverse else [instance.pk]
+
+    if employee_ids is not None:
+        sync_service_halls(employee_ids)
+        rebuild_search_tokens(employee_ids)
+
+
+# Запоминаем название зала до изменения
+@receiver(pre_save, sender=Hall)
+def remember_hall_name(sender, instance, **kwargs):
+    instance._previous_name = None
+
+    if instance.pk:
+        instance._previous_name = Hall.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+# Переименованы зал или услуга: пересчитываем слова их сотрудников
+@receiver(post_save, sender=Hall)
+@receiver(post_save, sender=Service)
+def update_renamed_search(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_previous_name', None) != instance.name:
+        rebuild_search_tokens(instance.employees.values_list('id', flat=True))
+
+
+# Зал или услуга удаляются: связи с сотрудниками удалятся каскадом без m2m_changed, поэтому
+# сотрудников запоминаем до удаления и пересчитываем после
+@receiver(pre_delete, sender=Hall)
+@receiver(pre_delete, sender=Service)
+def remember_deleted_search(sender, instance, **kwargs):
+    instance._search_employee_ids = list(instance.employees.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Hall)
+@receiver(post_delete, sender=Service)
+def update_deleted_search(sender, instance, **kwargs):
+    rebuild_search_tokens(getattr(instance, '_search_employee_ids', []))
+
+
+# Изменились сотрудник, услуга или зал: сбрасываем кэшированные фрагменты шаблонов (карточки, меню)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Hall)
+@receiver(post_delete, sender=Hall)
+def invalidate_catalog_fragments(sender, **kwargs):
+    invalidate_fragments()
+
+
+# Изменились залы или услуги сотрудника: они выводятся в его карточке
+@receiver(m2m_changed, sender=Employee.halls.through)
+@receiver(m2m_changed, sender=Employee.services.through)
+def invalidate_relation_fragments(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_fragments()
@@ -0,0 +1,167 @@
+import threading
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import SlotCacheVersion
+
+
+# Кэш рассчитанного свободного времени.
+#
+# Ключ слотов состоит из зала, сотрудника, даты, длительности услуги и шага сетки, а также версий зала,
+# дня зала и дня сотрудника. Инвалидация не удаляет ключи, а увеличивает версию: изменение визита
+# делает недействительными все длительности для пар (зал, дата) и (сотрудник, дата),
+# изменение зала - все его дни. Слоты лежат в общем кэше, а версии - в базе (SlotCacheVersion):
+# увеличение версии атомарно, версии не вытесняются при переполнении кэша и видны всем воркерам сразу.
+# Счётчики попаданий копятся в процессе и записываются в кэш пачками по STATS_FLUSH_EVERY обращений.
+
+SLOTS_TIMEOUT = 60 * 60 * 24  # Время жизни рассчитанных слотов (сутки)
+
+STATS_FLUSH_EVERY = 100  # Сколько обращений к кэшу слотов копить в процессе перед записью счётчиков
+
+HITS_KEY = 'availability:stats:hits'
+MISSES_KEY = 'availability:stats:misses'
+
+_pending_stats = {HITS_KEY: 0, MISSES_KEY: 0}  # Ещё не записанные счётчики процесса
+_stats_lock = threading.Lock()
+
+
+def _hall_version_key(hall_id):
+    return f'hall:{hall_id}'
+
+
+def _day_version_key(hall_id, date):
+    return f'day:{hall_id}:{date.isoformat()}'
+
+
+def _employee_day_version_key(employee_id, date):
+    return f'employee:{employee_id}:{date.isoformat()}'
+
+
+# Атомарное увеличение счётчика в кэше (если ключа ещё нет - создаём его)
+def _increment(key, delta=1):
+    if not delta:
+        return
+
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)  # Ключ успел создать другой воркер
+
+
+# Атомарное увеличение версии в базе. Строка версии создаётся при первой инвалидации ключа.
+# Используется и для версии фрагментов шаблонов (fragment_cache.py)
+def increment_version(key):
+    if SlotCacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+        return
+
+    try:
+        with transaction.atomic():
+            SlotCacheVersion.objects.create(key=key, version=1)
+    except IntegrityError:
+        SlotCacheVersion.objects.filter(key=key).update(version=F('version') + 1)  # Строку создал другой воркер
+
+
+# Увеличение версии сразу и ещё раз после фиксации текущей транзакции: слоты, которые успели
+# рассчитать и сохранить под новой версией до фиксации (или до отката), перестают находиться
+def _bump_version(key):
+    increment_version(key)
+
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: increment_version(key))
+
+
+# Учёт попаданий и промахов: запись в кэш только раз в STATS_FLUSH_EVERY обращений процесса
+def _count(hits, misses):
+    with _stats_lock:
+        _pending_stats[HITS_KEY] += hits
+        _pending_stats[MISSES_KEY] += misses
+
+        if sum(_pending_stats.values()) < STATS_FLUSH_EVERY:
+            return
+
+    flush_cache_stats()
+
+
+# Запись накопленных в процессе счётчиков попаданий в общий кэш
+def flush_cache_stats():
+    with _stats_lock:
+        pending = dict(_pending_stats)
+        _pending_stats.update({key: 0 for key in pending})
+
+    for key, delta in pending.items():
+        _increment(key, delta)
+
+
+# Ключи слотов для дат с учётом текущих версий зала и дней (один запрос к базе)
+def _slot_keys(hall_id, employee_id, duration, step, dates):
+    hall_key = _hall_version_key(hall_id)
+    day_keys = {date: _day_version_key(hall_id, date) for date in dates}
+    employee_keys = {date: _employee_day_version_key(employee_id, date) for date in dates}
+    versions = dict(SlotCacheVersion.objects.filter(
+        key__in=[hall_key, *day_keys.values(), *employee_keys.values()]).values_list('key', 'version'))
+
+    hall_version = versions.get(hall_key, 0)
+
+    return {date: f'availability:slots:{hall_id}:{hall_version}:{employee_id}:{date.isoformat()}:'
+                  f'{versions.get(day_keys[date], 0)}:{versions.get(employee_keys[date], 0)}:{duration}:{step}'
+            for date in dates}
+
+
+# Слоты из кэша: ({дата: [минуты от начала суток]} только для найденных дат, ключи всех дат).
+# Ключи передаются в set_cached_slots, чтобы версии не читались второй раз
+def get_cached_slots(hall, employee, duration, step, dates):
+    keys = _slot_keys(hall.id, employee.id, duration, step, dates)
+    found = cache.get_many(keys.values())
+
+    slots = {date: found[key] for date, key in keys.items() if key in found}
+
+    _count(len(slots), len(dates) - len(slots))
+
+    return slots, keys
+
+
+# Сохранение рассчитанных слотов: {дата: [минуты от начала суток]} под ключами из get_cached_slots
+def set_cached_slots(keys, slots):
+    cache.set_many({keys[date]: value for date, value in slots.items()}, SLOTS_TIMEOUT)
+
+
+# Инвалидация слотов зала на конкретные даты
+def invalidate_days(hall_id, dates):
+    for date in set(dates):
+        _bump_version(_day_version_key(hall_id, date))
+
+
+# Инвалидация слотов сотрудника на конкретные даты (во всех залах)
+def invalidate_employee_days(employee_id, dates):
+    for date in set(dates):
+        _bump_version(_employee_day_version_key(employee_id, date))
+
+
+# Инвалидация всех дней зала (изменились часы работы или вместимость)
+def invalidate_hall(hall_id):
+    _bump_version(_hall_version_key(hall_id))
+
+
+# Статистика попаданий в кэш. Счётчики других процессов учитываются с точностью до STATS_FLUSH_EVERY обращений
+def cache_stats():
+    flush_cache_stats()
+
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+# Сброс статистики попаданий в кэш
+def reset_cache_stats():
+    with _stats_lock:
+        _pending_stats.update({HITS_KEY: 0, MISSES_KEY: 0})
+
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -1,3 +1,1161 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import uuid
+from datetime import date, time, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now as tz_now
+
+from .availability import (BOOKING_WINDOW_DAYS, EARLIEST_SLOTS_LIMIT, get_availability_matrix, get_week_slots,
+                           is_slot_available, load_busy_intervals, resolve_hall)
+from .booking import (IDEMPOTENCY_KEY_MINUTES, expire_holds, expire_idempotency_keys, find_idempotent_visit,
+                      place_hold, save_booking)
+from .models import (BookingLock, Client, DailyRollup, Employee, Hall, HallDayOccupancy, IdempotencyKey,
+                     ImportCheckpoint, Service, ServiceHall, SlotCacheVersion, SlotHold, Visit)
+from .rollups import build_rollups
+from .search import rebuild_search_tokens, search_employees
+from .service_halls import sync_service_halls
+from .slot_cache import cache_stats, reset_cache_stats
+from .export import EXPORT_HEADERS
+from .form import VisitForm
+from .fragment_cache import get_fragments_version
+from .views import SERVICE_SORTS, VISIT_LIST_ORDERING
+from .time_slots import update_status_visits
+
+# Кэши тестов - в памяти процесса: общий файловый кэш (его же использует запущенный сервер) не читается
+# и не очищается. Версии кэша в тестовой базе начинаются с нуля в каждом тесте, поэтому классы,
+# которые рассчитывают слоты, очищают кэш в setUp
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'volgtekapp-tests'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                  'LOCATION': 'volgtekapp-tests-fragments'},
+}
+
+# Полный проход по таблице визитов в плане SQLite: "SCAN volgtekapp_visit" (в том числе по индексу целиком)
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?"?volgtekapp_visit"?\b')
+
+
+# Регрессионные тесты планов запросов: горячие запросы к визитам должны идти через индексы (SEARCH),
+# а не полным проходом по таблице. Если изменение запроса или удаление индекса из Visit.Meta
+# приведёт к полному сканированию, тест упадёт
+@skipUnless(connection.vendor == 'sqlite', 'План запроса проверяется для SQLite')
+@override_settings(CACHES=TEST_CACHES)
+class VisitQueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Мастер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+
+        cls.today = date.today()
+
+        for offset in range(-3, 4):
+            Visit.objects.create(client=cls.client_, employee=cls.employee, service=cls.service,
+                                 date=cls.today + timedelta(days=offset), time=time(10))
+
+    # Планы всех запросов к таблице визитов, выполненных внутри блока
+    def visit_plans(self, run):
+        with CaptureQueriesContext(connection) as context:
+            run()
+
+        plans = []
+
+        for query in context.captured_queries:
+            sql = query['sql']
+
+            if 'volgtekapp_visit' not in sql or not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+
+        self.assertTrue(plans, 'Не выполнено ни одного запроса к визитам')
+
+        return plans
+
+    # Проверка, что ни один запрос к визитам не сканирует таблицу целиком
+    def assertNoFullScan(self, run):
+        for sql, plan in self.visit_plans(run):
+            for detail in plan:
+                self.assertNotRegex(detail, FULL_SCAN, f'Полное сканирование визитов:\n{sql}\n{plan}')
+
+    # Занятость зала на дату (пересчёт загрузки зала)
+    def test_hall_busy_intervals(self):
+        self.assertNoFullScan(lambda: load_busy_intervals(self.hall, self.today))
+
+    # Свободное время на неделю: визиты сотрудника за диапазон дат и редактируемый визит
+    def test_week_slots(self):
+        visit = Visit.objects.filter(date=self.today).first()
+
+        self.assertNoFullScan(lambda: get_week_slots(self.hall, self.employee, self.service, self.today,
+                                                     exclude_visit_id=visit.id))
+
+    # Проверка выбранного времени: пересечение интервалов зала и сотрудника по start_minute/end_minute
+    def test_slot_check(self):
+        self.assertNoFullScan(lambda: is_slot_available(self.hall, self.employee, self.service, self.today, '11:00'))
+
+    # Матрица доступности: визиты нескольких мастеров за день
+    def test_availability_matrix(self):
+        self.assertNoFullScan(lambda: get_availability_matrix(self.service, self.today))
+
+    # Фоновое обновление статусов: запланированные визиты, время которых наступило
+    def test_update_status_visits(self):
+        self.assertNoFullScan(update_status_visits)
+        self.assertNoFullScan(update_status_visits)  # Повторный запуск: наступивших визитов уже нет
+
+    # Списки визитов сотрудника и клиента
+    def test_visit_lists(self):
+        ordering = VISIT_LIST_ORDERING  # Порядок keyset-пагинации списков (сначала новые)
+
+        self.assertNoFullScan(lambda: list(Visit.objects.filter(employee=self.employee).order_by(*ordering)))
+        self.assertNoFullScan(lambda: list(Visit.objects.filter(client=self.client_).order_by(*ordering)))
+
+
+# Бюджеты запросов для страниц: (имя маршрута, GET-параметры, пользователь, число запросов).
+# Пользователь: client - клиент, employee - сотрудник, staff - администратор.
+# HTML-страницы читают версию кэша фрагментов меню (один запрос), ответы JSON - нет.
+# Число запросов не должно зависеть от объёма данных - проверяется на 10 и на 1000 строк
+VIEW_QUERY_BUDGETS = [
+    ('index', {}, 'client', 6),
+    ('index', {'search': 'Мастер'}, 'client', 7),
+    ('index', {'format': 'json', 'sort': '-name'}, 'client', 5),
+    ('hall_show', {}, 'client', 4),
+    ('hall_show', {'format': 'json'}, 'client', 3),
+    ('service_show', {}, 'staff', 4),
+    ('service_show', {'sort': '-price'}, 'staff', 4),
+    ('service_show', {'format': 'json', 'sort': 'duration'}, 'client', 3),
+    ('employee_show', {}, 'staff', 6),
+    ('employee_show', {'format': 'json'}, 'staff', 5),
+    ('book_visit', {}, 'client', 5),
+    ('client_profile', {}, 'client', 3),
+    ('employee_profile', {}, 'employee', 6),
+    ('visit_show_client', {}, 'client', 4),
+    ('visit_show_employee', {}, 'employee', 4),
+    ('visit_show_admin', {}, 'staff', 6),
+    ('report_admin', {}, 'staff', 8),
+    ('get_available_week', {'employee': 'employee', 'service': 'service'}, 'client', 10),
+    ('get_earliest_slots', {'service': 'service'}, 'client', 7),
+    ('get_service_matrix', {'service': 'service', 'date': 'tomorrow'}, 'client', 7),
+]
+
+
+# Наполнение базы: rows залов, услуг, сотрудников (у каждого зал и услуга) и по rows визитов у клиента
+# и у первого сотрудника. Данные создаются массово, минуя save() и сигналы, поэтому служебные поля
+# (duration_minutes, start_minute, end_minute, связи ServiceHall, дневные итоги) заполняются явно
+class QueryBudgetMixin:
+    ROWS = None
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = cls.ROWS
+
+        halls = Hall.objects.bulk_create(
+            Hall(name=f'Зал {index}', description='', capacity=2, location='', start_time=time(9), end_time=time(21))
+            for index in range(rows))
+        services = Service.objects.bulk_create(
+            Service(name=f'Услуга {index}', description='', price=100, duration=time(1), duration_minutes=60)
+            for index in range(rows))
+        users = User.objects.bulk_create(User(username=f'employee{index}', first_name='Мастер', last_name=str(index))
+                                         for index in range(rows))
+        employees = Employee.objects.bulk_create(
+            Employee(user=user, position='Мастер', sort_name=Employee.make_sort_name(user)) for user in users)
+        service_halls = ServiceHall.objects.bulk_create(
+            ServiceHall(service=service, hall=hall) for service, hall in zip(services, halls))
+
+        Employee.halls.through.objects.bulk_create(
+            Employee.halls.through(employee=employee, hall=hall) for employee, hall in zip(employees, halls))
+        Employee.services.through.objects.bulk_create(
+            Employee.services.through(employee=employee, service=service)
+            for employee, service in zip(employees, services))
+        Employee.service_halls.through.objects.bulk_create(
+            Employee.service_halls.through(employee=employee, servicehall=service_hall)
+            for employee, service_hall in zip(employees, service_halls))
+
+        # Первый мастер оказывает первую услугу: все визиты и поиск свободного времени идут к нему
+        Employee.service_halls.through.objects.bulk_create(
+            Employee.service_halls.through(employee=employee, servicehall=service_halls[0])
+            for employee in employees[1:])
+
+        cls.client_user = User.objects.create_user('client')
+        client = Client.objects.create(user=cls.client_user)
+        cls.staff_user = User.objects.create_user('staff', is_staff=True)
+        cls.employee = employees[0]
+        cls.service = services[0]
+
+        today = date.today()
+        Visit.objects.bulk_create(
+            Visit(client=client, employee=cls.employee, service=cls.service, hall=halls[0],
+                  date=today + timedelta(days=index % 7), time=time(9 + index % 12),
+                  start_minute=(9 + index % 12) * 60, end_minute=(10 + index % 12) * 60)
+            for index in range(rows))
+        DailyRollup.objects.bulk_create(build_rollups())
+        rebuild_search_tokens()
+
+    def setUp(self):
+        cache.clear()  # Бюджет считается для запроса без кеша слотов
+
+    def request_user(self, role):
+        return {'client': self.client_user, 'employee': self.employee.user, 'staff': self.staff_user}[role]
+
+    def request_params(self, params):
+        ids = {'employee': self.employee.id, 'service': self.service.id,
+               'tomorrow': (date.today() + timedelta(days=1)).isoformat()}
+        return {name: ids.get(value, value) for name, value in params.items()}
+
+    def test_query_budgets(self):
+        for name, params, role, budget in VIEW_QUERY_BUDGETS:
+            with self.subTest(view=name, params=params):
+                self.client.force_login(self.request_user(role))
+
+                with self.assertNumQueries(budget):
+                    response = self.client.get(reverse(name), self.request_params(params))
+
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryBudgetSmallTests(QueryBudgetMixin, TestCase):
+    ROWS = 10
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryBudgetLargeTests(QueryBudgetMixin, TestCase):
+    ROWS = 1000
+
+
+# Поиск сотрудников по индексу слов: префиксы, несколько слов, ранжирование и синхронизация сигналами
+@override_settings(CACHES=TEST_CACHES)
+class EmployeeSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зелёный зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.haircut = Service.objects.create(name='Мужская стрижка', description='', price=100, duration=time(1))
+        cls.shave = Service.objects.create(name='Бритьё', description='', price=100, duration=time(1))
+
+        cls.ivan = Employee.objects.create(
+            user=User.objects.create_user('ivan', first_name='Иван', last_name='Стрижов'), position='Барбер')
+        cls.anna = Employee.objects.create(
+            user=User.objects.create_user('anna', first_name='Анна', last_name='Петрова'), position='Стилист')
+
+        cls.ivan.services.add(cls.shave)
+        cls.ivan.halls.add(cls.hall)
+        cls.anna.services.add(cls.haircut, cls.shave)
+
+    def test_prefix_and_case(self):
+        self.assertEqual(search_employees('ИВ'), [self.ivan.id])
+        self.assertEqual(search_employees('зеленый'), [self.ivan.id])  # ё и е не различаются
+
+    def test_all_words_must_match(self):
+        self.assertEqual(search_employees('анна бритьё'), [self.anna.id])
+        self.assertEqual(search_employees('анна зал'), [])
+
+    def test_rank_and_no_duplicates(self):
+        # "стриж" - фамилия Ивана (вес имени) и услуга Анны (вес услуги); "брит" есть у обоих
+        self.assertEqual(search_employees('стриж брит'), [self.ivan.id, self.anna.id])
+
+    def test_signals_keep_index_in_sync(self):
+        self.haircut.name = 'Окрашивание'
+        self.haircut.save()
+        self.assertEqual(search_employees('стрижка'), [])
+        self.assertEqual(search_employees('окраш'), [self.anna.id])
+
+        self.hall.employees.add(self.anna)
+        self.assertEqual(search_employees('зелен'), [self.ivan.id, self.anna.id])
+
+        self.anna.user.last_name = 'Сидорова'
+        self.anna.user.save()
+        self.assertEqual(search_employees('сидор'), [self.anna.id])
+
+        self.shave.delete()
+        self.assertEqual(search_employees('бритье'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+    def test_single_indexed_query(self):
+        with CaptureQueriesContext(connection) as context:
+            search_employees('стриж брит')
+
+        self.assertEqual(len(context.captured_queries), 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {context.captured_queries[0]["sql"]}')
+            details = [row[-1] for row in cursor.fetchall()]
+
+        self.assertFalse([detail for detail in details if re.search(r'\bSCAN (TABLE )?"?volgtekapp_employeesearchtoken',
+                                                                     detail)], details)
+
+
+# Курсорные списки справочников: обход страниц в обе стороны при сортировке по возрастанию и убыванию
+@override_settings(CACHES=TEST_CACHES)
+class DirectoryPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Повторяющиеся цены и длительности: порядок внутри одинаковых значений задаёт id
+        for index in range(60):
+            Service.objects.create(name=f'Услуга {index % 7}', description='', price=100 * (index % 4),
+                                   duration=time(index % 3 + 1))
+
+        cls.user = User.objects.create_user('client')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fetch(self, sort, **params):
+        return self.client.get(reverse('service_show'), {'format': 'json', 'per_page': 25, 'sort': sort,
+                                                         **params}).json()
+
+    def test_walk_pages_in_every_sort(self):
+        for sort, (label, ordering) in SERVICE_SORTS.items():
+            with self.subTest(sort=sort):
+                expected = list(Service.objects.order_by(*ordering).values_list('id', flat=True))
+
+                # Вперёд до последней страницы
+                pages = [self.fetch(sort)]
+
+                while pages[-1]['next_cursor']:
+                    pages.append(self.fetch(sort, after=pages[-1]['next_cursor']))
+
+                self.assertEqual([row['id'] for page in pages for row in page['results']], expected)
+                self.assertEqual(len(pages), 3)
+
+                # Назад с последней страницы до первой
+                backward = [pages[-1]]
+
+                while backward[-1]['previous_cursor']:
+                    backward.append(self.fetch(sort, before=backward[-1]['previous_cursor']))
+
+                self.assertEqual([row['id'] for page in reversed(backward) for row in page['results']], expected)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+    def test_sorts_use_indexes(self):
+        for sort, (label, ordering) in SERVICE_SORTS.items():
+            with self.subTest(sort=sort), connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {Service.objects.order_by(*ordering)[:26].query}')
+                details = ' '.join(row[-1] for row in cursor.fetchall())
+
+                self.assertNotIn('TEMP B-TREE', details)  # Сортировка без индекса
+
+
+# Кэш фрагментов главной страницы: карточки сотрудников обновляются после изменения услуги, зала и сотрудника
+@override_settings(CACHES=TEST_CACHES)
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Малый зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee', first_name='Иван'),
+                                               position='Барбер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.user = User.objects.create_user('client')
+        Client.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        caches['fragments'].clear()
+        self.client.force_login(self.user)
+
+    def page(self):
+        return self.client.get(reverse('index')).content.decode()
+
+    def test_cards_follow_catalog_changes(self):
+        self.assertIn('Стрижка', self.page())
+
+        self.service.name = 'Бритьё'
+        self.service.save()
+        self.assertIn('Бритьё', self.page())
+
+        self.hall.name = 'Большой зал'
+        self.hall.save()
+        self.assertIn('Большой зал', self.page())
+
+        self.employee.position = 'Стилист'
+        self.employee.save()
+        self.assertIn('Стилист', self.page())
+
+    def test_cached_card_is_reused(self):
+        self.page()
+
+        # Изменение в обход сигналов не видно, пока версия фрагментов не изменилась
+        Employee.objects.filter(id=self.employee.id).update(position='Стилист')
+        self.assertNotIn('Стилист', self.page())
+
+        Hall.objects.get(id=self.hall.id).save()
+        self.assertIn('Стилист', self.page())
+
+    def test_version_survives_cache_clear(self):
+        self.page()
+        Hall.objects.get(id=self.hall.id).save()
+        version = get_fragments_version()
+
+        # Версия хранится в базе: очистка (или вытеснение) общего кэша не возвращает её к старому номеру
+        cache.clear()
+        self.assertEqual(get_fragments_version(), version)
+        self.assertGreater(version, 0)
+
+
+# Запись через save_booking: проверка времени и сохранение под блокировкой зала и сотрудника на дату
+@override_settings(CACHES=TEST_CACHES)
+class BookingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Малый зал', description='', capacity=1, location='',
+                                       start_time=time(9), end_time=time(18), slot_step=30)
+        cls.other_hall = Hall.objects.create(name='Большой зал', description='', capacity=3, location='',
+                                             start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employees = []
+
+        for index in range(2):
+            employee = Employee.objects.create(user=User.objects.create_user(f'employee{index}'), position='Барбер')
+            employee.halls.add(cls.hall)
+            employee.services.add(cls.service)
+            cls.employees.append(employee)
+
+        cls.client_profile = Client.objects.create(user=User.objects.create_user('client'))
+        cls.day = date.today() + timedelta(days=1)
+
+    def visit(self, employee, slot_time):
+        return Visit(client=self.client_profile, employee=employee, service=self.service, date=self.day,
+                     time=slot_time)
+
+    def test_overbooking_rejected(self):
+        save_booking(self.visit(self.employees[0], '10:00'))
+
+        # Зал на одно место уже занят, хотя второй сотрудник свободен
+        with self.assertRaises(ValidationError):
+            save_booking(self.visit(self.employees[1], '10:30'))
+
+        save_booking(self.visit(self.employees[1], '11:00'))
+
+        self.assertEqual(Visit.objects.filter(hall=self.hall, date=self.day).count(), 2)
+        self.assertEqual(sorted(BookingLock.objects.values_list('key', flat=True)),
+                         [f'employee:{self.employees[0].id}:{self.day}',
+                          f'employee:{self.employees[1].id}:{self.day}', f'hall:{self.hall.id}:{self.day}'])
+
+    def test_move_keeps_own_slot(self):
+        visit = save_booking(self.visit(self.employees[0], '10:00'))
+
+        # Перенос на пересекающееся время: визит не мешает сам себе
+        visit.time = '10:30'
+        save_booking(visit)
+
+        self.assertEqual(Visit.objects.get().time, time(10, 30))
+
+    def test_employee_with_several_halls(self):
+        employee = self.employees[0]
+        employee.halls.add(self.other_hall)
+
+        # Услуга оказывается в двух залах: визит получает тот же зал, что и расчёт свободного времени
+        visit = save_booking(self.visit(employee, '10:00'))
+
+        self.assertEqual(visit.hall, resolve_hall(employee, self.service))
+
+        # Прямое сохранение визита без зала тоже не падает на нескольких связях
+        visit = self.visit(employee, '12:00')
+        visit.save()
+        self.assertEqual(visit.hall, resolve_hall(employee, self.service))
+
+
+# Удержание выбранного времени: занимает место для остальных клиентов, но не для самого клиента
+@override_settings(CACHES=TEST_CACHES)
+class SlotHoldTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Малый зал', description='', capacity=1, location='',
+                                       start_time=time(9), end_time=time(12))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.first = Client.objects.create(user=User.objects.create_user('first'))
+        cls.second = Client.objects.create(user=User.objects.create_user('second'))
+        cls.day = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def slots(self, client):
+        return get_week_slots(self.hall, self.employee, self.service, self.day, days=1,
+                              exclude_client_id=client.id)[self.day]
+
+    def test_hold_blocks_other_clients(self):
+        self.assertEqual(self.slots(self.second), [540, 600, 660])  # Прогрев кэша
+
+        place_hold(self.first, self.employee, self.service, self.day, '10:00')
+
+        self.assertEqual(self.slots(self.second), [540, 660])
+        self.assertEqual(self.slots(self.first), [540, 600, 660])
+
+        with self.assertRaises(ValidationError):
+            place_hold(self.second, self.employee, self.service, self.day, '10:00')
+
+        with self.assertRaises(ValidationError):
+            save_booking(Visit(client=self.second, employee=self.employee, service=self.service, date=self.day,
+                               time='10:00'))
+
+        # Запись клиента, удержавшего время, проходит и снимает удержание
+        save_booking(Visit(client=self.first, employee=self.employee, service=self.service, date=self.day,
+                           time='10:00'))
+
+        self.assertFalse(SlotHold.objects.exists())
+        self.assertEqual(self.slots(self.second), [540, 660])
+
+    def test_new_hold_replaces_previous(self):
+        place_hold(self.first, self.employee, self.service, self.day, '09:00')
+        place_hold(self.first, self.employee, self.service, self.day, '11:00')
+
+        self.assertEqual(self.slots(self.second), [540, 600])
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        place_hold(self.first, self.employee, self.service, self.day, '10:00')
+        self.assertEqual(self.slots(self.second), [540, 660])
+
+        SlotHold.objects.update(expires_at=tz_now() - timedelta(seconds=1))
+
+        # Проверка времени истёкшее удержание не учитывает сразу, кэш слотов сбрасывает фоновая очистка
+        self.assertTrue(is_slot_available(self.hall, self.employee, self.service, self.day, '10:00'))
+        self.assertEqual(expire_holds(), 1)
+        self.assertEqual(self.slots(self.second), [540, 600, 660])
+
+    def test_hold_view(self):
+        data = {'employee': self.employee.id, 'service': self.service.id, 'date': self.day.isoformat(),
+                'time': '10:00'}
+
+        self.client.force_login(self.first.user)
+        self.assertTrue(self.client.post(reverse('hold_slot'), data).json()['held'])
+
+        self.client.force_login(self.second.user)
+        response = self.client.post(reverse('hold_slot'), data)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['held'])
+
+        # Дата вне окна записи, неверное время или неизвестный сотрудник - ошибка запроса, удержание не создаётся
+        for invalid in ({'date': (date.today() - timedelta(days=30)).isoformat()},
+                        {'date': (date.today() + timedelta(days=300)).isoformat()}, {'date': 'завтра'},
+                        {'time': '10:0x'}, {'time': '25:00'}, {'employee': 0}, {'service': ''}):
+            with self.subTest(data=invalid):
+                response = self.client.post(reverse('hold_slot'), {**data, **invalid})
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['held'])
+
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+    # При переносе собственный визит клиента не занимает время (неделя и удержание), чужой визит так не исключить
+    def test_moved_visit_frees_own_time(self):
+        visit = save_booking(Visit(client=self.first, employee=self.employee, service=self.service, date=self.day,
+                                   time='10:00'))
+        params = {'employee': self.employee.id, 'service': self.service.id, 'visit': visit.id}
+
+        def week(client):
+            self.client.force_login(client.user)
+            return self.client.get(reverse('get_available_week'), params).json()['available_week'][
+                self.day.isoformat()]
+
+        self.assertEqual(week(self.first), [540, 600, 660])
+        self.assertEqual(week(self.second), [540, 660])
+
+        self.client.force_login(self.first.user)
+        response = self.client.post(reverse('hold_slot'), {**params, 'date': self.day.isoformat(), 'time': '10:00'})
+        self.assertTrue(response.json()['held'])
+
+        # Форма редактирования передаёт скрипту текущее время и id визита
+        self.assertEqual(VisitForm(instance=visit).fields['time'].widget.attrs['data-visit-id'], visit.id)
+
+
+# Версии кэша свободного времени хранятся в базе и не теряются вместе с ключами кэша
+@override_settings(CACHES=TEST_CACHES)
+class SlotCacheVersionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=1, location='',
+                                       start_time=time(9), end_time=time(12))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+        cls.day = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+
+    def slots(self):
+        return get_week_slots(self.hall, self.employee, self.service, self.day, days=1)[self.day]
+
+    def test_versions_and_stats(self):
+        self.assertEqual(self.slots(), [540, 600, 660])
+        self.assertEqual(self.slots(), [540, 600, 660])  # Из кэша
+
+        save_booking(Visit(client=self.client_, employee=self.employee, service=self.service, date=self.day,
+                           time='10:00'))
+
+        self.assertTrue(SlotCacheVersion.objects.filter(key=f'day:{self.hall.id}:{self.day.isoformat()}').exists())
+        self.assertEqual(self.slots(), [540, 660])
+
+        # Счётчики процесса ещё не записаны в кэш, но учитываются при выводе статистики
+        self.assertEqual(cache_stats()['hits'], 1)
+        self.assertEqual(cache_stats()['misses'], 2)
+
+
+# Изменение длительности услуги пересчитывает загрузку и кэш будущих дней всех её мастеров, прошлое не трогает
+@override_settings(CACHES=TEST_CACHES)
+class ServiceDurationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(12), slot_step=30)
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(0, 30))
+        cls.employees = []
+
+        for index in range(2):
+            employee = Employee.objects.create(user=User.objects.create_user(f'employee{index}'), position='Барбер')
+            employee.halls.add(cls.hall)
+            employee.services.add(cls.service)
+            cls.employees.append(employee)
+
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+        cls.day = date.today() + timedelta(days=1)
+        cls.past = date.today() - timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def slots(self, employee):
+        return get_week_slots(self.hall, employee, self.service, self.day, days=1)[self.day]
+
+    def test_duration_change(self):
+        for employee in self.employees:
+            for day in (self.day, self.past):
+                Visit.objects.create(client=self.client_, employee=employee, service=self.service, date=day,
+                                     time='10:00')
+
+        past_counters = HallDayOccupancy.objects.get(hall=self.hall, date=self.past).counters
+        self.assertEqual(self.slots(self.employees[1])[:3], [540, 570, 630])  # Прогрев кэша
+
+        self.service.duration = time(1)
+        self.service.save()
+
+        # Зал на два места занят двумя визитами 10:00-11:00: у обоих мастеров 9:00 и 11:00
+        self.assertEqual(self.slots(self.employees[0]), [540, 660])
+        self.assertEqual(self.slots(self.employees[1]), [540, 660])
+        self.assertEqual(HallDayOccupancy.objects.get(hall=self.hall, date=self.past).counters, past_counters)
+
+        # Прошедшие визиты не меняются, поэтому загрузка всех дней по-прежнему совпадает с визитами
+        self.assertEqual(set(Visit.objects.filter(date=self.past).values_list('end_minute', flat=True)), {630})
+
+        output = io.StringIO()
+        call_command('rebuild_occupancy', '--verify', stdout=output)
+        self.assertIn('совпадает', output.getvalue())
+
+
+# Поиск ближайшего времени: limit в пределах 1..EARLIEST_SLOTS_LIMIT, период не дальше окна записи от сегодня
+@override_settings(CACHES=TEST_CACHES)
+class EarliestSlotsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=1, location='',
+                                       start_time=time(9), end_time=time(21))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(0, 30))
+        employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+        employee.halls.add(cls.hall)
+        employee.services.add(cls.service)
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+
+    def earliest(self, **params):
+        self.client.force_login(self.client_.user)
+        response = self.client.get(reverse('get_earliest_slots'), {'service': self.service.id, **params})
+
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()['earliest_slots']
+
+    def test_limit_and_window(self):
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+
+        self.assertEqual(len(self.earliest(date_from=tomorrow, limit='abc')), 5)
+        self.assertEqual(len(self.earliest(date_from=tomorrow, limit='0')), 1)
+        self.assertEqual(len(self.earliest(date_from=tomorrow, limit='-3')), 1)
+        self.assertEqual(len(self.earliest(date_from=tomorrow, limit='1000')), EARLIEST_SLOTS_LIMIT)
+
+        # Начало периода за окном записи: окно считается от сегодня, а не от date_from
+        beyond = date.today() + timedelta(days=BOOKING_WINDOW_DAYS + 1)
+        self.assertEqual(self.earliest(date_from=beyond.isoformat()), [])
+
+
+# Повторная отправка записи с тем же ключом идемпотентности возвращает первый визит
+@override_settings(CACHES=TEST_CACHES)
+class IdempotentBookingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.client_profile = Client.objects.create(user=User.objects.create_user('client'))
+        cls.data = {'employee': cls.employee.id, 'service': cls.service.id,
+                    'date': (date.today() + timedelta(days=1)).isoformat(), 'time': '10:00'}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.client_profile.user)
+
+    def test_form_resubmit(self):
+        data = {**self.data, 'idempotency_key': str(uuid.uuid4())}
+
+        self.assertRedirects(self.client.post(reverse('book_visit'), data), reverse('visit_confirmation'))
+
+        # Повтор не проверяет форму и не обращается к расчёту свободного времени
+        with CaptureQueriesContext(connection) as context:
+            self.assertRedirects(self.client.post(reverse('book_visit'), data), reverse('visit_confirmation'))
+
+        self.assertFalse([query for query in context.captured_queries
+                          if 'volgtekapp_halldayoccupancy' in query['sql'] or 'volgtekapp_slothold' in query['sql']])
+        self.assertEqual(Visit.objects.count(), 1)
+
+        # Новая форма - новый ключ и новая запись
+        self.client.post(reverse('book_visit'), {**data, 'time': '11:00', 'idempotency_key': str(uuid.uuid4())})
+        self.assertEqual(Visit.objects.count(), 2)
+
+    def test_json_replay(self):
+        key = str(uuid.uuid4())
+        post = lambda: self.client.post(reverse('book_visit_json'), self.data, content_type='application/json',
+                                        headers={'Idempotency-Key': key})
+
+        first = post()
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        second = post()
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Visit.objects.count(), 1)
+
+        response = self.client.post(reverse('book_visit_json'), self.data, content_type='application/json',
+                                    headers={'Idempotency-Key': 'повтор'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_invalid_data(self):
+        post = lambda **data: self.client.post(reverse('book_visit_json'), {**self.data, **data},
+                                               content_type='application/json')
+
+        # Дата за окном записи в обе стороны, неизвестные id и неверная дата - ошибка запроса, а не 500
+        for data in ({'date': (date.today() - timedelta(days=60)).isoformat()},
+                     {'date': (date.today() + timedelta(days=BOOKING_WINDOW_DAYS + 1)).isoformat()},
+                     {'employee': 0}, {'service': 'услуга'}, {'date': '2024-13-45'}, {'date': 20240101},
+                     {'date': None}):
+            with self.subTest(data=data):
+                response = post(**data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.json())
+
+        self.assertFalse(Visit.objects.exists())
+        self.assertEqual(post().status_code, 201)
+
+    def test_keys_expire(self):
+        key = uuid.uuid4()
+        visit = save_booking(Visit(client=self.client_profile, employee=self.employee, service=self.service,
+                                   date=date.today() + timedelta(days=1), time='10:00'), key)
+
+        self.assertEqual(find_idempotent_visit(self.client_profile.id, key), visit)
+
+        IdempotencyKey.objects.update(created_at=tz_now() - timedelta(minutes=IDEMPOTENCY_KEY_MINUTES + 1))
+
+        self.assertIsNone(find_idempotent_visit(self.client_profile.id, key))
+        self.assertEqual(expire_idempotency_keys(), 1)
+
+
+# Связи сотрудника с парами услуга - зал следуют за его залами и услугами и синхронизируются пачками
+@override_settings(CACHES=TEST_CACHES)
+class ServiceHallSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.halls = [Hall.objects.create(name=f'Зал {index}', description='', capacity=1, location='',
+                                         start_time=time(9), end_time=time(18)) for index in range(5)]
+        cls.services = [Service.objects.create(name=f'Услуга {index}', description='', price=100,
+                                               duration=time(1)) for index in range(5)]
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+
+    def pairs(self):
+        return set(self.employee.service_halls.values_list('service_id', 'hall_id'))
+
+    def test_follows_halls_and_services(self):
+        # Как save_m2m() формы сотрудника
+        self.employee.halls.set(self.halls[:2])
+        self.employee.services.set(self.services[:2])
+        self.assertEqual(self.pairs(), {(service.id, hall.id) for service in self.services[:2]
+                                        for hall in self.halls[:2]})
+
+        self.employee.halls.remove(self.halls[0])
+        self.assertEqual(self.pairs(), {(service.id, self.halls[1].id) for service in self.services[:2]})
+
+        # Очистка со стороны услуги
+        self.services[0].employees.clear()
+        self.assertEqual(self.pairs(), {(self.services[1].id, self.halls[1].id)})
+
+        # Строки ServiceHall общие для сотрудников и не дублируются
+        other = Employee.objects.create(user=User.objects.create_user('other'), position='Барбер')
+        other.halls.add(self.halls[1])
+        other.services.add(self.services[1])
+        self.assertEqual(ServiceHall.objects.filter(service=self.services[1], hall=self.halls[1]).count(), 1)
+
+    def test_constant_queries(self):
+        Employee.halls.through.objects.bulk_create(
+            Employee.halls.through(employee=self.employee, hall=hall) for hall in self.halls)
+        Employee.services.through.objects.bulk_create(
+            Employee.services.through(employee=self.employee, service=service) for service in self.services)
+
+        # Залы, услуги, строки ServiceHall, создание недостающих и повторное чтение, связи, добавление связей
+        with self.assertNumQueries(7):
+            sync_service_halls([self.employee.id])
+
+        self.assertEqual(len(self.pairs()), 25)
+
+        # Набор уже совпадает: только чтение
+        with self.assertNumQueries(4):
+            sync_service_halls([self.employee.id])
+
+
+# Массовый импорт: проверка строк формами, сопоставление связей, производные данные и продолжение с контрольной точки
+@override_settings(CACHES=TEST_CACHES)
+class ImportCatalogTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+        return path
+
+    def run_import(self, kind, path, *args):
+        call_command('import_catalog', kind, path, *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def import_catalog(self):
+        self.run_import('halls', self.write('halls.csv', 'name,description,capacity,location,start_time,end_time\n'
+                                                         'Зал,,2,Центр,09:00,18:00\n'))
+        self.run_import('services', self.write('services.jsonl', json.dumps(
+            {'name': 'Стрижка', 'description': 'Стрижка', 'price': 500, 'duration': '00:30'}) + '\n'))
+        self.run_import('employees', self.write('employees.jsonl', json.dumps(
+            {'username': 'master', 'first_name': 'Иван', 'last_name': 'Петров', 'phone_number': '+79990000000',
+             'position': 'Барбер', 'halls': ['Зал'], 'services': ['Стрижка']}) + '\n'))
+        self.run_import('clients', self.write('clients.csv', 'username,first_name,last_name,email\n'
+                                                             'client,Анна,Смирнова,anna@example.com\n'
+                                                             'client,Анна,Смирнова,anna@example.com\n'
+                                                             'broken,,,not-an-email\n'))
+
+    def test_catalog_and_relations(self):
+        self.import_catalog()
+
+        employee = Employee.objects.get(user__username='master')
+        hall, service = Hall.objects.get(name='Зал'), Service.objects.get(name='Стрижка')
+
+        self.assertEqual(service.duration_minutes, 30)
+        self.assertEqual(employee.sort_name, 'петров иван')
+        self.assertEqual(employee.hall_for(service), hall)
+        self.assertEqual(search_employees('пет'), [employee.id])
+        # Повтор логина пропущен, строка с ошибками проверки не загружена
+        self.assertEqual(list(Client.objects.values_list('user__username', flat=True)), ['client'])
+
+    def test_visits_resume_and_derived_data(self):
+        self.import_catalog()
+
+        past = date.today() - timedelta(days=30)
+        lines = (['client,employee,service,date,time'] +
+                 [f'client,master,Стрижка,{past},{9 + index}:00' for index in range(6)] +
+                 [f'client,nobody,Стрижка,{past},10:00', f'client,master,Стрижка,{past},25:00'])  # Две ошибки
+        path = self.write('visits.csv', '\n'.join(lines) + '\n')
+
+        # Прерванный импорт: первая пачка из двух строк уже зафиксирована
+        self.run_import('visits', path, '--chunk-size', '2', '--no-rebuild')
+        Visit.objects.filter(time__gte='11:00').delete()
+        ImportCheckpoint.objects.filter(name__startswith='visits:').update(rows=2)
+
+        self.run_import('visits', path, '--chunk-size', '2', '--resume')
+
+        visits = Visit.objects.order_by('time')
+        self.assertEqual(visits.count(), 6)
+        self.assertEqual({visit.status for visit in visits}, {Visit.Status.DONE})
+        self.assertEqual((visits[0].start_minute, visits[0].end_minute), (540, 570))
+
+        rollup = DailyRollup.objects.get(date=past)
+        self.assertEqual((rollup.visit_count, rollup.done_count), (6, 6))
+
+        output = io.StringIO()
+        call_command('rebuild_occupancy', '--verify', stdout=output)
+        self.assertIn('совпадает', output.getvalue())
+
+        # Повторный запуск без флага не сбрасывает контрольную точку молча, а --restart не дублирует визиты
+        with self.assertRaises(CommandError):
+            self.run_import('visits', path)
+
+        self.run_import('visits', path, '--restart')
+        self.assertEqual(Visit.objects.count(), 6)
+
+
+# Фоновое обновление статусов: наступившие запланированные визиты, в том числе добавленные задним числом
+@override_settings(CACHES=TEST_CACHES)
+class StatusUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee'), position='Барбер')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+
+    def add_visit(self, day, start):
+        return Visit.objects.create(client=self.client_, employee=self.employee, service=self.service,
+                                    date=day, time=start)
+
+    def test_backdated_visit_is_updated(self):
+        yesterday = date.today() - timedelta(days=1)
+        self.add_visit(yesterday, '12:00')
+        future = self.add_visit(date.today() + timedelta(days=1), '12:00')
+
+        self.assertEqual(update_status_visits(), 1)
+
+        # Визит, внесённый после запуска на более раннее время, обрабатывается следующим запуском
+        backdated = self.add_visit(yesterday, '10:00')
+
+        self.assertEqual(update_status_visits(), 1)
+        backdated.refresh_from_db()
+        future.refresh_from_db()
+        self.assertEqual(backdated.status, Visit.Status.DONE)
+        self.assertEqual(future.status, Visit.Status.PLANNED)
+
+
+# Поведение расчёта свободного времени: вместимость зала, занятость мастера в другом зале и сброс кэша
+# после изменения визитов и услуги. Слоты каждый раз берутся через кэш, поэтому проверяется и инвалидация
+@override_settings(CACHES=TEST_CACHES)
+class SlotBehaviourTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Большой зал', description='', capacity=2, location='',
+                                       start_time=time(9), end_time=time(12), slot_step=30)
+        cls.other_hall = Hall.objects.create(name='Малый зал', description='', capacity=1, location='',
+                                             start_time=time(9), end_time=time(12), slot_step=30)
+        cls.service = Service.objects.create(name='Стрижка', description='', price=100, duration=time(1))
+        cls.employees = []
+
+        for index in range(3):
+            employee = Employee.objects.create(user=User.objects.create_user(f'employee{index}'), position='Барбер')
+            employee.halls.add(cls.hall)
+            employee.services.add(cls.service)
+            cls.employees.append(employee)
+
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client'))
+        cls.day = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def slots(self, employee):
+        return get_week_slots(self.hall, employee, self.service, self.day, days=1)[self.day]
+
+    def add_visit(self, employee, start, hall=None):
+        return Visit.objects.create(client=self.client_, employee=employee, service=self.service, hall=hall,
+                                    date=self.day, time=start)
+
+    def assertOccupancyMatchesVisits(self):
+        output = io.StringIO()
+        call_command('rebuild_occupancy', '--verify', stdout=output)
+        self.assertIn('совпадает', output.getvalue())
+
+    def test_hall_capacity(self):
+        free = self.employees[2]
+        self.assertEqual(self.slots(free), [540, 570, 600, 630, 660])
+
+        # Одно из двух мест занято - время остаётся свободным
+        self.add_visit(self.employees[0], '10:00')
+        self.assertEqual(self.slots(free), [540, 570, 600, 630, 660])
+
+        # Второй пересекающийся визит заполняет зал на 10:30-11:00
+        self.add_visit(self.employees[1], '10:30')
+        self.assertEqual(self.slots(free), [540, 570, 660])
+        self.assertOccupancyMatchesVisits()
+
+    def test_employee_busy_in_other_hall(self):
+        employee = self.employees[0]
+        self.assertEqual(self.slots(employee), [540, 570, 600, 630, 660])
+
+        self.add_visit(employee, '10:00', hall=self.other_hall)
+
+        self.assertEqual(self.slots(employee), [540, 660])
+        self.assertEqual(self.slots(self.employees[1]), [540, 570, 600, 630, 660])
+
+    def test_visit_create_move_delete(self):
+        employee = self.employees[2]
+        self.assertEqual(self.slots(employee), [540, 570, 600, 630, 660])
+
+        visit = self.add_visit(employee, '09:00')
+        self.assertEqual(self.slots(employee), [600, 630, 660])
+
+        visit.time = '11:00'
+        visit.save()
+        self.assertEqual(self.slots(employee), [540, 570, 600])
+        self.assertOccupancyMatchesVisits()
+
+        visit.delete()
+        self.assertEqual(self.slots(employee), [540, 570, 600, 630, 660])
+        self.assertOccupancyMatchesVisits()
+
+    def test_service_duration_edit(self):
+        employee = self.employees[2]
+        self.add_visit(employee, '10:00')
+        self.assertEqual(self.slots(employee), [540, 660])
+
+        self.service.duration = time(0, 30)
+        self.service.save()
+
+        self.assertEqual(self.slots(employee), [540, 570, 630, 660, 690])
+        self.assertOccupancyMatchesVisits()
+
+
+# Дневные итоги после фонового обновления статусов и выгрузка визитов в CSV с фильтрами
+@override_settings(CACHES=TEST_CACHES)
+class RollupAndExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hall = Hall.objects.create(name='Большой зал', description='', capacity=3, location='',
+                                       start_time=time(9), end_time=time(18))
+        cls.other_hall = Hall.objects.create(name='Малый зал', description='', capacity=3, location='',
+                                             start_time=time(9), end_time=time(18))
+        cls.service = Service.objects.create(name='Стрижка', description='', price=700, duration=time(0, 45))
+        cls.employee = Employee.objects.create(user=User.objects.create_user('employee', first_name='Иван',
+                                                                             last_name='Петров'),
+                                               position='Барбер', phone_number='+79990000001')
+        cls.employee.halls.add(cls.hall)
+        cls.employee.services.add(cls.service)
+        cls.client_ = Client.objects.create(user=User.objects.create_user('client', first_name='Анна',
+                                                                          last_name='Смирнова'))
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+        cls.past = date.today() - timedelta(days=2)
+        cls.future = date.today() + timedelta(days=2)
+
+        cls.visits = [Visit.objects.create(client=cls.client_, employee=cls.employee, service=cls.service,
+                                           date=day, time=start, hall=hall)
+                      for day, start, hall in [(cls.past, '10:00', cls.hall), (cls.past, '12:00', cls.other_hall),
+                                               (cls.future, '10:00', cls.hall)]]
+
+    def rollup(self, day, hall):
+        return DailyRollup.objects.values('visit_count', 'done_count', 'booked_minutes', 'revenue',
+                                          'done_revenue').get(date=day, hall=hall)
+
+    def test_rollups_after_status_job(self):
+        self.assertEqual(self.rollup(self.past, self.hall)['done_count'], 0)
+
+        self.assertEqual(update_status_visits(), 2)
+
+        self.assertEqual(self.rollup(self.past, self.hall), {'visit_count': 1, 'done_count': 1, 'booked_minutes': 45,
+                                                             'revenue': 700, 'done_revenue': 700})
+        self.assertEqual(self.rollup(self.future, self.hall), {'visit_count': 1, 'done_count': 0,
+                                                               'booked_minutes': 45, 'revenue': 700,
+                                                               'done_revenue': 0})
+
+        output = io.StringIO()
+        call_command('rebuild_rollups', '--verify', stdout=output)
+        self.assertIn('совпадают', output.getvalue())
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('visit_export_admin'), params)
+
+        self.assertEqual(response.status_code, 200)
+
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+
+        return list(csv.reader(io.StringIO(content[1:]), delimiter=';'))
+
+    def test_csv_export(self):
+        update_status_visits()
+
+        rows = self.export()
+        self.assertEqual(rows[0], EXPORT_HEADERS)
+        self.assertEqual(rows[1], [str(self.visits[0].id), self.past.isoformat(), '10:00', 'Анна Смирнова', '',
+                                   'Иван Петров', '+79990000001', 'Стрижка', '45', 'Большой зал', '700.00',
+                                   'Выполнена'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(visit.id) for visit in self.visits])
+
+        self.assertEqual([row[0] for row in self.export(hall=self.other_hall.id)[1:]], [str(self.visits[1].id)])
+        self.assertEqual([row[0] for row in self.export(status=Visit.Status.PLANNED)[1:]], [str(self.visits[2].id)])
+        self.assertEqual([row[0] for row in self.export(date_from=date.today().isoformat())[1:]],
+                         [str(self.visits[2].id)])
+        self.assertEqual(len(self.export(date_to=self.past.isoformat(), hall=self.hall.id)), 2)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('visit_export_admin'), {'date_from': 'завтра'}).status_code, 400)
+
+
+# Отчёт администратора: итоги по мастерам считаются по сотруднику, а не по имени
+@override_settings(CACHES=TEST_CACHES)
+class ReportTests(TestCase):
+
+    def test_namesake_employees_are_separate(self):
+        hall = Hall.objects.create(name='Зал', description='', capacity=2, location='',
+                                   start_time=time(9), end_time=time(18))
+        service = Service.objects.create(name='Стрижка', description='', price=500, duration=time(1))
+        client = Client.objects.create(user=User.objects.create_user('client'))
+        first_day = date(date.today().year, 1, 1)  # Все визиты в одном году отчёта
+
+        for index, start in enumerate(['10:00', '11:00']):
+            employee = Employee.objects.create(user=User.objects.create_user(
+                f'employee{index}', first_name='Иван', last_name='Петров'), position='Барбер')
+            employee.halls.add(hall)
+            employee.services.add(service)
+
+            for offset in range(index + 1):
+                Visit.objects.create(client=client, employee=employee, service=service,
+                                     date=first_day + timedelta(days=offset), time=start)
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(reverse('report_admin'), {'year': first_day.year})
+
+        self.assertEqual([(row['last_name'], row['visits']) for row in response.context['by_employee']],
+                         [('Петров', 2), ('Петров', 1)])
+        self.assertEqual([row['visits'] for row in response.context['by_hall']], [3])
@@ -3,7 +3,8 @@ from django.urls import path
 from .views import index, registration_client, registration_employee, client_update, employee_update, client_profile, \
     employee_profile, hall_add, hall_show, hall_delete, hall_update, service_add, service_show, service_delete, \
     service_update, book_visit, visit_confirmation, visit_show_employee, visit_show_client, visit_update_client, \
-    visit_delete_client, employee_delete, employee_show, visit_show_admin, get_available_time
+    visit_delete_client, employee_delete, employee_show, visit_show_admin, get_available_time, get_available_week, \
+    get_earliest_slots, get_service_matrix, visit_export_admin, report_admin, hold_slot, book_visit_json
 
 urlpatterns = [
     path('', index, name='index'),
@@ -38,6 +39,7 @@ urlpatterns = [
 
     # Бронирование посещений
     path('book/visit/', book_visit, name='book_visit'),
+    path('book/visit/json/', book_visit_json, name='book_visit_json'),
     path('visit/confirmation/', visit_confirmation, name='visit_confirmation'),
     path('visit/show/', visit_show_employee, name='visit_show_employee'),
     path('visit/show/client/', visit_show_client, name='visit_show_client'),
@@ -46,5 +48,11 @@ urlpatterns = [
     path('visit/update/<int:visit_id>/', visit_update_client, name='visit_update_client'),
     path('visit/delete/<int:visit_id>/', visit_delete_client, name='visit_delete_client'),
     path('visit/show/admin/', visit_show_admin, name='visit_show_admin'),
+    path('visit/export/admin/', visit_export_admin, name='visit_export_admin'),
+    path('report/admin/', report_admin, name='report_admin'),
     path('get_available_time/', get_available_time, name='get_available_time'),
+    path('get_available_week/', get_available_week, name='get_available_week'),
+    path('hold_slot/', hold_slot, name='hold_slot'),
+    path('get_earliest_slots/', get_earliest_slots, name='get_earliest_slots'),
+    path('get_service_matrix/', get_service_matrix, name='get_service_matrix'),
 ]
@@ -1,45 +1,143 @@
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ValidationError
-from django.http import JsonResponse
+from django.db import OperationalError
+from django.http import FileResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
 
-import pandas as pd
-import locale
 from datetime import datetime
+import json
+import uuid
 
-from .models import Hall, Service, Client, Employee, Visit
+from .models import Hall, Service, Client, Employee, Visit, DailyRollup
 from .form import ClientForm, VisitForm, HallForm, ServiceForm, EmployeeForm, ClientRegistrationForm, \
-    EmployeeRegistrationForm, ClientUpdateForm
+    EmployeeRegistrationForm, ClientUpdateForm, RollupReportForm, SlotHoldForm, VisitExportForm
+from .booking import BOOKING_BUSY_MESSAGE, SLOT_TAKEN_MESSAGE, find_idempotent_visit, place_hold, save_booking
 from .decorator import is_client, is_employee
+from .export import export_queryset, stream_csv, write_xlsx
+from .pagination import keyset_paginate, sorted_paginate
+from .search import search_employees
 
-from .time_slots import get_time_slots, update_status_visits
-
-locale.setlocale(locale.LC_TIME, 'Russian_Russia.1251')  # Для локализации месяца
+from .availability import find_earliest_slots, get_availability_matrix, get_available_slots, get_week_slots, \
+    resolve_hall
 
 
 # Create your views here.
 
+# Варианты сортировки списков сотрудников, залов и услуг: {значение параметра sort: (подпись, поля порядка)}.
+# Каждому порядку соответствует индекс модели, последнее поле id делает порядок однозначным для курсора
+EMPLOYEE_SORTS = {
+    'name': ('По фамилии (А-Я)', ('sort_name', 'id')),
+    '-name': ('По фамилии (Я-А)', ('-sort_name', '-id')),
+}
+
+HALL_SORTS = {
+    'name': ('По названию (А-Я)', ('name', 'id')),
+    '-name': ('По названию (Я-А)', ('-name', '-id')),
+}
+
+SERVICE_SORTS = {
+    'name': ('По названию', ('name', 'id')),
+    'price': ('Сначала дешевле', ('price', 'id')),
+    '-price': ('Сначала дороже', ('-price', '-id')),
+    'duration': ('Сначала короче', ('duration_minutes', 'id')),
+    '-duration': ('Сначала дольше', ('-duration_minutes', '-id')),
+}
+
+
+# Данные сотрудника для JSON-списка. Сотрудник загружен с пользователем, залами и услугами
+def employee_json(employee):
+    return {
+        'id': employee.id,
+        'name': str(employee),
+        'phone_number': employee.phone_number,
+        'position': employee.position,
+        'halls': [{'id': hall.id, 'name': hall.name} for hall in employee.halls.all()],
+        'services': [service_json(service) for service in employee.services.all()],
+    }
+
+
+# Данные зала для JSON-списка
+def hall_json(hall):
+    return {
+        'id': hall.id,
+        'name': hall.name,
+        'description': hall.description,
+        'capacity': hall.capacity,
+        'location': hall.location,
+        'start_time': hall.start_time.strftime('%H:%M'),
+        'end_time': hall.end_time.strftime('%H:%M'),
+        'slot_step': hall.slot_step,
+    }
+
+
+# Данные услуги для JSON-списка
+def service_json(service):
+    return {
+        'id': service.id,
+        'name': service.name,
+        'description': service.description,
+        'price': str(service.price),
+        'duration_minutes': service.duration_minutes,
+    }
+
+
+# Данные визита для JSON-ответа записи
+def visit_json(visit):
+    return {
+        'id': visit.id,
+        'employee': {'id': visit.employee_id, 'name': str(visit.employee)},
+        'service': {'id': visit.service_id, 'name': visit.service.name},
+        'hall': {'id': visit.hall_id, 'name': visit.hall.name},
+        'date': visit.date.strftime('%Y-%m-%d'),
+        'time': visit.time.strftime('%H:%M'),
+    }
+
+
+# Ключ идемпотентности записи: заголовок Idempotency-Key или поле idempotency_key. Нет ключа - None,
+# ключ не в формате UUID - ValueError
+def get_idempotency_key(request, data):
+    value = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+    return uuid.UUID(str(value)) if value else None
+
+
+# Страница списка в JSON (параметр format=json) для подгрузки при прокрутке: строки и курсоры соседних страниц
+def page_json(page, serialize):
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page['objects']],
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+    })
+
+
 # Главная страница. Если пользователь не аутентифицирован, перенаправляется на страницу входа.
 def index(request):
     if not request.user.is_authenticated:
         return redirect('login')
 
-    # Получаем все сотрудников
-    employees = Employee.objects.all()
+    # Получаем сотрудников вместе с пользователями, залами и услугами (без запроса на каждую карточку)
+    employees = Employee.objects.select_related('user').prefetch_related('halls', 'services')
 
     # Получаем информацию по поисковому запросу (если он есть)
-    search_term = request.GET.get('search', '').strip()
-
-    search_term = ' '.join([word.capitalize() for word in search_term.split()])
+    search_term = ' '.join(request.GET.get('search', '').split())
 
     if search_term:
-        employees = employees.filter(services__name__icontains=search_term) | employees.filter(
-            halls__name__icontains=search_term) | employees.filter(user__first_name=search_term) | employees.filter(
-            user__last_name=search_term) | employees.filter(position=search_term)
+        # Результаты поиска упорядочены по релевантности и ограничены SEARCH_RESULTS_LIMIT, поэтому без курсора
+        ranked = search_employees(search_term)  # id сотрудников по убыванию релевантности
+        found = employees.in_bulk(ranked)
+        page = {'objects': [found[employee_id] for employee_id in ranked if employee_id in found],
+                'next_cursor': None, 'previous_cursor': None}
+    else:
+        page = sorted_paginate(request, employees, EMPLOYEE_SORTS)  # Страница сотрудников по курсору
 
-    return render(request, 'index.html', {'employees': employees, 'search_term': search_term})
+    if request.GET.get('format') == 'json':
+        return page_json(page, employee_json)
+
+    return render(request, 'index.html', {'employees': page['objects'], 'page': page, 'search_term': search_term})
 
 
 def registration_client(request):
@@ -144,7 +242,7 @@ def employee_update(request, employee_id):
 @user_passes_test(is_client)
 def client_profile(request):
     client = request.user
-    client_form = Client.objects.get(user=client)  # Получаем данные клиента
+    client_form = client.client  # Данные клиента уже загружены вместе с пользователем
 
     return render(request, 'profile/client_profile.html', {'client_form': client_form, 'client': client})
 
@@ -153,7 +251,7 @@ def client_profile(request):
 @user_passes_test(is_employee)
 def employee_profile(request):
     employee = request.user
-    employee_form = Employee.objects.get(user=employee)
+    employee_form = Employee.objects.prefetch_related('halls', 'services').get(user=employee)
 
     return render(request, 'profile/employee_profile.html', locals())
 
@@ -161,14 +259,19 @@ def employee_profile(request):
 # Страница отображения всех сотрудников. Доступна только для администраторов.
 @staff_member_required
 def employee_show(request):
-    employee = Employee.objects.all()
-    return render(request, 'show/employee_show.html', locals())
+    page = sorted_paginate(request, Employee.objects.select_related('user').prefetch_related('halls', 'services'),
+                           EMPLOYEE_SORTS)
+
+    if request.GET.get('format') == 'json':
+        return page_json(page, employee_json)
+
+    return render(request, 'show/employee_show.html', {'employee': page['objects'], 'page': page})
 
 
 # Страница удаления сотрудника. Доступна только для администраторов.
 @staff_member_required
 def employee_delete(request, employee_id):
-    employee = Employee.objects.get(id=employee_id)
+    employee = Employee.objects.select_related('user').prefetch_related('halls', 'services').get(id=employee_id)
 
     if request.method == 'POST':
         employee.delete()  # Удаляем сотрудника и перенаправляем на список сотрудников
@@ -197,9 +300,12 @@ def hall_add(request):
 # Страница отображения всех залов. Доступна только для авторизованных пользователей.
 @login_required
 def hall_show(request):
-    hall = Hall.objects.all()  # Получаем все залы из базы данных
+    page = sorted_paginate(request, Hall.objects.all(), HALL_SORTS)  # Страница залов по курсору
+
+    if request.GET.get('format') == 'json':
+        return page_json(page, hall_json)
 
-    return render(request, 'show/hall_show.html', locals())
+    return render(request, 'show/hall_show.html', {'hall': page['objects'], 'page': page})
 
 
 # Страница удаления зала. Доступна только для администраторов.
@@ -256,9 +362,12 @@ def service_add(request):
 # Страница отображения всех услуг. Доступна только для авторизованных пользователей.
 @login_required
 def service_show(request):
-    service = Service.objects.all()  # Получаем все услуги из базы данных
+    page = sorted_paginate(request, Service.objects.all(), SERVICE_SORTS)  # Страница услуг по курсору
 
-    return render(request, 'show/service_show.html', locals())
+    if request.GET.get('format') == 'json':
+        return page_json(page, service_json)
+
+    return render(request, 'show/service_show.html', {'service': page['objects'], 'page': page})
 
 
 # Страница удаления услуги. Доступна только для администраторов.
@@ -300,26 +409,97 @@ def service_update(request, service_id):
 @user_passes_test(is_client)
 def book_visit(request):
     if request.method == 'POST':
-        print(request.POST.get('time'))
+        try:
+            key = get_idempotency_key(request, request.POST)
+        except ValueError:
+            key = None  # Испорченный ключ: запись выполняется как без ключа
 
-        form = VisitForm(request.POST)  # Форма добавления визита
+        # Повторная отправка уже принятой формы: визит записан, свободное время не пересчитываем
+        if key and find_idempotent_visit(request.user.client.id, key):
+            return redirect('visit_confirmation')
+
+        form = VisitForm(request.POST, client=request.user.client)  # Форма добавления визита
 
         if form.is_valid():
             try:
                 visit = form.save(commit=False)
                 visit.client = request.user.client
-                visit.save()  # Сохраняем визит
+                save_booking(visit, key)  # Проверяем время и сохраняем визит под блокировкой зала и мастера
 
                 return redirect('visit_confirmation')  # Перенаправляем на страницу подтверждения
             except ValidationError as e:
                 # Если возникла ошибка валидации (например, переполнен зал), выводим сообщение об ошибке
                 messages.error(request, e)
+            except OperationalError:
+                # Блокировку записи не удалось получить за все попытки (очень много одновременных записей)
+                messages.error(request, BOOKING_BUSY_MESSAGE)
     else:
         form = VisitForm()  # Пустая форма для добавления визита
 
     return render(request, 'add/book_visit.html', {'form': form})
 
 
+# Запись на посещение в JSON (POST: employee, service, date, time в теле JSON или формы) для приложений.
+# Повтор запроса с тем же ключом (заголовок Idempotency-Key) возвращает тот же визит без повторной
+# проверки формы и расчёта свободного времени. Доступна только для клиентов.
+@user_passes_test(is_client)
+def book_visit_json(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Ожидается POST-запрос'}, status=405)
+
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+
+        if not isinstance(data, dict):
+            raise ValueError
+
+        if request.content_type == 'application/json':
+            # Поля формы - строки: числа из JSON приводятся к строке, null считается отсутствующим полем
+            data = {name: str(value) for name, value in data.items() if value is not None}
+
+        key = get_idempotency_key(request, data)
+    except ValueError:
+        return JsonResponse({'error': 'Неверное тело запроса или ключ идемпотентности'}, status=400)
+
+    client = request.user.client
+
+    if key:
+        visit = find_idempotent_visit(client.id, key)
+
+        if visit:
+            response = JsonResponse({'visit': visit_json(visit)}, status=201)
+            response['Idempotent-Replayed'] = 'true'  # Ответ повторён, новый визит не создавался
+            return response
+
+    form = VisitForm(data, client=client)
+
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    visit = form.save(commit=False)
+    visit.client = client
+
+    try:
+        visit = save_booking(visit, key)
+    except ValidationError:
+        return JsonResponse({'error': SLOT_TAKEN_MESSAGE}, status=409)
+    except OperationalError:
+        return JsonResponse({'error': BOOKING_BUSY_MESSAGE}, status=503)
+
+    return JsonResponse({'visit': visit_json(visit)}, status=201)
+
+
+# id переносимого визита клиента из параметра visit или None. Переносимый визит не мешает сам себе,
+# чужой визит так исключить нельзя
+def own_visit_id(request, params):
+    visit_id = params.get('visit')
+
+    if not (visit_id and visit_id.isdigit()):
+        return None
+
+    return Visit.objects.filter(id=visit_id, client=request.user.client).values_list('id', flat=True).first()
+
+
 # Функция для получения доступных временных слотов. Доступна только для клиентов.
 @user_passes_test(is_client)
 def get_available_time(request):
@@ -329,12 +509,15 @@ def get_available_time(request):
 
     if employee_id and service_id and date_id:
         employee = Employee.objects.get(id=employee_id)  # Получаем сотрудника
-        hall = employee.service_halls.filter(service_id=service_id).first().hall  # Получаем зал
-
         service = Service.objects.get(id=service_id)  # Получаем услугу
+        hall = resolve_hall(employee, service)  # Получаем зал
+
         date = datetime.strptime(date_id, '%Y-%m-%d').date()  # Получаем дату
 
-        available_time = get_time_slots(hall, service, date)  # Получаем список доступных временных слотов
+        # Получаем список доступных временных слотов (время, удержанное самим клиентом, остаётся свободным)
+        available_time = get_available_slots(hall, employee, service, date,
+                                             exclude_visit_id=own_visit_id(request, request.GET),
+                                             exclude_client_id=request.user.client.id)
 
         # Возвращаем данные в формате JSON
         return JsonResponse({
@@ -344,44 +527,148 @@ def get_available_time(request):
     return JsonResponse({'available_time': []})
 
 
+# Функция для получения свободного времени на всё окно записи (сегодня + 7 дней) одним запросом.
+# Время передаётся компактно - минутами от начала суток. Доступна только для клиентов.
+@user_passes_test(is_client)
+def get_available_week(request):
+    employee_id = request.GET.get('employee')  # id сотрудника
+    service_id = request.GET.get('service')  # id услуги
+
+    if employee_id and service_id:
+        employee = Employee.objects.get(id=employee_id)  # Получаем сотрудника
+        service = Service.objects.get(id=service_id)  # Получаем услугу
+        hall = resolve_hall(employee, service)  # Получаем зал
+
+        # Удержание клиента и его переносимый визит (параметр visit) ему не мешают
+        week = get_week_slots(hall, employee, service, datetime.today().date(),
+                              exclude_visit_id=own_visit_id(request, request.GET),
+                              exclude_client_id=request.user.client.id)
+
+        # Возвращаем данные в формате JSON: {дата: [минуты от начала суток]}
+        return JsonResponse({
+            'available_week': {date.strftime('%Y-%m-%d'): slots for date, slots in week.items()},
+        })
+
+    return JsonResponse({'available_week': {}})
+
+
+# Функция для удержания выбранного времени, пока клиент оформляет запись (POST: employee, service, date, time,
+# при переносе - visit). Удержанное время не предлагается другим клиентам SLOT_HOLD_MINUTES минут.
+# Доступна только для клиентов.
+@user_passes_test(is_client)
+def hold_slot(request):
+    if request.method != 'POST':
+        return JsonResponse({'held': False}, status=400)
+
+    # Неизвестный сотрудник или услуга, дата вне окна записи, время не в формате HH:MM - ошибка запроса
+    form = SlotHoldForm(request.POST)
+
+    if not form.is_valid():
+        return JsonResponse({'held': False, 'errors': form.errors.get_json_data()}, status=400)
+
+    data = form.cleaned_data
+
+    try:
+        hold = place_hold(request.user.client, data['employee'], data['service'], data['date'], data['time'],
+                          exclude_visit_id=own_visit_id(request, request.POST))
+    except ValidationError:
+        # Время уже заняли: клиенту нужно выбрать другое
+        return JsonResponse({'held': False, 'error': SLOT_TAKEN_MESSAGE}, status=409)
+    except OperationalError:
+        return JsonResponse({'held': False, 'error': BOOKING_BUSY_MESSAGE}, status=503)
+
+    return JsonResponse({'held': True, 'expires_at': hold.expires_at.isoformat()})
+
+
+# Функция для поиска ближайшего свободного времени у любого мастера, оказывающего услугу.
+# Необязательные параметры: date_from, date_to (YYYY-MM-DD) и limit. Доступна только для клиентов.
+@user_passes_test(is_client)
+def get_earliest_slots(request):
+    service_id = request.GET.get('service')  # id услуги
+    date_from = request.GET.get('date_from')  # Начало периода поиска
+    date_to = request.GET.get('date_to')  # Конец периода поиска
+
+    if service_id:
+        service = Service.objects.get(id=service_id)  # Получаем услугу
+
+        today = datetime.today().date()
+        date_from = max(datetime.strptime(date_from, '%Y-%m-%d').date(), today) if date_from else today
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+
+        # Сколько вариантов вернуть: нечисловое значение - по умолчанию, границы проверяет find_earliest_slots
+        limit = request.GET.get('limit', '5')
+        limit = int(limit) if limit.lstrip('-').isdigit() else 5
+
+        earliest = find_earliest_slots(service, date_from, date_to, limit)
+
+        # Возвращаем данные в формате JSON
+        return JsonResponse({
+            'earliest_slots': [{
+                'employee': employee.id,
+                'employee_name': str(employee),
+                'hall': hall.id,
+                'hall_name': hall.name,
+                'date': date.strftime('%Y-%m-%d'),
+                'time': time,
+            } for employee, hall, date, time in earliest],
+        })
+
+    return JsonResponse({'earliest_slots': []})
+
+
+# Функция для получения матрицы доступности всех мастеров услуги на дату (мастер x время) одним запросом.
+# Доступна только для клиентов.
+@user_passes_test(is_client)
+def get_service_matrix(request):
+    service_id = request.GET.get('service')  # id услуги
+    date_id = request.GET.get('date')  # id даты
+
+    if service_id and date_id:
+        service = Service.objects.get(id=service_id)  # Получаем услугу
+        date = datetime.strptime(date_id, '%Y-%m-%d').date()  # Получаем дату
+
+        times, rows = get_availability_matrix(service, date)
+
+        # Возвращаем данные в формате JSON: общая сетка времени и строка 0/1 для каждого мастера
+        return JsonResponse({
+            'times': times,
+            'employees': [{
+                'employee': employee.id,
+                'employee_name': str(employee),
+                'hall': hall.id,
+                'hall_name': hall.name,
+                'available': [int(free) for free in available],
+            } for employee, hall, available in rows],
+        })
+
+    return JsonResponse({'times': [], 'employees': []})
+
+
 # Страница подтверждения визита. Доступна только для авторизованных пользователей.
 @login_required
 def visit_confirmation(request):
     return render(request, 'show/visit_confirmation.html')
 
 
-# Страница отображения всех визитов. Доступна только для сотрудников.
-@user_passes_test(is_employee)
-def visit_show_employee(request):
-    employee = request.user.employee  # Получаем сотрудника
+# Порядок списков визитов: сначала новые. Курсор страниц - (date, time, id), индексы (сотрудник / клиент,
+# date, time) и (date, time) читаются в обратном направлении
+VISIT_LIST_ORDERING = ('-date', '-time', '-id')
 
-    visits = Visit.objects.filter(employee=employee)  # Фильтруем визиты по сотруднику
-
-    # Создаем DataFrame для отображения визитов
-    data_visit = {
-        'Имя и фамилия клиента': [visit.client for visit in visits],
-        'Номер телефона клиента': [visit.client.phone_number for visit in visits],
-        'Название услуги': [visit.service.name for visit in visits],
-        'Дата и время начала': [f'{visit.date.strftime('%d %B %Y')} {visit.time}' for visit in visits],
-        'Время работы мастера (час)': [visit.service.duration.strftime('%H:%M') for visit in visits],
-        'Зал': [visit.hall for visit in visits],
-        'Цена (рубли)': [visit.service.price for visit in visits],
-        'Статус': [visit.status for visit in visits],
-    }
 
-    df_data_visit = pd.DataFrame(data_visit)
+# Визиты со связанными клиентом, сотрудником, услугой и залом одним запросом
+def visits_with_related():
+    return Visit.objects.select_related('client__user', 'employee__user', 'service', 'hall')
 
-    if df_data_visit.empty:
-        html_df_data_visit = None  # Если датафрейм пустой
-    else:
 
-        # Переводим DataFrame в HTML
-        html_df_data_visit = df_data_visit.to_html(classes=["table-bordered", "table-striped", "table-hover"],
-                                                   index=False)
+# Страница отображения всех визитов. Доступна только для сотрудников.
+@user_passes_test(is_employee)
+def visit_show_employee(request):
+    employee = request.user.employee  # Получаем сотрудника
 
-    update_status_visits()  # Обновляем статусы
+    # Фильтруем визиты по сотруднику, страница по курсору (date, time, id) от новых к старым
+    page = keyset_paginate(request, visits_with_related().filter(employee=employee), VISIT_LIST_ORDERING)
 
-    return render(request, 'show/visit_show_employee.html', {'html_df_data_visit': html_df_data_visit})
+    return render(request, 'show/visit_show_employee.html', {'page': page})
 
 
 # Страница отображения всех визитов. Доступна только для клиентов.
@@ -389,72 +676,96 @@ def visit_show_employee(request):
 def visit_show_client(request):
     client = request.user.client  # Получаем клиента
 
-    visits = Visit.objects.filter(client=client)  # Фильтруем визиты по клиенту
-    # Создаем DataFrame для отображения визитов
-    data_visit = {
-        'Имя и фамилия мастера': [visit.employee for visit in visits],
-        'Номер телефона мастера': [visit.employee.phone_number for visit in visits],
-        'Название услуги': [visit.service for visit in visits],
-        'Дата и время начала': [f'{visit.date.strftime('%d %B %Y')} {visit.time}' for visit in visits],
-        'Время работы мастера (час)': [visit.service.duration.strftime('%H:%M') for visit in visits],
-        'Зал': [visit.hall for visit in visits],
-        'Цена (час)': [visit.service.price for visit in visits],
-        'Статус': [visit.status for visit in visits],
-    }
+    # Фильтруем визиты по клиенту, страница по курсору (date, time, id) от новых к старым
+    page = keyset_paginate(request, visits_with_related().filter(client=client), VISIT_LIST_ORDERING)
 
-    df_data_visit = pd.DataFrame(data_visit)
-
-    if df_data_visit.empty:
-        html_df_data_visit = None  # Если датафрейм пустой
-    else:
-
-        # Переводим DataFrame в HTML
-        html_df_data_visit = df_data_visit.to_html(
-            classes=["table-bordered", "table-striped", "table-hover", "table-responsive", "w-100"], index=False)
-
-    flag = any(visit.status == 'Запланирована' for visit in visits)
+    flag = any(visit.is_planned for visit in page['objects'])
 
     context = {
-        'html_df_data_visit': html_df_data_visit,
-        'visits': visits,
+        'page': page,
+        'visits': page['objects'],
         'status_flag': flag
     }
 
-    update_status_visits()  # Обновляем статусы
-
     return render(request, 'show/visit_show_client.html', context)
 
 
 # Страница отображения всех визитов. Доступна только для администраторов.
 @staff_member_required
 def visit_show_admin(request):
-    visits = Visit.objects.all()  # Получаем все визиты
-
-    data_visit = {
-        'Имя и фамилия клиента': [visit.client for visit in visits],
-        'Номер телефона клиента': [visit.client.phone_number for visit in visits],
-        'Имя и фамилия мастера': [f"{visit.employee}" for visit in visits],
-        'Номер телефона мастера': [visit.employee.phone_number for visit in visits],
-        'Название услуги': [visit.service for visit in visits],
-        'Дата и время начала': [f'{visit.date.strftime('%d %B %Y')} {visit.time}' for visit in visits],
-        'Время работы мастера (час)': [visit.service.duration.strftime('%H:%M') for visit in visits],
-        'Зал': [visit.hall for visit in visits],
-        'Цена (час)': [visit.service.price for visit in visits],
-        'Статус': [visit.status for visit in visits],
-    }
+    # Страница всех визитов по курсору (date, time, id) от новых к старым
+    page = keyset_paginate(request, visits_with_related(), VISIT_LIST_ORDERING)
+
+    return render(request, 'show/visit_show_admin.html', {'page': page, 'export_form': VisitExportForm()})
 
-    df_data_visit = pd.DataFrame(data_visit)
 
-    if df_data_visit.empty:
-        html_df_data_visit = None  # Если датафрейм пустой
+# Выгрузка визитов в CSV или XLSX с фильтрами. Доступна только для администраторов.
+# CSV отдаётся потоком по мере чтения из базы, XLSX - готовым файлом (нужен пакет XlsxWriter)
+@staff_member_required
+def visit_export_admin(request):
+    form = VisitExportForm(request.GET)
+
+    if not form.is_valid():
+        return HttpResponseBadRequest('Неверные параметры выгрузки')
+
+    visits = export_queryset(form.cleaned_data)
+    filename = f'visits_{datetime.now():%Y%m%d_%H%M}'
+
+    if form.cleaned_data['format'] == 'xlsx':
+        try:
+            output = write_xlsx(visits)
+        except ImportError:
+            return HttpResponseBadRequest('Выгрузка в XLSX недоступна: не установлен пакет XlsxWriter')
+
+        return FileResponse(output, as_attachment=True, filename=f'{filename}.xlsx')
+
+    response = StreamingHttpResponse(stream_csv(visits), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+
+    return response
+
+
+# Отчёт по выручке и загрузке за месяц или год. Доступен только для администраторов.
+# Читает только дневные итоги (DailyRollup), поэтому не зависит от числа визитов
+@staff_member_required
+def report_admin(request):
+    today = datetime.today()
+    form = RollupReportForm(request.GET or {'year': today.year, 'month': today.month})
+
+    if not form.is_valid():
+        return render(request, 'show/report_admin.html', {'form': form})
+
+    year, month = form.cleaned_data['year'], form.cleaned_data['month']
+
+    rollups = DailyRollup.objects.filter(date__year=year)
+
+    if month:
+        rollups = rollups.filter(date__month=month)
+        series = rollups.values(period=F('date'))  # По дням месяца
     else:
-        # Переводим DataFrame в HTML
-        html_df_data_visit = df_data_visit.to_html(classes=["table-bordered", "table-striped", "table-hover"],
-                                                   index=False)
+        series = rollups.annotate(period=TruncMonth('date')).values('period')  # По месяцам года
+
+    totals = {
+        'visits': Sum('visit_count'),
+        'done': Sum('done_count'),
+        'minutes': Sum('booked_minutes'),
+        'revenue': Sum('revenue'),
+        'done_revenue': Sum('done_revenue'),
+    }
 
-    update_status_visits()  # Обновляем статусы
+    context = {
+        'form': form,
+        'totals': rollups.aggregate(**totals),
+        'series': series.annotate(**totals).order_by('period'),
+        # Группировка по id, имена добавляются к строкам: тёзки и одноимённые залы и услуги не сливаются
+        'by_hall': rollups.values('hall_id').annotate(name=F('hall__name'), **totals).order_by('-revenue'),
+        'by_employee': rollups.values('employee_id').annotate(first_name=F('employee__user__first_name'),
+                                                              last_name=F('employee__user__last_name'),
+                                                              **totals).order_by('-revenue'),
+        'by_service': rollups.values('service_id').annotate(name=F('service__name'), **totals).order_by('-revenue'),
+    }
 
-    return render(request, 'show/visit_show_admin.html', {'html_df_data_visit': html_df_data_visit})
+    return render(request, 'show/report_admin.html', context)
 
 
 #  Страница обновления визита. Доступна только для клиентов.
@@ -473,6 +784,8 @@ def visit_update_client(request, visit_id):
         except ValidationError as e:
             # Если возникла ошибка валидации (например, переполнен зал), выводим сообщение об ошибке
             messages.error(request, e)
+        except OperationalError:
+            messages.error(request, BOOKING_BUSY_MESSAGE)
 
     else:
         form = VisitForm(instance=visit)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -57,18 +58,27 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'volgtekproject.urls'
 
+# Шаблоны ищутся в DIRS и в каталогах templates приложений. Без DEBUG загрузчики обёрнуты кэширующим:
+# каждый шаблон читается и компилируется один раз за жизнь процесса; при разработке шаблоны перечитываются
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'volgtekapp.context_processors.fragments',
             ],
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
         },
     },
 ]
@@ -83,10 +93,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL: чтение не блокируется записью; IMMEDIATE: транзакция сразу берёт блокировку записи,
+        # одновременные записи ждут её до timeout секунд вместо ошибки посреди транзакции
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Общий для всех воркеров файловый кэш: в нём хранятся рассчитанные свободные слоты (их версии - в базе,
+# модель SlotCacheVersion), поэтому инвалидация из одного процесса видна остальным. Файловый кэш при
+# переполнении удаляет часть ключей, поэтому MAX_ENTRIES с запасом: слоты всех мастеров на окно записи,
+# и версия фрагментов не вытесняется. В продакшене можно заменить на memcached.
+
+# Отрисованные фрагменты шаблонов (карточки сотрудников, меню) хранятся в памяти процесса: их версия лежит
+# в общем кэше default и входит в ключ, поэтому устаревший фрагмент не найдётся ни в одном воркере.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'volgtekproject_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'volgtekproject_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60  # Время жизни фрагмента шаблона в секундах
+
+
+# Шаг сетки начала записи в минутах для залов без своей настройки (None - длительность услуги)
+
+SLOT_STEP_MINUTES = None
+
+# Сколько минут выбранное клиентом время удерживается за ним до отправки формы записи
+
+SLOT_HOLD_MINUTES = 5
+
+# Сколько минут повторная отправка записи с тем же ключом идемпотентности возвращает уже созданный визит
+
+IDEMPOTENCY_KEY_MINUTES = 60
+
+
+# Пользователь загружается вместе с профилями клиента и сотрудника (см. volgtekapp/backends.py)
+AUTHENTICATION_BACKENDS = [
+    'volgtekapp.backends.RoleModelBackend',
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 